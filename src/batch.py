@@ -0,0 +1,203 @@
+from shell import add_engine_arguments, make_interpreter, run_command, iter_commands
+from optimizer import Inliner
+from typechecker import TypeChecker
+from governor import LimitExceeded
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from collections import deque
+import argparse
+import io
+import json
+import os
+import signal
+import sys
+import time
+
+#Number of jobs waiting in the pool per worker. Jobs are read as results come back, so a large
+# batch is never loaded into memory at once.
+JOBS_PER_WORKER = 4
+
+
+#Raised in a worker when a job runs out of time.
+#It derives from BaseException so that the per-command error handling (except Exception) does not catch it.
+class JobTimeout(BaseException):
+    pass
+
+
+#State of a worker process: one interpreter for all the jobs it runs, created by init_worker.
+worker_interpreter = None
+worker_timeout = None
+timer_active = False
+
+
+def init_worker(args):
+    global worker_interpreter, worker_timeout
+    worker_interpreter = make_interpreter(args)
+    worker_timeout = args.timeout
+    if worker_timeout:
+        signal.signal(signal.SIGALRM, on_timeout)
+
+
+def on_timeout(signum, frame):
+    if timer_active:
+        raise JobTimeout()
+
+
+#Forgets everything the previous job defined, so jobs cannot see each other's functions.
+#The global environment is cleared in place because compiled code may hold on to it.
+def reset_interpreter(interpreter):
+    interpreter.global_env.clear()
+    if getattr(interpreter, 'memoizer', None) is not None:
+        interpreter.memoizer.clear()
+    if interpreter.inliner is not None:
+        interpreter.inliner = Inliner(interpreter)
+    if interpreter.typechecker is not None:
+        interpreter.typechecker = TypeChecker()
+
+
+#Runs one job (a whole program) in the worker and returns its result record.
+#Every command gets a 'result' or an 'error'; a job that runs out of time stops with status 'timeout'.
+#A command stopped by a resource limit (--fuel, --time-limit, ...) also gets the 'limit' and the 'usage' counters.
+def run_job(job):
+    global timer_active
+    index, name, source = job
+    interpreter = worker_interpreter
+    reset_interpreter(interpreter)
+    results = []
+    status = 'ok'
+    start = time.perf_counter()
+    try:
+        if worker_timeout:
+            timer_active = True
+            signal.setitimer(signal.ITIMER_REAL, worker_timeout)
+        for command in iter_commands(io.StringIO(source)):
+            try:
+                results.append({'command': command, 'result': str(run_command(interpreter, command))})
+            except LimitExceeded as e:
+                results.append({'command': command, 'error': str(e), 'limit': e.limit, 'usage': e.usage})
+            except Exception as e:
+                results.append({'command': command, 'error': str(e)})
+    except JobTimeout:
+        status = 'timeout'
+    finally:
+        # clear the flag first, so an alarm that fires now is ignored
+        timer_active = False
+        if worker_timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return {'job': index, 'name': name, 'status': status, 'elapsed': time.perf_counter() - start, 'results': results}
+
+
+#Returns the record of a job that could not be read, with status 'error' and no results.
+def error_record(index, name, error):
+    return {'job': index, 'name': name, 'status': 'error', 'elapsed': 0.0, 'results': [], 'error': error}
+
+
+#Yields the jobs (index, name, source, error) of a batch: one per program file, then one per line of each
+# JSONL file. A JSONL line is either a string holding the source or an object with a 'source' and an optional 'id'.
+#Inputs that cannot be read (a missing file, a line that is not JSON, an object without a 'source') are jobs
+# too, with the source None and the error as text, so the rest of the batch still runs.
+def read_jobs(filenames, jsonl_filenames):
+    index = 0
+    for filename in filenames:
+        try:
+            with open(filename, 'r') as file:
+                source = file.read()
+        except (OSError, UnicodeDecodeError) as e:
+            yield index, filename, None, str(e)
+        else:
+            yield index, filename, source, None
+        index += 1
+    for filename in jsonl_filenames:
+        try:
+            with open(filename, 'r') as file:
+                for line_number, line in enumerate(file, 1):
+                    if not line.strip():
+                        continue
+                    yield (index, *read_jsonl_job(f'{filename}:{line_number}', line))
+                    index += 1
+        except (OSError, UnicodeDecodeError) as e:
+            yield index, filename, None, str(e)
+            index += 1
+
+
+#Returns the name, source and error of the job on one line of a JSONL file, named after its place by default.
+def read_jsonl_job(name, line):
+    try:
+        job = json.loads(line)
+    except ValueError as e:
+        return name, None, f'invalid JSON: {e}'
+    if isinstance(job, str):
+        return name, job, None
+    if not isinstance(job, dict):
+        return name, None, 'a job must be a string or an object with a "source"'
+    name = str(job.get('id', name))
+    if not isinstance(job.get('source'), str):
+        return name, None, 'a job object needs a "source" string'
+    return name, job['source'], None
+
+
+#Runs the jobs on a pool of worker processes and yields their result records.
+#With ordered, results come back in the order of the jobs; otherwise as soon as they complete.
+def run_batch(jobs, args, workers=None, ordered=True):
+    workers = workers or os.cpu_count() or 1
+    window = workers * JOBS_PER_WORKER
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(args,)) as executor:
+        pending = deque() if ordered else set()
+        for index, name, source, error in jobs:
+            if error is None:
+                future = executor.submit(run_job, (index, name, source))
+            else:
+                # a job that could not be read gets its record at once, in its place among the others
+                future = Future()
+                future.set_result(error_record(index, name, error))
+            if ordered:
+                pending.append(future)
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            else:
+                pending.add(future)
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+        if ordered:
+            while pending:
+                yield pending.popleft().result()
+        else:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+
+#This is the entry point of the batch runner.
+#Results are written to standard output as JSON lines, a summary to standard error.
+def main():
+    arg_parser = argparse.ArgumentParser(description='Run many independent Functastic programs in parallel')
+    arg_parser.add_argument('filenames', nargs='*', help='program files, each one is a job')
+    arg_parser.add_argument('--jsonl', action='append', default=[], metavar='FILE', help='JSON lines file with one program per line')
+    arg_parser.add_argument('--workers', type=int, help='number of worker processes (default: number of CPUs)')
+    arg_parser.add_argument('--timeout', type=float, help='maximum seconds per job')
+    arg_parser.add_argument('--unordered', action='store_true', help='write results as jobs complete instead of in order')
+    add_engine_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    if not args.filenames and not args.jsonl:
+        arg_parser.error('no programs given')
+    if args.timeout and not hasattr(signal, 'setitimer'):
+        arg_parser.error('--timeout is not supported on this platform')
+    try:
+        make_interpreter(args)
+    except Exception as e:
+        arg_parser.error(str(e))
+
+    start = time.perf_counter()
+    counts = {}
+    for record in run_batch(read_jobs(args.filenames, args.jsonl), args, args.workers, not args.unordered):
+        counts[record['status']] = counts.get(record['status'], 0) + 1
+        print(json.dumps(record), flush=True)
+    summary = ', '.join(f'{count} {status}' for status, count in counts.items())
+    print(f"{sum(counts.values())} jobs ({summary}) in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
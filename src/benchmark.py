@@ -0,0 +1,361 @@
+from lexer import Lexer
+from parser import Parser
+from resolver import Resolver
+from flat import FlatEncoder
+from shell import ENGINES, run_command
+from optimizer import Optimizer, Inliner
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+#Default number of binary operators in the generated expressions.
+DEFAULT_OPERATORS = 100000
+
+#Default number of function definitions in the generated program of the memory benchmark.
+DEFAULT_FUNCTIONS = 5000
+
+#Default number of times each measurement is repeated (the best time is reported).
+DEFAULT_REPEAT = 5
+
+#Default slowdown (as a fraction) above which a comparison with earlier results reports a regression.
+DEFAULT_TOLERANCE = 0.10
+
+#Stages faster than this (in seconds) are too noisy to be compared with earlier results.
+MIN_COMPARED_TIME = 0.005
+
+#Bump when the format of the JSON results changes.
+RESULTS_FORMAT = 1
+
+OPERATORS = ['+', '-', '*', '/', '%', '==', '!=', '<', '>', '<=', '>=', '&&', '||']
+
+
+#Generates an expression with the given number of binary operators, mixing all precedence levels,
+# parenthesized groups, prefix operators and function calls. The same seed gives the same expression.
+def generate_expression(operators, seed=0):
+    rng = random.Random(seed)
+    parts = [str(rng.randint(0, 999))]
+    for _ in range(operators):
+        parts.append(rng.choice(OPERATORS))
+        r = rng.random()
+        if r < 0.4:
+            parts.append(str(rng.randint(0, 999)))
+        elif r < 0.7:
+            parts.append(rng.choice(['x', 'y', 'count', 'total']))
+        elif r < 0.8:
+            parts.append(f'(x {rng.choice(OPERATORS)} {rng.randint(1, 9)})')
+        elif r < 0.9:
+            parts.append(f'-{rng.randint(0, 99)}')
+        else:
+            parts.append(f'f(x, {rng.randint(0, 9)})')
+    return ' '.join(parts)
+
+
+#Generates a chain of additions: 1 + 1 + ... + 1.
+def generate_chain(operators):
+    return ' + '.join(['1'] * (operators + 1))
+
+
+#Generates a program of function definitions with the given number of commands, each with a body of
+# about 20 operators using the parameters, let and if.
+def generate_program(functions, seed=0):
+    rng = random.Random(seed)
+    commands = []
+    for number in range(functions):
+        body = generate_expression(10, rng.random()).replace('count', 'a').replace('total', 'b')
+        commands.append(f'function f{number}(x, y) => let a => x * 2 in let b => y + a in '
+                        f'if a > b then {body} else f{number}(x - 1, y)')
+    return commands
+
+
+#Generates an arithmetic expression with about the given number of operators that can be evaluated:
+# parenthesized groups of 16 small numbers joined by +, - and *, added together.
+def generate_arithmetic(operators, seed=0):
+    rng = random.Random(seed)
+    groups = []
+    for _ in range(max(1, operators // 16)):
+        parts = [str(rng.randint(1, 9))]
+        for _ in range(15):
+            parts.append(rng.choice(['+', '-', '*']))
+            parts.append(str(rng.randint(1, 9)))
+        groups.append('(' + ' '.join(parts) + ')')
+    return ' + '.join(groups)
+
+
+#Generates a function whose body is a chain of lets, each variable computed from the previous one.
+def generate_let_chain(length):
+    lets = ['let a0 => n in']
+    for number in range(1, length):
+        lets.append(f'let a{number} => a{number - 1} + {number} * 2 in')
+    return f"function chain(n) => {' '.join(lets)} a{length - 1}"
+
+
+#The workloads of the benchmark suite: name -> (setup commands, measured command, whether it is interpreted).
+#The setup commands define the functions the measured command uses; only the measured command is timed.
+#Sizes are kept small enough for every engine to run them within Python's default recursion limit.
+#The generated expressions use undefined variables, so they are only lexed and parsed.
+def workloads(operators=DEFAULT_OPERATORS):
+    return {
+        'fib': (['function fib(n) => if n <= 1 then n else fib(n - 1) + fib(n - 2)'],
+                'fib(20)', True),
+        'fact': (['function fact(n) => if n <= 1 then 1 else n * fact(n - 1)',
+                  'function facts(k, acc) => if k == 0 then acc else facts(k - 1, acc + fact(80) % k)'],
+                 'facts(300, 0)', True),
+        'gcd': (['function gcd(a, b) => if b == 0 then a else gcd(b, a % b)',
+                 'function gcds(k, acc) => if k == 0 then acc else gcds(k - 1, acc + gcd(k * 7919, 104729 + k))'],
+                'gcds(3000, 0)', True),
+        'let_chain': ([generate_let_chain(100),
+                       'function chains(k, acc) => if k == 0 then acc else chains(k - 1, acc + chain(k))'],
+                      'chains(500, 0)', True),
+        'lambdas': (['function apply(n) => (lambda x => (lambda y => (lambda z => z * 2 + y)(y - x))(x + 1))(n)',
+                     'function applies(k, acc) => if k == 0 then acc else applies(k - 1, acc + apply(k))'],
+                    'applies(5000, 0)', True),
+        'arithmetic': ([], generate_arithmetic(operators // 50), True),
+        'expression': ([], generate_expression(operators), False),
+        'chain': ([], generate_chain(operators), False),
+    }
+
+
+#Runs function repeat times and returns the best time in seconds.
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+#Like best_time, but calls prepare before each run (untimed) and passes what it returns to function.
+def best_prepared_time(prepare, function, repeat):
+    best = None
+    for _ in range(repeat):
+        state = prepare()
+        start = time.perf_counter()
+        function(state)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+#Returns the result of function and the memory it allocated that is still in use, in bytes.
+def allocated(function):
+    tracemalloc.start()
+    try:
+        result = function()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+#Returns the most memory allocated at any time while function ran, in bytes.
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+#Creates the interpreter of an engine mode: an engine name, optionally followed by +optimize and/or +inline
+# (for example closure+optimize).
+def make_mode(mode):
+    name, *options = mode.split('+')
+    if name not in ENGINES:
+        raise Exception(f"Unknown engine '{name}', choose one of: {', '.join(ENGINES)}")
+    interpreter = ENGINES[name]()
+    for option in options:
+        if option == 'optimize':
+            interpreter.optimizer = Optimizer()
+        elif option == 'inline':
+            interpreter.inliner = Inliner(interpreter)
+        else:
+            raise Exception(f"Unknown option '{option}' in mode '{mode}'")
+    return interpreter
+
+
+#Returns an interpreter of the mode that ran the setup commands, and the tree of the measured command
+# ready to be interpreted (optimized and inlined if the mode says so).
+def prepare_command(mode, setup, text):
+    interpreter = make_mode(mode)
+    for command in setup:
+        run_command(interpreter, command)
+    tree = Parser(Lexer(text)).parse()
+    if interpreter.optimizer is not None:
+        tree = interpreter.optimizer.optimize(tree)
+    if interpreter.inliner is not None:
+        tree = interpreter.inliner.inline(tree)
+    return interpreter, tree
+
+
+#Measures one workload in one engine mode and returns its results.
+#Each stage is timed on its own: the lexer (Lexer.tokenize), the parser (Parser.parse, on tokens made
+# beforehand) and the interpreter (interpret, on a parsed tree, after the setup commands ran).
+#The peak memory is the most memory allocated at any time while the command is lexed, parsed and interpreted.
+def run_workload(name, setup, text, interpreted, mode, repeat=DEFAULT_REPEAT):
+    token_count = len(Lexer(text).tokenize())
+    lex_time = best_time(lambda: Lexer(text).tokenize(), repeat)
+    parse_time = best_prepared_time(lambda: Parser(Lexer(text)), lambda parser: parser.parse(), repeat)
+    interpret_time = None
+    if interpreted:
+        interpret_time = best_prepared_time(lambda: prepare_command(mode, setup, text),
+                                            lambda prepared: prepared[0].interpret(prepared[1]), repeat)
+
+    def pipeline():
+        interpreter, tree = prepare_command(mode, setup, text)
+        if interpreted:
+            interpreter.interpret(tree)
+
+    return {'workload': name, 'mode': mode, 'characters': len(text), 'tokens': token_count,
+            'lex': lex_time, 'parse': parse_time, 'interpret': interpret_time,
+            'lex_throughput': token_count / lex_time, 'parse_throughput': token_count / parse_time,
+            'peak_memory': peak_memory(pipeline)}
+
+
+#Runs the benchmark suite (or the named workloads) in every engine mode and returns the results.
+#The lexer and parser do not depend on the mode, so workloads that are not interpreted run in the first mode only.
+def run_suite(modes, names=None, operators=DEFAULT_OPERATORS, repeat=DEFAULT_REPEAT):
+    results = []
+    for name, (setup, text, interpreted) in workloads(operators).items():
+        if names and name not in names:
+            continue
+        for mode in modes if interpreted else modes[:1]:
+            results.append(run_workload(name, setup, text, interpreted, mode, repeat))
+    return results
+
+
+#Prints the results as a table. With several modes, the interpreter of each mode is also compared with the
+# first mode (2.00x means twice as fast).
+def print_results(results):
+    first = {}
+    print(f"{'workload':<12} {'mode':<18} {'tokens':>8} {'lex':>9} {'parse':>9} {'interpret':>10} "
+          f"{'parse tokens/s':>15} {'peak KB':>9}")
+    for result in results:
+        interpret = result['interpret']
+        line = (f"{result['workload']:<12} {result['mode']:<18} {result['tokens']:>8} {result['lex']:>8.4f}s "
+                f"{result['parse']:>8.4f}s " + (f"{interpret:>9.4f}s" if interpret is not None else f"{'-':>10}") +
+                f" {result['parse_throughput']:>15,.0f} {result['peak_memory'] / 1024:>9,.0f}")
+        if interpret is not None:
+            reference = first.setdefault(result['workload'], result)
+            if reference is not result:
+                line += f"  {reference['interpret'] / interpret:.2f}x"
+        print(line)
+
+
+#Returns the git revision of the interpreter, or None if it is not known.
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+#Writes the results to a JSON file, with the revision and environment they were measured in.
+def save_results(filename, results, repeat):
+    data = {
+        'format': RESULTS_FORMAT,
+        'revision': git_revision(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': results,
+    }
+    with open(filename, 'w') as file:
+        json.dump(data, file, indent=2)
+
+
+#Compares the results with those of an earlier run (a file written by save_results) and prints every stage
+# relative to it. A stage that got slower (or a peak memory that grew) by more than tolerance is a regression.
+#Stages that take less than MIN_COMPARED_TIME are skipped. Returns the number of regressions.
+def compare_results(filename, results, tolerance=DEFAULT_TOLERANCE):
+    with open(filename, 'r') as file:
+        data = json.load(file)
+    if data.get('format') != RESULTS_FORMAT:
+        raise Exception(f'{filename} has results in an unknown format')
+    earlier = {(result['workload'], result['mode']): result for result in data['results']}
+    print(f"\ncompared with {filename} (revision {data.get('revision')}, {data.get('date')}):")
+    regressions = 0
+    for result in results:
+        old = earlier.get((result['workload'], result['mode']))
+        if old is None:
+            continue
+        for stage in ('lex', 'parse', 'interpret', 'peak_memory'):
+            if result[stage] is None or not old.get(stage):
+                continue
+            if stage != 'peak_memory' and old[stage] < MIN_COMPARED_TIME:
+                continue
+            ratio = result[stage] / old[stage]
+            regression = ratio > 1 + tolerance
+            regressions += regression
+            print(f"  {result['workload']:<12} {result['mode']:<18} {stage:<11} {ratio:6.2f}x"
+                  + ('  REGRESSION' if regression else ''))
+    return regressions
+
+
+#Measures the memory used by the trees of a parsed program, with and without shared nodes, and by their
+# flat encoding.
+def memory_benchmark(functions=DEFAULT_FUNCTIONS):
+    commands = generate_program(functions)
+    trees, tree_size = allocated(lambda: [Parser(Lexer(command)).parse() for command in commands])
+    resolver = Resolver()
+    for tree in trees:
+        resolver.resolve(tree)
+    encoder = FlatEncoder()
+    flat_trees, flat_size = allocated(lambda: [encoder.encode(tree) for tree in trees])
+    nodes = sum(len(flat_tree) for flat_tree in flat_trees)
+    shared_trees, shared_size = allocated(lambda: [Parser(Lexer(command), share_nodes=True).parse() for command in commands])
+    print(f"memory: {functions} function definitions, {nodes} nodes")
+    print(f"  AST:               {tree_size / 1024:,.0f} KB ({tree_size / nodes:.0f} bytes/node)")
+    print(f"  AST, shared nodes: {shared_size / 1024:,.0f} KB ({shared_size / nodes:.0f} bytes/node)")
+    print(f"  flat trees:        {flat_size / 1024:,.0f} KB ({flat_size / nodes:.0f} bytes/node)")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Functastic benchmarks')
+    arg_parser.add_argument('--modes', nargs='+', default=['tree'], metavar='MODE',
+                            help='engine modes to run and compare, e.g. tree closure+optimize')
+    arg_parser.add_argument('--workloads', nargs='+', metavar='NAME', help='run only these workloads')
+    arg_parser.add_argument('--operators', type=int, default=DEFAULT_OPERATORS, help='binary operators per generated expression')
+    arg_parser.add_argument('--functions', type=int, default=DEFAULT_FUNCTIONS, help='function definitions in the memory benchmark')
+    arg_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='repetitions of each measurement')
+    arg_parser.add_argument('--output', metavar='FILE', help='write the results to a JSON file')
+    arg_parser.add_argument('--compare', metavar='FILE', help='compare with the results in a JSON file written by --output')
+    arg_parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='slowdown reported as a regression by --compare')
+    arg_parser.add_argument('--no-memory', action='store_true', help='skip the tree memory benchmark')
+    args = arg_parser.parse_args()
+
+    try:
+        for mode in args.modes:
+            make_mode(mode)
+    except Exception as e:
+        arg_parser.error(str(e))
+    unknown = set(args.workloads or ()) - set(workloads(0))
+    if unknown:
+        arg_parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+
+    results = run_suite(args.modes, args.workloads, args.operators, args.repeat)
+    print_results(results)
+    if args.output:
+        save_results(args.output, results, args.repeat)
+    regressions = compare_results(args.compare, results, args.tolerance) if args.compare else 0
+    if not args.no_memory:
+        print()
+        memory_benchmark(args.functions)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
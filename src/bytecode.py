@@ -0,0 +1,257 @@
+from array import array
+from parser import Lambda, Num, Boolean
+from interpreter import BINARY_OPERATORS, UNARY_OPERATORS
+from resolver import Resolver
+
+#Opcodes of the Functastic virtual machine.
+#Every instruction is two words long: the opcode and a single argument (0 when unused).
+LOAD_CONST = 0       #push consts[arg]
+LOAD_LOCAL = 1       #push the local slot arg of the current frame
+LOAD_DEREF = 2       #push a slot of an enclosing frame, arg packs (depth, slot)
+LOAD_GLOBAL = 3      #push global_env[names[arg]]
+LOAD_FUNCTION = 4    #push the global function to call, arg packs (name index, argument count)
+STORE_LOCAL = 5      #pop into the local slot arg
+BINARY_OP = 6        #pop two operands, push BINARY_FUNCTIONS[arg](left, right)
+UNARY_OP = 7         #pop one operand, push UNARY_FUNCTIONS[arg](operand)
+JUMP = 8             #continue at instruction offset arg
+JUMP_IF_FALSE = 9    #pop the condition, jump to arg if it is falsy
+CALL = 10            #call the function below the arg arguments on the stack
+RETURN = 11          #return the top of the stack to the caller
+MAKE_CLOSURE = 12    #push a lambda function for consts[arg] capturing the current frame
+MAKE_FUNCTION = 13   #define the global function consts[arg] capturing the current frame
+BINARY_OP_CONST = 14 #like BINARY_OP with the right operand consts[low], arg packs (operator, const index)
+TAIL_CALL = 15       #like CALL, but the callee replaces the current frame instead of returning to it
+
+OPCODE_NAMES = {
+    LOAD_CONST: 'LOAD_CONST',
+    LOAD_LOCAL: 'LOAD_LOCAL',
+    LOAD_DEREF: 'LOAD_DEREF',
+    LOAD_GLOBAL: 'LOAD_GLOBAL',
+    LOAD_FUNCTION: 'LOAD_FUNCTION',
+    STORE_LOCAL: 'STORE_LOCAL',
+    BINARY_OP: 'BINARY_OP',
+    UNARY_OP: 'UNARY_OP',
+    JUMP: 'JUMP',
+    JUMP_IF_FALSE: 'JUMP_IF_FALSE',
+    CALL: 'CALL',
+    RETURN: 'RETURN',
+    MAKE_CLOSURE: 'MAKE_CLOSURE',
+    MAKE_FUNCTION: 'MAKE_FUNCTION',
+    BINARY_OP_CONST: 'BINARY_OP_CONST',
+    TAIL_CALL: 'TAIL_CALL',
+}
+
+#Operators are referred to by their position in these lists.
+BINARY_OP_TYPES = list(BINARY_OPERATORS)
+BINARY_FUNCTIONS = [BINARY_OPERATORS[op_type] for op_type in BINARY_OP_TYPES]
+UNARY_OP_TYPES = list(UNARY_OPERATORS)
+UNARY_FUNCTIONS = [UNARY_OPERATORS[op_type] for op_type in UNARY_OP_TYPES]
+
+#Two values are packed into one argument word for LOAD_DEREF, LOAD_FUNCTION and BINARY_OP_CONST.
+PACK_BITS = 16
+PACK_MASK = (1 << PACK_BITS) - 1
+
+
+def pack(high, low):
+    if low > PACK_MASK:
+        raise Exception('Too many local variables or arguments')
+    return (high << PACK_BITS) | low
+
+
+def unpack(arg):
+    return arg >> PACK_BITS, arg & PACK_MASK
+
+
+#A compiled function body (or top-level command).
+#code is a flat array of (opcode, argument) words; consts and names are the pools the arguments index into.
+class CodeObject:
+    __slots__ = ('name', 'params', 'nlocals', 'code', 'consts', 'names', 'body')
+
+    def __init__(self, name, params, nlocals, code, consts, names, body):
+        self.name = name
+        self.params = params
+        self.nlocals = nlocals
+        self.code = code
+        self.consts = consts
+        self.names = names
+        self.body = body
+
+    def __str__(self):
+        return f"<code {self.name or 'lambda'}>"
+
+
+#Returns a readable listing of a code object and all code objects nested in its constant pool.
+def disassemble(code_object):
+    lines = [f"{code_object}: params={code_object.params} nlocals={code_object.nlocals}"]
+    code = code_object.code
+    nested = []
+    for offset in range(0, len(code), 2):
+        op, arg = code[offset], code[offset + 1]
+        if op in (LOAD_CONST, MAKE_CLOSURE, MAKE_FUNCTION):
+            detail = str(code_object.consts[arg])
+            if isinstance(code_object.consts[arg], CodeObject):
+                nested.append(code_object.consts[arg])
+        elif op in (LOAD_GLOBAL,):
+            detail = code_object.names[arg]
+        elif op == LOAD_DEREF:
+            detail = 'depth=%d slot=%d' % unpack(arg)
+        elif op == LOAD_FUNCTION:
+            name_index, arg_count = unpack(arg)
+            detail = f"{code_object.names[name_index]}/{arg_count}"
+        elif op == BINARY_OP:
+            detail = BINARY_OP_TYPES[arg].name
+        elif op == BINARY_OP_CONST:
+            op_index, const_index = unpack(arg)
+            detail = f"{BINARY_OP_TYPES[op_index].name} {code_object.consts[const_index]}"
+        elif op == UNARY_OP:
+            detail = UNARY_OP_TYPES[arg].name
+        else:
+            detail = str(arg)
+        lines.append(f"  {offset:4d} {OPCODE_NAMES[op]:<14} {detail}")
+    for inner in nested:
+        lines.append('')
+        lines.append(disassemble(inner))
+    return '\n'.join(lines)
+
+
+#Holds the state for the code object currently being compiled.
+class CodeBuilder:
+    def __init__(self, name, params, nlocals):
+        self.name = name
+        self.params = params
+        self.nlocals = nlocals
+        self.code = array('l')
+        self.consts = []
+        self.const_index = {}
+        self.names = []
+        self.name_index = {}
+
+    def emit(self, op, arg=0):
+        self.code.append(op)
+        self.code.append(arg)
+        return len(self.code) - 2
+
+    #Sets the argument of an already emitted jump.
+    def patch(self, offset, target):
+        self.code[offset + 1] = target
+
+    def offset(self):
+        return len(self.code)
+
+    #Constants are shared within a code object; the type is part of the key so True and 1 stay distinct.
+    def add_const(self, value):
+        key = (type(value), value) if not isinstance(value, CodeObject) else (CodeObject, id(value))
+        if key not in self.const_index:
+            self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_index[key]
+
+    def add_name(self, name):
+        if name not in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return self.name_index[name]
+
+    def build(self, body):
+        return CodeObject(self.name, self.params, self.nlocals, self.code, tuple(self.consts), tuple(self.names), body)
+
+
+#Compiles the AST produced by the parser into code objects for the virtual machine.
+#Variables use the addresses assigned by the resolver: parameters and let variables become local slots,
+# variables of enclosing functions become (depth, slot) references, everything else is looked up globally.
+class Compiler:
+
+    def __init__(self):
+        self.resolver = Resolver()
+
+    #Compiles a top-level tree into a code object that runs in its own frame.
+    def compile(self, tree):
+        nlocals = self.resolver.resolve(tree)
+        self.builder = CodeBuilder('<command>', [], nlocals)
+        self.visit(tree)
+        self.builder.emit(RETURN)
+        return self.builder.build(tree)
+
+    #Dispatches to the appropriate compile_* method based on the node type.
+    def visit(self, node):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.generic_compile)
+        return method(node)
+
+    #Raises an exception for unsupported node types.
+    def generic_compile(self, node):
+        raise Exception(f'No compile_{type(node).__name__} method')
+
+    #Compiles a function body into its own code object.
+    def compile_function(self, name, params, body, nlocals):
+        outer = self.builder
+        self.builder = CodeBuilder(name, params, nlocals)
+        try:
+            self.visit(body)
+            self.builder.emit(RETURN)
+            return self.builder.build(body)
+        finally:
+            self.builder = outer
+
+    def compile_Num(self, node):
+        self.builder.emit(LOAD_CONST, self.builder.add_const(node.value))
+
+    def compile_Boolean(self, node):
+        self.builder.emit(LOAD_CONST, self.builder.add_const(node.value))
+
+    #A literal right operand is folded into the operator instruction (n - 1, n <= 1, ...).
+    def compile_BinOp(self, node):
+        op_index = BINARY_OP_TYPES.index(node.op.type)
+        self.visit(node.left)
+        if isinstance(node.right, (Num, Boolean)):
+            self.builder.emit(BINARY_OP_CONST, pack(op_index, self.builder.add_const(node.right.value)))
+        else:
+            self.visit(node.right)
+            self.builder.emit(BINARY_OP, op_index)
+
+    def compile_UnaryOp(self, node):
+        self.visit(node.expr)
+        self.builder.emit(UNARY_OP, UNARY_OP_TYPES.index(node.op.type))
+
+    #Loads a local slot, a slot of an enclosing function, or a global name.
+    def compile_Identifier(self, node):
+        if node.depth is None:
+            self.builder.emit(LOAD_GLOBAL, self.builder.add_name(node.value))
+        elif node.depth == 0:
+            self.builder.emit(LOAD_LOCAL, node.slot)
+        else:
+            self.builder.emit(LOAD_DEREF, pack(node.depth, node.slot))
+
+    def compile_IfThenElse(self, node):
+        self.visit(node.condition)
+        jump_to_else = self.builder.emit(JUMP_IF_FALSE)
+        self.visit(node.then_body)
+        jump_to_end = self.builder.emit(JUMP)
+        self.builder.patch(jump_to_else, self.builder.offset())
+        self.visit(node.else_body)
+        self.builder.patch(jump_to_end, self.builder.offset())
+
+    def compile_LetIn(self, node):
+        self.visit(node.var_value)
+        self.builder.emit(STORE_LOCAL, node.slot)
+        self.visit(node.body)
+
+    def compile_FunctionDef(self, node):
+        code_object = self.compile_function(node.name, node.params, node.body, node.nlocals)
+        self.builder.emit(MAKE_FUNCTION, self.builder.add_const(code_object))
+
+    def compile_Lambda(self, node):
+        code_object = self.compile_function(None, node.params, node.body, node.nlocals)
+        self.builder.emit(MAKE_CLOSURE, self.builder.add_const(code_object))
+
+    #The callee is pushed before the arguments so that errors are reported in the same order as the tree-walker.
+    #Calls in tail position reuse the caller's place on the call stack.
+    def compile_FunctionCall(self, node):
+        if isinstance(node.name, Lambda):
+            self.compile_Lambda(node.name)
+        else:
+            name_index = self.builder.add_name(node.name)
+            self.builder.emit(LOAD_FUNCTION, pack(name_index, len(node.arguments)))
+        for arg in node.arguments:
+            self.visit(arg)
+        self.builder.emit(TAIL_CALL if node.tail else CALL, len(node.arguments))
@@ -0,0 +1,281 @@
+from lexer import TokenType
+from parser import Lambda, Num
+from interpreter import Interpreter, Function, Frame, TailCall, BINARY_OPERATORS, UNARY_OPERATORS
+from lists import find_builtin
+
+
+#Closures for the operators of type-checked trees (see typechecker.py), whose operands are known to be
+# integers or booleans: the operation is written in the closure instead of called through the operator module.
+#Each closure computes what the operator function would for any operands, so a stale annotation (a function
+# redefined with another type, see TypeChecker.recheck_dependents) is slower at worst. && and || have no
+# closure here: & and | would differ from them on integers.
+TYPED_BINARY = {
+    TokenType.PLUS: lambda left, right: lambda env: left(env) + right(env),
+    TokenType.MINUS: lambda left, right: lambda env: left(env) - right(env),
+    TokenType.MULTIPLY: lambda left, right: lambda env: left(env) * right(env),
+    TokenType.DIVIDE: lambda left, right: lambda env: left(env) // right(env),
+    TokenType.MODULO: lambda left, right: lambda env: left(env) % right(env),
+    TokenType.EQUAL: lambda left, right: lambda env: left(env) == right(env),
+    TokenType.NOT_EQUAL: lambda left, right: lambda env: left(env) != right(env),
+    TokenType.LESS_THAN: lambda left, right: lambda env: left(env) < right(env),
+    TokenType.GREATER_THAN: lambda left, right: lambda env: left(env) > right(env),
+    TokenType.LESS_THAN_OR_EQUAL: lambda left, right: lambda env: left(env) <= right(env),
+    TokenType.GREATER_THAN_OR_EQUAL: lambda left, right: lambda env: left(env) >= right(env),
+}
+
+#The same for an integer literal on the right (n - 1, n <= 1, ...), which is captured as a value.
+TYPED_BINARY_CONSTANT = {
+    TokenType.PLUS: lambda left, value: lambda env: left(env) + value,
+    TokenType.MINUS: lambda left, value: lambda env: left(env) - value,
+    TokenType.MULTIPLY: lambda left, value: lambda env: left(env) * value,
+    TokenType.DIVIDE: lambda left, value: lambda env: left(env) // value,
+    TokenType.MODULO: lambda left, value: lambda env: left(env) % value,
+    TokenType.EQUAL: lambda left, value: lambda env: left(env) == value,
+    TokenType.NOT_EQUAL: lambda left, value: lambda env: left(env) != value,
+    TokenType.LESS_THAN: lambda left, value: lambda env: left(env) < value,
+    TokenType.GREATER_THAN: lambda left, value: lambda env: left(env) > value,
+    TokenType.LESS_THAN_OR_EQUAL: lambda left, value: lambda env: left(env) <= value,
+    TokenType.GREATER_THAN_OR_EQUAL: lambda left, value: lambda env: left(env) >= value,
+}
+
+TYPED_UNARY = {
+    TokenType.PLUS: lambda expr: lambda env: +expr(env),
+    TokenType.MINUS: lambda expr: lambda env: -expr(env),
+    TokenType.NOT: lambda expr: lambda env: not expr(env),
+}
+
+
+#Translates an AST into a tree of nested Python closures.
+#Every node is compiled once into a callable that takes an environment and returns the node's value,
+# so node dispatch and operator selection happen at compile time instead of on every evaluation.
+class ClosureCompiler:
+
+    #The compiler needs the interpreter to reach its global environment at run time.
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+
+    #Dispatches to the appropriate compile_* method based on the node type.
+    def compile(self, node):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.generic_compile)
+        return method(node)
+
+    #Raises an exception for unsupported node types.
+    def generic_compile(self, node):
+        raise Exception(f'No compile_{type(node).__name__} method')
+
+    #Returns the compiled body of a function, compiling it on first use.
+    def function_code(self, function):
+        if function.code is None:
+            function.code = self.compile(function.body)
+        return function.code
+
+    #Literals are captured directly by the closure.
+    def compile_Num(self, node):
+        value = node.value
+        return lambda env: value
+
+    def compile_Boolean(self, node):
+        value = node.value
+        return lambda env: value
+
+    #Returns whether the type annotations of a tree can be used: only when every command is type-checked.
+    def typed(self, node):
+        return node.type is not None and self.interpreter.typechecker is not None
+
+    #The operator is looked up once here, the closure only calls it.
+    #Type-checked operators get a specialized closure instead (see TYPED_BINARY).
+    def compile_BinOp(self, node):
+        left = self.compile(node.left)
+        if self.typed(node) and node.op.type in TYPED_BINARY:
+            # a literal right operand is an integer, so the left one is too
+            if type(node.right) is Num and node.op.type in TYPED_BINARY_CONSTANT:
+                return TYPED_BINARY_CONSTANT[node.op.type](left, node.right.value)
+            return TYPED_BINARY[node.op.type](left, self.compile(node.right))
+        right = self.compile(node.right)
+        op = BINARY_OPERATORS[node.op.type]
+        return lambda env: op(left(env), right(env))
+
+    #Handles unary operations.
+    def compile_UnaryOp(self, node):
+        expr = self.compile(node.expr)
+        if self.typed(node):
+            return TYPED_UNARY[node.op.type](expr)
+        op = UNARY_OPERATORS[node.op.type]
+        return lambda env: op(expr(env))
+
+    #Reads the variable at the address assigned by the resolver; the common depths get their own closures.
+    def compile_Identifier(self, node):
+        name = node.value
+        depth = node.depth
+        slot = node.slot
+
+        if depth == 0:
+            return lambda env: env.slots[slot]
+        if depth == 1:
+            return lambda env: env.parent.slots[slot]
+        if depth is not None:
+            def identifier(env):
+                for _ in range(depth):
+                    env = env.parent
+                return env.slots[slot]
+
+            return identifier
+
+        global_env = self.interpreter.global_env
+
+        def global_identifier(env):
+            if name in global_env:
+                return global_env[name]
+            raise Exception(f"Variable '{name}' is not defined")
+
+        return global_identifier
+
+    #Evaluates the condition and runs either the compiled 'then' or 'else' branch.
+    def compile_IfThenElse(self, node):
+        condition = self.compile(node.condition)
+        then_body = self.compile(node.then_body)
+        else_body = self.compile(node.else_body)
+
+        def if_then_else(env):
+            if condition(env):
+                return then_body(env)
+            else:
+                return else_body(env)
+
+        return if_then_else
+
+    #Stores the variable in its slot of the current frame and runs the compiled body.
+    def compile_LetIn(self, node):
+        slot = node.slot
+        var_value = self.compile(node.var_value)
+        body = self.compile(node.body)
+
+        def let_in(env):
+            env.slots[slot] = var_value(env)
+            return body(env)
+
+        return let_in
+
+    #The body is compiled ahead of time and stored on the Function object.
+    def compile_FunctionDef(self, node):
+        name = node.name
+        params = node.params
+        body = node.body
+        nlocals = node.nlocals
+        code = self.compile(body)
+        interpreter = self.interpreter
+
+        def function_def(env):
+            function = Function(name, params, body, env, nlocals)
+            function.code = code
+            interpreter.define_function(function)
+            return f"Function '{name}' defined"
+
+        return function_def
+
+    #Creates a lambda function capturing the current frame; the body is compiled only once.
+    def compile_Lambda(self, node):
+        params = node.params
+        body = node.body
+        nlocals = node.nlocals
+        code = self.compile(body)
+
+        def make_lambda(env):
+            function = Function(None, params, body, env, nlocals)
+            function.code = code
+            return function
+
+        return make_lambda
+
+    #Handles function calls, including lambda function calls.
+    #Calls in tail position return a TailCall for the enclosing call_function loop.
+    #Other calls go through interpreter.call_function, looked up per call so that memoization can wrap it.
+    def compile_FunctionCall(self, node):
+        arguments = [self.compile(arg) for arg in node.arguments]
+        arg_count = len(arguments)
+        tail = node.tail
+        interpreter = self.interpreter
+
+        if isinstance(node.name, Lambda):
+            make_lambda = self.compile_Lambda(node.name)
+            param_count = len(node.name.params)
+
+            def call_lambda(env):
+                function = make_lambda(env)
+                evaluated_args = [arg(env) for arg in arguments]
+                if arg_count < param_count:
+                    raise Exception(f"Expected {param_count} arguments, got {arg_count}")
+                del evaluated_args[param_count:]
+                if tail:
+                    return TailCall(function, evaluated_args)
+                return interpreter.call_function(function, evaluated_args)
+
+            return call_lambda
+
+        #Functions are looked up on every call so that redefinitions are picked up.
+        name = node.name
+        global_env = self.interpreter.global_env
+
+        def call(env):
+            function = global_env.get(name)
+            if function is None:
+                builtin = find_builtin(name, arg_count)
+                return builtin.run(interpreter, [arg(env) for arg in arguments])
+            if len(function.params) != arg_count:
+                raise Exception(f"Expected {len(function.params)} arguments, got {arg_count}")
+
+            evaluated_args = [arg(env) for arg in arguments]
+            if tail:
+                return TailCall(function, evaluated_args)
+            return interpreter.call_function(function, evaluated_args)
+
+        return call
+
+
+#Interpreter that compiles each tree to closures once and then runs the closures.
+#It shares the global environment and Function objects with the tree-walking Interpreter,
+# so both engines produce the same results.
+class ClosureInterpreter(Interpreter):
+
+    def __init__(self):
+        super().__init__()
+        self.compiler = ClosureCompiler(self)
+
+    #Runs the compiled function body in a new frame, running tail calls in a loop like Interpreter.call_function.
+    def call_function(self, function, args):
+        function_code = self.compiler.function_code
+        result = function_code(function)(function.new_frame(args))
+        while type(result) is TailCall:
+            function = result.function
+            result = function_code(function)(function.new_frame(result.args))
+        return result
+
+    #Compiled bodies are not evaluated with visit, so the governor counts each run of a body as one step.
+    def install_governor(self):
+        self.call_function = self.governed_call_function
+
+    #call_function with resource limits: counts the call and every tail call it runs.
+    def governed_call_function(self, function, args):
+        governor = self.governor
+        function_code = self.compiler.function_code
+        governor.enter()
+        try:
+            governor.step()
+            result = function_code(function)(function.new_frame(args))
+            while type(result) is TailCall:
+                governor.step()
+                function = result.function
+                result = function_code(function)(function.new_frame(result.args))
+            return result
+        finally:
+            governor.leave()
+
+    #Resolves and compiles the tree and runs it in a fresh top-level frame, within the limits of the
+    # governor if there is one.
+    def interpret(self, tree):
+        nlocals = self.resolver.resolve(tree)
+        code = self.compiler.compile(tree)
+        if self.governor is not None:
+            return self.governor.run(code, Frame([None] * nlocals, None))
+        return code(Frame([None] * nlocals, None))
@@ -0,0 +1,282 @@
+from array import array
+from parser import Lambda
+from interpreter import Interpreter, Function, Frame, TailCall
+from lists import find_builtin
+from bytecode import BINARY_OP_TYPES, BINARY_FUNCTIONS, UNARY_OP_TYPES, UNARY_FUNCTIONS
+
+#Node kinds of the flat encoding and what their three fields (first, second, third) hold.
+CONST = 0            #pool[first] is the value
+LOCAL = 1            #the variable is in slot first of the frame second levels up
+GLOBAL = 2           #pool[first] is the name of a global variable
+BINARY = 3           #operands first and second, BINARY_FUNCTIONS[third] is the operator
+UNARY = 4            #operand first, UNARY_FUNCTIONS[third] is the operator
+IF = 5               #condition first, then branch second, else branch third
+LET = 6              #value first, body second, stored in slot third
+CALL = 7             #pool[first] is the function name, the arguments are extras[second:second + third]
+CALL_LAMBDA = 8      #first is the LAMBDA node called, arguments like CALL
+TAIL_CALL = 9        #CALL in tail position
+TAIL_CALL_LAMBDA = 10  #CALL_LAMBDA in tail position
+LAMBDA = 11          #pool[first] is the Lambda node, second is the root of its body
+FUNCTION_DEF = 12    #pool[first] is the FunctionDef node, second is the root of its body
+
+KIND_NAMES = ['CONST', 'LOCAL', 'GLOBAL', 'BINARY', 'UNARY', 'IF', 'LET', 'CALL', 'CALL_LAMBDA', 'TAIL_CALL',
+              'TAIL_CALL_LAMBDA', 'LAMBDA', 'FUNCTION_DEF']
+
+
+#A whole tree stored as a "struct of arrays": node i has kind kinds[i] and fields first[i], second[i]
+# and third[i], which are child node indices, slots or indices into the literal pool (see the kinds above).
+#Children are stored before their parent, so the root is the last node.
+#Function and lambda bodies are stored in the same arrays; a body is run from its own root node.
+class FlatTree:
+    __slots__ = ('kinds', 'first', 'second', 'third', 'extras', 'pool', 'root')
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.first = array('i')
+        self.second = array('i')
+        self.third = array('i')
+        self.extras = array('i')
+        self.pool = []
+        self.root = -1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    #Appends a node and returns its index.
+    def add(self, kind, first=0, second=0, third=0):
+        self.kinds.append(kind)
+        self.first.append(first)
+        self.second.append(second)
+        self.third.append(third)
+        return len(self.kinds) - 1
+
+    #Adds a value to the literal pool and returns its index.
+    def constant(self, value):
+        self.pool.append(value)
+        return len(self.pool) - 1
+
+    #Lists the nodes, one per line, for debugging.
+    def dump(self):
+        lines = []
+        for index in range(len(self.kinds)):
+            kind = self.kinds[index]
+            lines.append(f'{index:4d} {KIND_NAMES[kind]:<16} {self.first[index]} {self.second[index]} {self.third[index]}')
+        return '\n'.join(lines)
+
+
+#Encodes a resolved AST as a FlatTree.
+#The lexical addresses and tail call marks of the resolver are copied into the encoding,
+# so the tree must be resolved first.
+class FlatEncoder:
+
+    #Returns the encoding of a tree (or a function body).
+    #Equal literals and names share one pool entry, and nodes shared by the parser (see Parser share_nodes)
+    # are encoded once.
+    def encode(self, node):
+        tree = FlatTree()
+        self.constants = {}
+        self.encoded = {}
+        tree.root = self.add(tree, node)
+        self.constants = self.encoded = None
+        return tree
+
+    #Returns the pool index of a value, adding it to the pool on first use.
+    #The type is part of the key because True == 1 in Python.
+    def constant(self, tree, value):
+        key = (type(value), value)
+        index = self.constants.get(key)
+        if index is None:
+            index = self.constants[key] = tree.constant(value)
+        return index
+
+    #Dispatches to the appropriate encode_* method based on the node type; returns the node index.
+    def add(self, tree, node):
+        index = self.encoded.get(node)
+        if index is None:
+            method_name = f'encode_{type(node).__name__}'
+            method = getattr(self, method_name, self.generic_encode)
+            index = self.encoded[node] = method(tree, node)
+        return index
+
+    #Raises an exception for unsupported node types.
+    def generic_encode(self, tree, node):
+        raise Exception(f'No encode_{type(node).__name__} method')
+
+    def encode_Num(self, tree, node):
+        return tree.add(CONST, self.constant(tree, node.value))
+
+    def encode_Boolean(self, tree, node):
+        return tree.add(CONST, self.constant(tree, node.value))
+
+    def encode_BinOp(self, tree, node):
+        left = self.add(tree, node.left)
+        right = self.add(tree, node.right)
+        return tree.add(BINARY, left, right, BINARY_OP_TYPES.index(node.op.type))
+
+    def encode_UnaryOp(self, tree, node):
+        expr = self.add(tree, node.expr)
+        return tree.add(UNARY, expr, 0, UNARY_OP_TYPES.index(node.op.type))
+
+    def encode_Identifier(self, tree, node):
+        if node.depth is None:
+            return tree.add(GLOBAL, self.constant(tree, node.value))
+        return tree.add(LOCAL, node.slot, node.depth)
+
+    def encode_IfThenElse(self, tree, node):
+        condition = self.add(tree, node.condition)
+        then_body = self.add(tree, node.then_body)
+        else_body = self.add(tree, node.else_body)
+        return tree.add(IF, condition, then_body, else_body)
+
+    def encode_LetIn(self, tree, node):
+        var_value = self.add(tree, node.var_value)
+        body = self.add(tree, node.body)
+        return tree.add(LET, var_value, body, node.slot)
+
+    def encode_FunctionDef(self, tree, node):
+        body = self.add(tree, node.body)
+        return tree.add(FUNCTION_DEF, tree.constant(node), body)
+
+    def encode_Lambda(self, tree, node):
+        body = self.add(tree, node.body)
+        return tree.add(LAMBDA, tree.constant(node), body)
+
+    #The argument indices are stored contiguously in extras.
+    def encode_FunctionCall(self, tree, node):
+        if isinstance(node.name, Lambda):
+            kind = TAIL_CALL_LAMBDA if node.tail else CALL_LAMBDA
+            callee = self.add(tree, node.name)
+        else:
+            kind = TAIL_CALL if node.tail else CALL
+            callee = self.constant(tree, node.name)
+        arguments = [self.add(tree, arg) for arg in node.arguments]
+        start = len(tree.extras)
+        tree.extras.extend(arguments)
+        return tree.add(kind, callee, start, len(arguments))
+
+
+#Interpreter that encodes each tree as a FlatTree and evaluates the encoding directly.
+#It shares the global environment and Function objects with the tree-walking Interpreter; Function.code
+# holds the encoded body of a function as a (FlatTree, root index) pair.
+class FlatInterpreter(Interpreter):
+
+    def __init__(self):
+        super().__init__()
+        self.encoder = FlatEncoder()
+
+    #Returns the encoded body of a function, encoding it on first use.
+    def function_code(self, function):
+        if function.code is None:
+            tree = self.encoder.encode(function.body)
+            function.code = (tree, tree.root)
+        return function.code
+
+    #Evaluates node index of a FlatTree in env.
+    def evaluate(self, tree, index, env):
+        kind = tree.kinds[index]
+
+        if kind == LOCAL:
+            depth = tree.second[index]
+            while depth:
+                env = env.parent
+                depth -= 1
+            return env.slots[tree.first[index]]
+        elif kind == CONST:
+            return tree.pool[tree.first[index]]
+        elif kind == BINARY:
+            left = self.evaluate(tree, tree.first[index], env)
+            right = self.evaluate(tree, tree.second[index], env)
+            return BINARY_FUNCTIONS[tree.third[index]](left, right)
+        elif kind == IF:
+            if self.evaluate(tree, tree.first[index], env):
+                return self.evaluate(tree, tree.second[index], env)
+            return self.evaluate(tree, tree.third[index], env)
+        elif kind == CALL or kind == TAIL_CALL:
+            name = tree.pool[tree.first[index]]
+            function = self.global_env.get(name)
+            arg_count = tree.third[index]
+            if function is None:
+                builtin = find_builtin(name, arg_count)
+                start = tree.second[index]
+                return builtin.run(self, [self.evaluate(tree, arg, env) for arg in tree.extras[start:start + arg_count]])
+            if len(function.params) != arg_count:
+                raise Exception(f"Expected {len(function.params)} arguments, got {arg_count}")
+            start = tree.second[index]
+            args = [self.evaluate(tree, arg, env) for arg in tree.extras[start:start + arg_count]]
+            if kind == TAIL_CALL:
+                return TailCall(function, args)
+            return self.call_function(function, args)
+        elif kind == GLOBAL:
+            name = tree.pool[tree.first[index]]
+            if name in self.global_env:
+                return self.global_env[name]
+            raise Exception(f"Variable '{name}' is not defined")
+        elif kind == UNARY:
+            return UNARY_FUNCTIONS[tree.third[index]](self.evaluate(tree, tree.first[index], env))
+        elif kind == LET:
+            env.slots[tree.third[index]] = self.evaluate(tree, tree.first[index], env)
+            return self.evaluate(tree, tree.second[index], env)
+        elif kind == CALL_LAMBDA or kind == TAIL_CALL_LAMBDA:
+            # lambdas ignore extra arguments, like in the tree-walker
+            function = self.evaluate(tree, tree.first[index], env)
+            start = tree.second[index]
+            arg_count = tree.third[index]
+            args = [self.evaluate(tree, arg, env) for arg in tree.extras[start:start + arg_count]]
+            if arg_count < len(function.params):
+                raise Exception(f"Expected {len(function.params)} arguments, got {arg_count}")
+            del args[len(function.params):]
+            if kind == TAIL_CALL_LAMBDA:
+                return TailCall(function, args)
+            return self.call_function(function, args)
+        elif kind == LAMBDA:
+            node = tree.pool[tree.first[index]]
+            function = Function(None, node.params, node.body, env, node.nlocals)
+            function.code = (tree, tree.second[index])
+            return function
+        elif kind == FUNCTION_DEF:
+            node = tree.pool[tree.first[index]]
+            function = Function(node.name, node.params, node.body, env, node.nlocals)
+            function.code = (tree, tree.second[index])
+            self.define_function(function)
+            return f"Function '{node.name}' defined"
+        raise Exception(f'Unknown flat node kind {kind}')
+
+    #Runs the encoded function body in a new frame, running tail calls in a loop like Interpreter.call_function.
+    def call_function(self, function, args):
+        tree, root = self.function_code(function)
+        result = self.evaluate(tree, root, function.new_frame(args))
+        while type(result) is TailCall:
+            function = result.function
+            tree, root = self.function_code(function)
+            result = self.evaluate(tree, root, function.new_frame(result.args))
+        return result
+
+    #Encoded bodies are not evaluated with visit, so the governor counts each run of a body as one step.
+    def install_governor(self):
+        self.call_function = self.governed_call_function
+
+    #call_function with resource limits: counts the call and every tail call it runs.
+    def governed_call_function(self, function, args):
+        governor = self.governor
+        governor.enter()
+        try:
+            governor.step()
+            tree, root = self.function_code(function)
+            result = self.evaluate(tree, root, function.new_frame(args))
+            while type(result) is TailCall:
+                governor.step()
+                function = result.function
+                tree, root = self.function_code(function)
+                result = self.evaluate(tree, root, function.new_frame(result.args))
+            return result
+        finally:
+            governor.leave()
+
+    #Resolves and encodes the tree and evaluates the encoding in a fresh top-level frame, within the
+    # limits of the governor if there is one.
+    def interpret(self, tree):
+        nlocals = self.resolver.resolve(tree)
+        flat_tree = self.encoder.encode(tree)
+        if self.governor is not None:
+            return self.governor.run(self.evaluate, flat_tree, flat_tree.root, Frame([None] * nlocals, None))
+        return self.evaluate(flat_tree, flat_tree.root, Frame([None] * nlocals, None))
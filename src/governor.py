@@ -0,0 +1,144 @@
+import time
+
+
+#Number of evaluation steps between two looks at the clock.
+CHECK_INTERVAL = 1024
+
+
+#Raised when a command goes over one of the limits of its governor.
+#limit names the limit ('fuel', 'time', 'depth' or 'cells'), maximum is its value and usage holds the
+# counters of the command when it was stopped (see Governor.usage).
+class LimitExceeded(Exception):
+    def __init__(self, limit, maximum, usage):
+        self.limit = limit
+        self.maximum = maximum
+        self.usage = usage
+        counters = ', '.join(f"{key}: {value:.3f}s" if key == 'time' else f"{key}: {value}"
+                             for key, value in usage.items())
+        super().__init__(f"Limit exceeded: {limit} limit of {maximum} ({counters})")
+
+
+#Limits the resources each command can use, so a runaway program is stopped with a LimitExceeded error
+# instead of running forever or running out of memory:
+# fuel is the number of evaluation steps (evaluated nodes), time the wall-clock seconds, depth the number
+# of nested calls (each holding an environment frame) and cells the number of list cells built by built-in
+# functions. A limit that is None is not enforced, but the usage is still counted.
+#The tree-walking engines evaluate nodes through wrap_visit and call functions through wrap_call, so a step is
+# an evaluated node; both are installed as instance attributes (see Interpreter.install_governor), so without
+# a governor nothing is slower. The engines that do not evaluate nodes through visit (closure, flat, stack
+# and vm) count a step for every run of a function body, tail calls included, with step, and follow the
+# depth of their calls with enter and leave; every loop of a program goes through calls, so the fuel still
+# bounds any command.
+#Each step costs one increment and one comparison: the fuel and the clock are only checked every
+# CHECK_INTERVAL steps, or sooner when the fuel runs out.
+class Governor:
+    def __init__(self, fuel=None, time_limit=None, depth=None, cells=None):
+        self.fuel = fuel
+        self.time_limit = time_limit
+        self.max_depth = depth
+        self.max_cells = cells
+        self.start()
+
+    #Resets the counters at the start of a command.
+    def start(self):
+        self.steps = 0
+        self.depth = 0
+        self.deepest = 0
+        self.cells = 0
+        self.started = time.perf_counter()
+        self.deadline = self.started + self.time_limit if self.time_limit is not None else None
+        self.next_check = CHECK_INTERVAL if self.fuel is None else min(CHECK_INTERVAL, self.fuel)
+
+    #Returns the counters of the current (or last) command.
+    def usage(self):
+        return {
+            'steps': self.steps,
+            'time': time.perf_counter() - self.started,
+            'depth': self.deepest,
+            'cells': self.cells,
+        }
+
+    def exceeded(self, limit, maximum):
+        return LimitExceeded(limit, maximum, self.usage())
+
+    #Runs every CHECK_INTERVAL steps: checks the fuel and the deadline and sets when to check next.
+    def check(self):
+        if self.fuel is not None and self.steps > self.fuel:
+            self.steps = self.fuel
+            raise self.exceeded('fuel', self.fuel)
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise self.exceeded('time', self.time_limit)
+        self.next_check = self.steps + CHECK_INTERVAL
+        if self.fuel is not None and self.next_check > self.fuel:
+            self.next_check = self.fuel
+
+    #Counts one step.
+    def step(self):
+        self.steps += 1
+        if self.steps > self.next_check:
+            self.check()
+
+    #Enters a nested call, which must not go deeper than the depth limit.
+    def enter(self):
+        self.depth += 1
+        if self.depth > self.deepest:
+            self.reach(self.depth)
+
+    #Records a depth of nested calls reached, for engines that keep their own call stack.
+    def reach(self, depth):
+        if depth > self.deepest:
+            self.deepest = depth
+            if self.max_depth is not None and depth > self.max_depth:
+                self.deepest = self.max_depth
+                raise self.exceeded('depth', self.max_depth)
+
+    def leave(self):
+        self.depth -= 1
+
+    #Returns the visit function counting one step per evaluated node.
+    def wrap_visit(self, visit):
+        governor = self
+
+        def governed_visit(node, env):
+            governor.steps += 1
+            if governor.steps > governor.next_check:
+                governor.check()
+            return visit(node, env)
+        return governed_visit
+
+    #Returns the call_function counting the depth of nested calls.
+    #Tail calls run in the loop of call_function, so they do not increase the depth.
+    def wrap_call(self, call_function):
+        governor = self
+
+        def governed_call(function, args):
+            governor.enter()
+            try:
+                return call_function(function, args)
+            finally:
+                governor.depth -= 1
+        return governed_call
+
+    #Counts list cells about to be built, before they are built.
+    #A long loop inside a built-in does not count as steps, so the deadline is checked here too.
+    def allocate(self, cells):
+        self.cells += cells
+        if self.max_cells is not None and self.cells > self.max_cells:
+            raise self.exceeded('cells', self.max_cells)
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise self.exceeded('time', self.time_limit)
+
+    #Runs one command, evaluate(*args), with fresh counters.
+    #Python's recursion limit can be reached before the depth limit (or without one); the command is then
+    # stopped with a depth LimitExceeded error too, instead of a RecursionError, giving the depth reached
+    # as the limit.
+    def run(self, evaluate, *args):
+        self.start()
+        try:
+            return evaluate(*args)
+        except RecursionError:
+            raise self.exceeded('depth', self.deepest) from None
+
+    #The limits, as the keyword arguments that create an equal governor.
+    def limits(self):
+        return {'fuel': self.fuel, 'time_limit': self.time_limit, 'depth': self.max_depth, 'cells': self.max_cells}
@@ -0,0 +1,233 @@
+from lexer import Lexer
+from parser import Parser, BinOp, UnaryOp, FunctionCall, FunctionDef, Identifier, IfThenElse, LetIn, Lambda
+from resolver import Resolver
+from program_cache import implementation_digest, source_digest, cache_path, read_signed, write_signed
+from governor import LimitExceeded
+import os
+
+#Bump when the format of result files changes.
+RESULTS_VERSION = 2
+
+#Result files are kept with the cache files, named after the path of the program with this suffix added
+# (see program_cache.cache_path).
+RESULTS_SUFFIX = '.fresults'
+
+#Results depend on the whole interpreter, so every module is part of the version of a result file.
+INTERPRETER_MODULES = tuple(sorted(name for name in os.listdir(os.path.dirname(os.path.abspath(__file__)))
+                                   if name.endswith('.py')))
+
+RESULTS_MAGIC = f'functastic-results-{RESULTS_VERSION}-{implementation_digest(INTERPRETER_MODULES)}'
+
+
+#Returns the global names a resolved tree refers to: the functions it calls and the variables that are not
+# bound by an enclosing function, lambda or let.
+def global_references(tree):
+    names = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        if node_type is Identifier:
+            if node.depth is None:
+                names.add(node.value)
+        elif node_type is FunctionCall:
+            if isinstance(node.name, str):
+                names.add(node.name)
+            else:
+                stack.append(node.name)
+            stack.extend(node.arguments)
+        elif node_type is BinOp:
+            stack.append(node.left)
+            stack.append(node.right)
+        elif node_type is UnaryOp:
+            stack.append(node.expr)
+        elif node_type is IfThenElse:
+            stack.append(node.condition)
+            stack.append(node.then_body)
+            stack.append(node.else_body)
+        elif node_type is LetIn:
+            stack.append(node.var_value)
+            stack.append(node.body)
+        elif node_type in (Lambda, FunctionDef):
+            stack.append(node.body)
+    return names
+
+
+#Returns whether a tree defines functions when it runs (a definition may also be nested in an expression).
+def defines_functions(tree):
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        if node_type is FunctionDef:
+            return True
+        elif node_type is FunctionCall:
+            if not isinstance(node.name, str):
+                stack.append(node.name)
+            stack.extend(node.arguments)
+        elif node_type is BinOp:
+            stack.append(node.left)
+            stack.append(node.right)
+        elif node_type is UnaryOp:
+            stack.append(node.expr)
+        elif node_type is IfThenElse:
+            stack.append(node.condition)
+            stack.append(node.then_body)
+            stack.append(node.else_body)
+        elif node_type is LetIn:
+            stack.append(node.var_value)
+            stack.append(node.body)
+        elif node_type is Lambda:
+            stack.append(node.body)
+    return False
+
+
+#The dependencies between the top-level commands of a program, built as the commands run.
+#For every function name it records the command that defined it last and the global names that command
+# refers to. Functions look up the functions they call when they are called, so what a command depends on
+# is the current definition of every name it reaches, directly or through the bodies of the functions it calls.
+#A function can also be defined by a command with no definition in its own source, by calling a function
+# whose body defines it; such definitions are dynamic, and the commands depending on them are never reused.
+class DependencyGraph:
+
+    def __init__(self):
+        self.definitions = {}  # function name -> (source, references, dynamic) of the command defining it
+
+    #Records the functions a command defined.
+    def define(self, names, source, references, dynamic=False):
+        for name in names:
+            self.definitions[name] = (source, references, dynamic)
+
+    #Returns the names a command with the given references depends on, each with the source of the command
+    # that defines it (None for names that are not defined), and whether any of them is defined dynamically.
+    def dependencies(self, references):
+        found = {}
+        dynamic = False
+        stack = list(references)
+        while stack:
+            name = stack.pop()
+            if name in found:
+                continue
+            definition = self.definitions.get(name)
+            found[name] = definition[0] if definition is not None else None
+            if definition is not None:
+                stack.extend(definition[1])
+                dynamic = dynamic or definition[2]
+        return found, dynamic
+
+    #Returns the key of the result of a command: a digest of its source, the sources of all the definitions
+    # it depends on and the configuration of the interpreter (which can change error messages and limits).
+    #Returns None when the command depends on a dynamic definition, so its result is not kept.
+    def key(self, source, references, configuration):
+        found, dynamic = self.dependencies(references)
+        if dynamic:
+            return None
+        dependencies = sorted(found.items(), key=lambda item: item[0])
+        return source_digest(repr((configuration, source, dependencies)))
+
+
+#Returns the part of the interpreter's configuration that can change the result of a command.
+def interpreter_configuration(interpreter):
+    governor = getattr(interpreter, 'governor', None)
+    return (type(interpreter).__name__, interpreter.optimizer is not None, interpreter.inliner is not None,
+            interpreter.typechecker is not None, governor.limits() if governor is not None else None)
+
+
+#Runs a program, reusing the results of the commands that did not change since the last run.
+#Commands that define functions always run, because they build the environment the other commands use.
+#Whether a command defines functions is found by comparing the global environment before and after it
+# runs, since it may only define them through the functions it calls; the results of such commands are
+# never kept.
+#Any other command runs only if its source, or a definition it depends on (see DependencyGraph),
+# changed; otherwise its result is read from the result file of the program.
+#Results and errors are both kept, since commands have no side effects. Commands that fail to parse
+# always run, to report the error.
+class IncrementalRunner:
+
+    def __init__(self, interpreter, cache=None):
+        self.interpreter = interpreter
+        self.cache = cache
+        self.graph = DependencyGraph()
+        self.resolver = Resolver()
+        self.configuration = interpreter_configuration(interpreter)
+        self.results = {}  # key -> (ok, text) loaded from the result file
+        self.used = {}  # key -> (ok, text) of the commands of this run
+        self.evaluated = 0
+        self.reused = 0
+        self.timed_out = False  # whether the last command evaluated was stopped by the time limit
+
+    #Loads the result file of a program; returns False if there is no usable file.
+    def load(self, filename):
+        try:
+            data = read_signed(cache_path(filename, RESULTS_SUFFIX))
+        except Exception:
+            return False
+        if not isinstance(data, dict) or data.get('magic') != RESULTS_MAGIC:
+            return False
+        self.results = data['results']
+        return True
+
+    #Writes the results of the commands of this run to the result file of a program (failures are ignored).
+    def save(self, filename):
+        if self.used == self.results:
+            return
+        data = {'magic': RESULTS_MAGIC, 'results': self.used}
+        try:
+            path = cache_path(filename, RESULTS_SUFFIX)
+        except Exception:
+            return
+        try:
+            write_signed(path, data)
+        except Exception:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    #Returns the tree of a command, from the program cache if there is one.
+    def parse(self, text):
+        if self.cache is not None:
+            return self.cache.parse(text, self.interpreter.optimizer)
+        tree = Parser(Lexer(text)).parse()
+        if self.interpreter.optimizer is not None:
+            tree = self.interpreter.optimizer.optimize(tree)
+        return tree
+
+    #Runs one command (or reuses its result) and returns (ok, text): the result, or the error message.
+    #run is called to actually run the command, like shell.run_command.
+    def run(self, text, run):
+        try:
+            tree = self.parse(text)
+            self.resolver.resolve(tree)
+        except Exception:
+            return self.evaluate(text, run)
+        references = global_references(tree)
+        static = defines_functions(tree)
+        key = None
+        if not static:
+            key = self.graph.key(text, references, self.configuration)
+            outcome = self.results.get(key) if key is not None else None
+            if outcome is not None:
+                self.reused += 1
+                self.used[key] = outcome
+                return outcome
+        before = dict(self.interpreter.global_env)
+        outcome = self.evaluate(text, run)
+        defined = [name for name, value in self.interpreter.global_env.items() if before.get(name) is not value]
+        if defined:
+            self.graph.define(defined, text, references, dynamic=not static)
+        elif key is not None and not self.timed_out:
+            # running out of time depends on the machine, so that error is not kept
+            self.used[key] = outcome
+        return outcome
+
+    def evaluate(self, text, run):
+        self.evaluated += 1
+        self.timed_out = False
+        try:
+            return True, str(run(self.interpreter, text, cache=self.cache))
+        except LimitExceeded as e:
+            self.timed_out = e.limit == 'time'
+            return False, str(e)
+        except Exception as e:
+            return False, str(e)
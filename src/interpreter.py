@@ -1,14 +1,67 @@
 from parser import BinOp, Num, FunctionDef, FunctionCall, Identifier, IfThenElse, LetIn, Boolean, Lambda, UnaryOp
 from lexer import TokenType
+from resolver import Resolver
+from memo import Memoizer, DEFAULT_CACHE_SIZE
+from profiler import Profiler
+from governor import Governor
+from lists import find_builtin
+import operator
+
+
+#Python implementations of the binary operators, keyed by token type.
+#Logical operators evaluate both operands, exactly like visit_BinOp does.
+BINARY_OPERATORS = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.MULTIPLY: operator.mul,
+    TokenType.DIVIDE: operator.floordiv,
+    TokenType.MODULO: operator.mod,
+    TokenType.AND: lambda left, right: left and right,
+    TokenType.OR: lambda left, right: left or right,
+    TokenType.EQUAL: operator.eq,
+    TokenType.NOT_EQUAL: operator.ne,
+    TokenType.LESS_THAN: operator.lt,
+    TokenType.GREATER_THAN: operator.gt,
+    TokenType.LESS_THAN_OR_EQUAL: operator.le,
+    TokenType.GREATER_THAN_OR_EQUAL: operator.ge,
+}
+
+#Python implementations of the unary operators, keyed by token type.
+UNARY_OPERATORS = {
+    TokenType.PLUS: operator.pos,
+    TokenType.MINUS: operator.neg,
+    TokenType.NOT: operator.not_,
+}
+
+
+#The local variables of one function call (or top-level command).
+#Slots are assigned by the resolver; parent is the frame the function was defined in,
+# used to reach variables of enclosing functions and let expressions.
+class Frame:
+    __slots__ = ('slots', 'parent')
+
+    def __init__(self, slots, parent):
+        self.slots = slots
+        self.parent = parent
 
 
 #Represents a function in the interpreter's environment.
+#env is the frame the function was defined in and nlocals the size of the frame each call needs.
+#code holds the compiled body for engines that compile function bodies (filled in lazily).
 class Function:
-    def __init__(self, name, params, body, env):
+    def __init__(self, name, params, body, env, nlocals=None):
         self.name = name
         self.params = params
         self.body = body
         self.env = env
+        self.nlocals = len(params) if nlocals is None else nlocals
+        self.code = None
+
+    #Creates the frame for a call; args must already match the parameters.
+    def new_frame(self, args):
+        if self.nlocals > len(args):
+            args = args + [None] * (self.nlocals - len(args))
+        return Frame(args, self.env)
 
     def __str__(self):
         if self.name:
@@ -17,12 +70,114 @@ class Function:
             return f"<lambda function>"
 
 
+#Returned by a call in tail position instead of running the function.
+#The loop in call_function runs it, so tail calls do not grow the Python stack.
+class TailCall:
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+
+
+#Returns the arguments a call of a function value passes, for calls made by built-in functions (see lists.py):
+# the value must be a function and the arguments must match its parameters, except that lambdas ignore extra ones.
+def call_arguments(function, args):
+    if type(function) is not Function:
+        raise Exception(f"Expected a function, got {function}")
+    if len(args) != len(function.params):
+        if len(args) < len(function.params) or function.name is not None:
+            raise Exception(f"Expected {len(function.params)} arguments, got {len(args)}")
+        args = args[:len(function.params)]
+    return args
+
+
 #Main class responsible for executing the AST.
 class Interpreter:
 
     #Initializes the interpreter with an empty global environment.
     def __init__(self):
         self.global_env = {}
+        self.resolver = Resolver()
+        self.memoizer = None
+        self.profiler = None
+        self.governor = None  # optional governor.Governor limiting the resources of each command
+        self.optimizer = None  # optional optimizer.Optimizer applied to each tree before it runs
+        self.inliner = None  # optional optimizer.Inliner applied after the optimizer
+        self.typechecker = None  # optional typechecker.TypeChecker run on each tree before it runs
+
+    #Caches the results of calls to user functions (all of them, or only those in names).
+    #The cache keeps at most maxsize results and evicts the least recently used one.
+    def enable_memoization(self, names=None, maxsize=DEFAULT_CACHE_SIZE):
+        self.memoizer = Memoizer(names, maxsize)
+        self.install_hooks()
+
+    def disable_memoization(self):
+        self.memoizer = None
+        self.install_hooks()
+
+    #Returns the hit/miss statistics of the memoization cache, or None if memoization is off.
+    def memo_stats(self):
+        return self.memoizer.stats() if self.memoizer is not None else None
+
+    #Records calls to user functions and lambdas and counts the evaluated nodes (see profiler.Profiler).
+    #Only engines that run function bodies with visit, through Interpreter.call_function, can be profiled.
+    def enable_profiling(self):
+        if type(self).call_function is not Interpreter.call_function:
+            raise Exception('Profiling is not supported by this engine')
+        self.profiler = Profiler()
+        self.install_hooks()
+
+    def disable_profiling(self):
+        self.profiler = None
+        self.install_hooks()
+
+    #Returns what the profiler recorded (see Profiler.stats), or None if profiling is off.
+    def profile_stats(self):
+        return self.profiler.stats() if self.profiler is not None else None
+
+    #Limits the evaluation steps, wall-clock time, call depth and list cells of each command (see
+    # governor.Governor); limits that are None are not enforced.
+    def enable_limits(self, fuel=None, time_limit=None, depth=None, cells=None):
+        self.governor = Governor(fuel, time_limit, depth, cells)
+        self.install_hooks()
+
+    def disable_limits(self):
+        self.governor = None
+        self.install_hooks()
+
+    #Returns the resources used by the last command (see Governor.usage), or None if limits are off.
+    def limit_stats(self):
+        return self.governor.usage() if self.governor is not None else None
+
+    #Sets the instance's call_function and visit for the memoizer, the profiler and the governor that are on.
+    #Without them the class methods are used directly, so they cost nothing when off.
+    def install_hooks(self):
+        self.__dict__.pop('call_function', None)
+        self.__dict__.pop('visit', None)
+        if self.profiler is not None:
+            self.call_function = self.profiled_call_function
+            self.visit = self.profiler.wrap_visit(self.visit)
+        if self.governor is not None:
+            self.install_governor()
+        if self.memoizer is not None:
+            self.call_function = self.memoizer.wrap(self.call_function)
+
+    #Counts the evaluated nodes and the depth of the calls for the governor.
+    #Engines that do not run function bodies with visit replace this, counting the runs of bodies instead.
+    def install_governor(self):
+        self.call_function = self.governor.wrap_call(self.call_function)
+        self.visit = self.governor.wrap_visit(self.visit)
+
+    #Stores a function in the global environment.
+    #Cached results are dropped and functions that inlined the old definition are rebuilt, because calls
+    # made by other functions may now reach the new definition.
+    def define_function(self, function):
+        self.global_env[function.name] = function
+        if self.memoizer is not None:
+            self.memoizer.clear()
+        if self.inliner is not None:
+            self.inliner.invalidate(function)
 
     #A generic method that dispatches to the appropriate visit_*
     # method based on the node type.
@@ -89,59 +244,80 @@ class Interpreter:
     #Defines a new function in the global environment.
     #Also used for the recursion
     def visit_FunctionDef(self, node, env):
-        function = Function(node.name, node.params, node.body, env.copy())
-        self.global_env[node.name] = function
+        function = Function(node.name, node.params, node.body, env, node.nlocals)
+        self.define_function(function)
         return f"Function '{node.name}' defined"
 
 
-    #Creates and returns a lambda function.
+    #Creates and returns a lambda function capturing the current frame.
     def visit_Lambda(self, node, env):
-        def lambda_func(*args):
-            local_env = env.copy()
-            for param, arg in zip(node.params, args):
-                local_env[param] = arg
-            return self.visit(node.body, local_env)
-
-        return lambda_func
+        return Function(None, node.params, node.body, env, node.nlocals)
 
     #Handles function calls, including lambda function calls.
-    #Creates a new environment for the function call, evaluates arguments,
-    # and executes the function body.
+    #Evaluates the arguments and executes the function body in a new frame.
+    #Calls in tail position return a TailCall for the enclosing call_function loop instead.
     def visit_FunctionCall(self, node, env):
         if isinstance(node.name, Lambda):
-            # It's a lambda function call
-            lambda_func = self.visit_Lambda(node.name, env)
-            arguments = [self.visit(arg, env) for arg in node.arguments]
-            return lambda_func(*arguments)
+            # It's a lambda function call, lambdas ignore extra arguments
+            function = self.visit_Lambda(node.name, env)
+            evaluated_args = self.visit_all(node.arguments, env)
+            if len(evaluated_args) < len(function.params):
+                raise Exception(f"Expected {len(function.params)} arguments, got {len(evaluated_args)}")
+            del evaluated_args[len(function.params):]
         else:
             # Regular function call
             function = self.global_env.get(node.name)
             if function is None:
-                raise Exception(f"Function '{node.name}' is not defined")
+                builtin = find_builtin(node.name, len(node.arguments))
+                return builtin.run(self, self.visit_all(node.arguments, env))
             if len(function.params) != len(node.arguments):
                 raise Exception(f"Expected {len(function.params)} arguments, got {len(node.arguments)}")
 
-            # Create a new environment for this function call
-            call_env = function.env.copy()
-
             # Evaluate arguments in the current environment
-            evaluated_args = [self.visit(arg, env) for arg in node.arguments]
+            evaluated_args = self.visit_all(node.arguments, env)
+
+        if node.tail:
+            return TailCall(function, evaluated_args)
+        return self.call_function(function, evaluated_args)
 
-            # Bind parameters to arguments in the new environment
-            for param, arg in zip(function.params, evaluated_args):
-                call_env[param] = arg
+    #Evaluates sub-expressions that do not depend on each other (such as the arguments of a call),
+    # in order, and returns their values.
+    def visit_all(self, nodes, env):
+        return [self.visit(node, env) for node in nodes]
 
-            # Execute the function body in the new environment
-            return self.visit(function.body, call_env)
+    #Runs the function body in a new frame holding the arguments.
+    #Tail calls made by the body are run by this loop, in constant Python stack space.
+    def call_function(self, function, args):
+        result = self.visit(function.body, function.new_frame(args))
+        while type(result) is TailCall:
+            function = result.function
+            result = self.visit(function.body, function.new_frame(result.args))
+        return result
 
-    #Looks up the value of an identifier in the current environment or global environment.
+    #Calls a function value given to a built-in function, such as the function passed to map.
+    def apply_function(self, function, args):
+        return self.call_function(function, call_arguments(function, args))
+
+    #call_function while profiling: runs each call, tail calls included, through the profiler.
+    def profiled_call_function(self, function, args):
+        run = self.profiler.run
+        result = run(self, function, args)
+        while type(result) is TailCall:
+            result = run(self, result.function, result.args)
+        return result
+
+    #Looks up the value of an identifier at the address assigned by the resolver,
+    # or in the global environment for names that are not bound locally.
     def visit_Identifier(self, node, env):
-        if node.value in env:
-            return env[node.value]
-        elif node.value in self.global_env:
-            return self.global_env[node.value]
-        else:
+        depth = node.depth
+        if depth is None:
+            if node.value in self.global_env:
+                return self.global_env[node.value]
             raise Exception(f"Variable '{node.value}' is not defined")
+        while depth:
+            env = env.parent
+            depth -= 1
+        return env.slots[node.slot]
 
     #Evaluates the condition and executes either the 'then' or 'else' branch.
     def visit_IfThenElse(self, node, env):
@@ -150,14 +326,16 @@ class Interpreter:
         else:
             return self.visit(node.else_body, env)
 
-    #Creates a new environment with the bound variable and evaluates the body in this new environment.
+    #Stores the bound variable in its slot of the current frame and evaluates the body.
     def visit_LetIn(self, node, env):
-        var_value = self.visit(node.var_value, env)
-        new_env = env.copy()
-        new_env[node.var_name] = var_value
-        return self.visit(node.body, new_env)
+        env.slots[node.slot] = self.visit(node.var_value, env)
+        return self.visit(node.body, env)
 
     #The main entry point for interpretation.
-    # Starts the interpretation process with the global environment.
+    # Resolves the variables of the tree and runs it in a fresh top-level frame, within the limits of the
+    # governor if there is one.
     def interpret(self, tree):
-        return self.visit(tree, self.global_env)
+        nlocals = self.resolver.resolve(tree)
+        if self.governor is not None:
+            return self.governor.run(self.visit, tree, Frame([None] * nlocals, None))
+        return self.visit(tree, Frame([None] * nlocals, None))
@@ -0,0 +1,208 @@
+from parser import Num, Boolean, Identifier, Lambda
+from interpreter import Interpreter, TailCall
+from lists import BUILTINS, find_builtin
+
+
+#A delayed expression: an argument or let value that is evaluated the first time it is used.
+#The value is kept once computed, and the node and frame are dropped so they can be freed.
+class Thunk:
+    __slots__ = ('node', 'env', 'value')
+
+    def __init__(self, node, env):
+        self.node = node
+        self.env = env
+        self.value = None
+
+
+#Finds the parameters of a function that every call evaluates (the strict parameters).
+#Passing them as thunks would only add work, so the lazy interpreter evaluates them before the call.
+#visit returns the slots of the current frame that are surely read whenever a node is evaluated:
+# both operands of an operator, the condition and the slots read by both branches of an if, and so on.
+#A call reads what the arguments of the strict parameters of the called function read. The strictness of
+# other functions is asked from the interpreter, which analyzes them in turn; calls of the function to itself
+# count with the parameters assumed strict, starting from all of them and dropping those that turn out not
+# to be strict until nothing changes.
+class StrictnessAnalyzer:
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.name = None
+        self.assumed = frozenset()
+
+    #Returns the indices of the strict parameters of a function (name is None for lambdas).
+    def parameters(self, params, body, name=None):
+        self.name = name
+        strict = frozenset(range(len(params)))
+        while True:
+            self.assumed = strict
+            strict = frozenset(slot for slot in self.visit(body) if slot < len(params))
+            if strict == self.assumed:
+                return strict
+
+    #Returns whether the body of a let surely reads the bound variable.
+    def let(self, node):
+        return node.slot in self.visit(node.body)
+
+    #Dispatches to the appropriate strict_* method based on the node type.
+    def visit(self, node):
+        method = getattr(self, f'strict_{type(node).__name__}', self.generic_strict)
+        return method(node)
+
+    #Literals, lambdas and definitions read nothing when they are evaluated.
+    def generic_strict(self, node):
+        return frozenset()
+
+    def strict_Identifier(self, node):
+        return frozenset((node.slot,)) if node.depth == 0 else frozenset()
+
+    def strict_BinOp(self, node):
+        return self.visit(node.left) | self.visit(node.right)
+
+    def strict_UnaryOp(self, node):
+        return self.visit(node.expr)
+
+    def strict_IfThenElse(self, node):
+        return self.visit(node.condition) | (self.visit(node.then_body) & self.visit(node.else_body))
+
+    #The bound value is only read if the body reads the variable.
+    def strict_LetIn(self, node):
+        body = self.visit(node.body)
+        if node.slot in body:
+            return body | self.visit(node.var_value)
+        return body
+
+    #Calls of lambdas read nothing for sure: lambda bodies are not analyzed ahead of the call.
+    #Built-in functions take evaluated arguments, so they are strict in all of them: an accumulator built
+    # with cons, as in f(n - 1, cons(n, acc)), is then evaluated at each call instead of becoming a chain of
+    # thunks as long as the list, which would be forced by nested calls.
+    def strict_FunctionCall(self, node):
+        if not isinstance(node.name, str):
+            return frozenset()
+        if node.name == self.name:
+            indices = self.assumed
+        else:
+            function = self.interpreter.global_env.get(node.name)
+            builtin = BUILTINS.get(node.name)
+            if function is None and builtin is not None and builtin.arity in (None, len(node.arguments)):
+                indices = range(len(node.arguments))
+            elif function is None or len(function.params) != len(node.arguments):
+                return frozenset()
+            else:
+                indices = self.interpreter.strict_parameters(function)
+        strict = frozenset()
+        for index in indices:
+            if index < len(node.arguments):
+                strict |= self.visit(node.arguments[index])
+        return strict
+
+
+#Tree-walking interpreter with call-by-need evaluation.
+#Arguments and let values are passed as thunks, evaluated the first time they are used and only once,
+# so work for values that are never used (such as an argument only used by one branch of an if) is skipped.
+#Strict parameters and let variables (see StrictnessAnalyzer) are evaluated right away, as usual; this also
+# keeps accumulating parameters from building long chains of thunks.
+#Literals, lambdas, defined global names and variables are passed without a thunk; a variable holding a
+# thunk passes that same thunk on, so thunks never wrap other thunks.
+#Unlike the other engines, an error (or endless recursion) in a value that is never used is not reported.
+class LazyInterpreter(Interpreter):
+
+    def __init__(self):
+        super().__init__()
+        self.strict_params = {}  # function or lambda body -> indices of the strict parameters
+        self.strict_lets = {}  # LetIn node -> whether its variable is strict
+        self.thunks = 0
+        self.forced = 0
+
+    #Returns the indices of the strict parameters of a function, analyzing its body on first use.
+    #While a body is analyzed it counts as having no strict parameters, so mutually recursive functions
+    # are analyzed only once (and conservatively).
+    def strict_parameters(self, function):
+        strict = self.strict_params.get(function.body)
+        if strict is None:
+            self.strict_params[function.body] = frozenset()
+            strict = self.strict_params[function.body] = StrictnessAnalyzer(self).parameters(
+                function.params, function.body, function.name)
+        return strict
+
+    #The strictness found so far depends on the functions that were defined, so it is found again.
+    def define_function(self, function):
+        super().define_function(function)
+        self.strict_params.clear()
+        self.strict_lets.clear()
+
+    #Returns the value of a thunk, evaluating it on first use.
+    def force(self, thunk):
+        if thunk.node is not None:
+            thunk.value = self.visit(thunk.node, thunk.env)
+            thunk.node = thunk.env = None
+            self.forced += 1
+        return thunk.value
+
+    #Returns a thunk for an expression, or its value when it can be had without evaluating anything.
+    def delay(self, node, env):
+        node_type = type(node)
+        if node_type is Num or node_type is Boolean:
+            return node.value
+        elif node_type is Lambda:
+            return self.visit_Lambda(node, env)
+        elif node_type is Identifier:
+            depth = node.depth
+            if depth is None:
+                if node.value in self.global_env:
+                    return self.global_env[node.value]
+            else:
+                while depth:
+                    env = env.parent
+                    depth -= 1
+                return env.slots[node.slot]
+        self.thunks += 1
+        return Thunk(node, env)
+
+    #Evaluates the arguments of the strict parameters and delays the others.
+    def arguments(self, function, nodes, env):
+        strict = self.strict_parameters(function)
+        return [self.visit(node, env) if index in strict else self.delay(node, env)
+                for index, node in enumerate(nodes)]
+
+    def visit_Identifier(self, node, env):
+        value = super().visit_Identifier(node, env)
+        if type(value) is Thunk:
+            return self.force(value)
+        return value
+
+    #Like Interpreter.visit_FunctionCall, with the arguments of non-strict parameters delayed.
+    def visit_FunctionCall(self, node, env):
+        if isinstance(node.name, Lambda):
+            # lambdas ignore extra arguments
+            function = self.visit_Lambda(node.name, env)
+            if len(node.arguments) < len(function.params):
+                raise Exception(f"Expected {len(function.params)} arguments, got {len(node.arguments)}")
+            args = self.arguments(function, node.arguments[:len(function.params)], env)
+        else:
+            function = self.global_env.get(node.name)
+            if function is None:
+                # built-in functions take evaluated arguments
+                builtin = find_builtin(node.name, len(node.arguments))
+                return builtin.run(self, self.visit_all(node.arguments, env))
+            if len(function.params) != len(node.arguments):
+                raise Exception(f"Expected {len(function.params)} arguments, got {len(node.arguments)}")
+            args = self.arguments(function, node.arguments, env)
+
+        if node.tail:
+            return TailCall(function, args)
+        return self.call_function(function, args)
+
+    #Binds the variable to a thunk, unless the body surely uses it.
+    def visit_LetIn(self, node, env):
+        strict = self.strict_lets.get(node)
+        if strict is None:
+            strict = self.strict_lets[node] = StrictnessAnalyzer(self).let(node)
+        if strict:
+            env.slots[node.slot] = self.visit(node.var_value, env)
+        else:
+            env.slots[node.slot] = self.delay(node.var_value, env)
+        return self.visit(node.body, env)
+
+    #Returns how many thunks were made and how many of them were evaluated.
+    def thunk_stats(self):
+        return {'thunks': self.thunks, 'forced': self.forced}
@@ -1,4 +1,7 @@
 from enum import Enum
+from array import array
+from sys import intern
+import re
 
 #defines a TokenType enum that contains all the possible types of tokens in the language.
 # This includes keywords, operators, and other symbols.
@@ -26,6 +29,8 @@ class TokenType(Enum):
     LESS_THAN_OR_EQUAL = 'LESS_THAN_OR_EQUAL'
     LPAREN = 'LPAREN'
     RPAREN = 'RPAREN'
+    LBRACKET = 'LBRACKET'
+    RBRACKET = 'RBRACKET'
     EOF = 'EOF'
     IF = 'IF'
     THEN = 'THEN'
@@ -36,7 +41,10 @@ class TokenType(Enum):
 
 #This class represents a token in the language.
 # Each token has a type (from the TokenType enum) and a value.
+#Tokens are never modified, so operators, keywords and booleans use one shared token each (see make_token).
 class Token:
+    __slots__ = ('type', 'value')
+
     def __init__(self, type, value):
         self.type = type
         self.value = value
@@ -45,160 +53,192 @@ class Token:
     def __str__(self):
         return f'Token({self.type}, {repr(self.value)})'
 
+#Token types are stored as small integer kind codes in the bulk token arrays: TOKEN_TYPES[kind] is the type.
+TOKEN_TYPES = tuple(TokenType)
+KINDS = {token_type: kind for kind, token_type in enumerate(TOKEN_TYPES)}
+
+
+#The kind codes by name, for code that works on the token arrays (Kind.PLUS is the code of TokenType.PLUS).
+class Kind:
+    pass
+
+
+for kind, token_type in enumerate(TOKEN_TYPES):
+    setattr(Kind, token_type.name, kind)
+
+
+#Reserved words and the token types they produce. true and false are matched case-insensitively (see Lexer).
+KEYWORDS = {
+    'function': TokenType.FUNCTION,
+    'if': TokenType.IF,
+    'then': TokenType.THEN,
+    'else': TokenType.ELSE,
+    'let': TokenType.LET,
+    'in': TokenType.IN,
+    'lambda': TokenType.LAMBDA,
+}
+
+BOOLEANS = {'true': True, 'false': False}
+
+#Operators and punctuation. Two-character operators are listed first in the pattern below,
+# so '<=' is never read as '<' followed by '='.
+SYMBOLS = {
+    '=>': TokenType.ARROW,
+    '<=': TokenType.LESS_THAN_OR_EQUAL,
+    '>=': TokenType.GREATER_THAN_OR_EQUAL,
+    '==': TokenType.EQUAL,
+    '!=': TokenType.NOT_EQUAL,
+    '&&': TokenType.AND,
+    '||': TokenType.OR,
+    '+': TokenType.PLUS,
+    '-': TokenType.MINUS,
+    '*': TokenType.MULTIPLY,
+    '/': TokenType.DIVIDE,
+    '%': TokenType.MODULO,
+    '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN,
+    '[': TokenType.LBRACKET,
+    ']': TokenType.RBRACKET,
+    '<': TokenType.LESS_THAN,
+    '>': TokenType.GREATER_THAN,
+    '!': TokenType.NOT,
+    ',': TokenType.COMMA,
+}
+
+#Kind codes of the tokens that are determined by their text alone.
+FIXED_KINDS = {lexeme: KINDS[token_type] for lexeme, token_type in {**KEYWORDS, **SYMBOLS}.items()}
+
+#The shared tokens: one per fixed kind (and EOF), one per boolean value.
+SHARED_TOKENS = {kind: Token(TOKEN_TYPES[kind], lexeme) for lexeme, kind in FIXED_KINDS.items()}
+SHARED_TOKENS[Kind.EOF] = Token(TokenType.EOF, None)
+BOOLEAN_TOKENS = {value: Token(TokenType.BOOLEAN, value) for value in (True, False)}
+
+#Skips whitespace and matches one token: an integer, a name or a symbol. Names start with a letter and
+# continue with letters and digits. The token is optional, so the pattern matches at the end of the text too.
+TOKEN_PATTERN = re.compile(
+    r'\s*(\d+|[^\W\d_][^\W_]*|' + '|'.join(re.escape(symbol) for symbol in SYMBOLS) + ')?')
+
+
+#Returns the token for a kind code and value. Only integers and identifiers need a new Token.
+def make_token(kind, value):
+    if kind == Kind.INTEGER or kind == Kind.IDENTIFIER:
+        return Token(TOKEN_TYPES[kind], value)
+    if kind == Kind.BOOLEAN:
+        return BOOLEAN_TOKENS[value]
+    return SHARED_TOKENS[kind]
+
+
+#Returns the (line, column) of an offset in a text, both starting at 1.
+def position(text, offset):
+    line = text.count('\n', 0, offset) + 1
+    column = offset - text.rfind('\n', 0, offset)
+    return line, column
+
+
+#Describes where an offset is, for error messages.
+def location(text, offset):
+    line, column = position(text, offset)
+    return f'line {line}, column {column}'
+
+
+#All the tokens of a text in parallel arrays, as returned by Lexer.tokenize.
+#Token i has kind code kinds[i], spans text[starts[i]:ends[i]] and has the literal value values[i]
+# (the integer, boolean or name; None for operators and keywords). The last token is EOF.
+#Token objects are only made on request by token(i), so a whole program takes a few bytes per token.
+class Tokens:
+    __slots__ = ('text', 'kinds', 'starts', 'ends', 'values')
+
+    def __init__(self, text):
+        self.text = text
+        self.kinds = array('B')
+        self.starts = array('q')
+        self.ends = array('q')
+        self.values = []
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def token(self, index):
+        return make_token(self.kinds[index], self.values[index])
+
+    def location(self, index):
+        return location(self.text, self.starts[index])
+
+
 #The main class responsible for tokenizing the input text.
+#Tokens are matched with TOKEN_PATTERN and sliced out of the text, so the lexer does a single pass over
+# the input without building strings character by character. There are three ways to read them:
+# tokenize() returns all of them at once in compact arrays, tokens() yields them lazily one by one,
+# and get_next_token() returns the next one on each call.
+#Positions are kept as offsets into the text; line and column numbers are only computed for error messages.
+#Names are interned, so all occurrences of a name share one string.
 class Lexer:
-    #initializes the lexer with the input text and sets up the
-    # initial position and current character.
+    #initializes the lexer with the input text and sets up the initial position.
     def __init__(self, text):
         self.text = text
         self.pos = 0
-        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-
-    #Moves to the next character in the input text.
-    def advance(self):
-        self.pos += 1
-        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-
-    # Looks at the next character without moving the position.
-    def peek(self):
-        peek_pos = self.pos + 1
-        return self.text[peek_pos] if peek_pos < len(self.text) else None
-
-    #Skips over any whitespace characters.
-    def skip_whitespace(self):
-        while self.current_char is not None and self.current_char.isspace():
-            self.advance()
-
-    #Reads a sequence of digits and returns the integer value.
-    def integer(self):
-        result = ''
-        while self.current_char is not None and self.current_char.isdigit():
-            result += self.current_char
-            self.advance()
-        return int(result)
-
-    #Reads an identifier or keyword. It checks if the identifier is a reserved keyword
-    #and returns the appropriate token.
-    def _id(self):
-        result = ''
-        while self.current_char is not None and self.current_char.isalnum():
-            result += self.current_char
-            self.advance()
-
-        if result == 'function':
-            return Token(TokenType.FUNCTION, result)
-        elif result == 'if':
-            return Token(TokenType.IF, result)
-        elif result == 'then':
-            return Token(TokenType.THEN, result)
-        elif result == 'else':
-            return Token(TokenType.ELSE, result)
-        elif result == 'let':
-            return Token(TokenType.LET, result)
-        elif result == 'in':
-            return Token(TokenType.IN, result)
-        elif result == 'lambda':
-            return Token(TokenType.LAMBDA, result)
-        elif result.lower() == 'true':
-            return Token(TokenType.BOOLEAN, True)
-        elif result.lower() == 'false':
-            return Token(TokenType.BOOLEAN, False)
-        else:
-            return Token(TokenType.IDENTIFIER, result)
+        self.token_start = 0
+        self.stream = None
+
+    #Returns the (line, column) of an offset in the text, both starting at 1.
+    def position(self, offset):
+        return position(self.text, offset)
+
+    #Describes where an offset is, for error messages.
+    def location(self, offset):
+        return location(self.text, offset)
 
     # The core of the lexer.
-    # It analyzes the current character and determines which type of token it represents.
+    # It matches the tokens from the current position and looks up their kind by their text, falling back
+    # to integers and names. Yields (kind, value, start, end) for each token, ending with EOF.
+    def scan(self):
+        text = self.text
+        fixed_kinds = FIXED_KINDS
+        for match in TOKEN_PATTERN.finditer(text, self.pos):
+            start = match.start(1)
+            if start < 0:
+                end = match.end()
+                if end < len(text):
+                    raise Exception(f'Invalid character: {text[end]} at {self.location(end)}')
+                yield Kind.EOF, None, end, end
+                return
+            lexeme = match.group(1)
+            kind = fixed_kinds.get(lexeme)
+            if kind is not None:
+                yield kind, None, start, match.end()
+            elif lexeme[0].isdigit():
+                yield Kind.INTEGER, int(lexeme), start, match.end()
+            else:
+                lowered = lexeme.lower()
+                if lowered in BOOLEANS:
+                    yield Kind.BOOLEAN, BOOLEANS[lowered], start, match.end()
+                else:
+                    yield Kind.IDENTIFIER, intern(lexeme), start, match.end()
+
+    #Tokenizes the rest of the text into a Tokens object.
+    def tokenize(self):
+        tokens = Tokens(self.text)
+        add_kind = tokens.kinds.append
+        add_start = tokens.starts.append
+        add_end = tokens.ends.append
+        add_value = tokens.values.append
+        for kind, value, start, end in self.scan():
+            add_kind(kind)
+            add_start(start)
+            add_end(end)
+            add_value(value)
+        self.pos = self.token_start = len(self.text)
+        return tokens
+
+    #Yields the tokens of the rest of the text one at a time, ending with EOF.
+    def tokens(self):
+        for kind, value, start, end in self.scan():
+            self.token_start = start
+            self.pos = end
+            yield make_token(kind, value)
+
+    #Returns the next token; EOF once the text is exhausted.
     def get_next_token(self):
-        while self.current_char is not None:
-            if self.current_char.isspace():
-                self.skip_whitespace()
-                continue
-
-            if self.current_char.isdigit():
-                return Token(TokenType.INTEGER, self.integer())
-
-            if self.current_char.isalpha():
-                return self._id()
-
-            if self.current_char == '+':
-                self.advance()
-                return Token(TokenType.PLUS, '+')
-
-            if self.current_char == '-':
-                self.advance()
-                return Token(TokenType.MINUS, '-')
-
-            if self.current_char == '*':
-                self.advance()
-                return Token(TokenType.MULTIPLY, '*')
-
-            if self.current_char == '/':
-                self.advance()
-                return Token(TokenType.DIVIDE, '/')
-
-            if self.current_char == '%':
-                self.advance()
-                return Token(TokenType.MODULO, '%')
-
-            if self.current_char == '(':
-                self.advance()
-                return Token(TokenType.LPAREN, '(')
-
-            if self.current_char == ')':
-                self.advance()
-                return Token(TokenType.RPAREN, ')')
-
-            if self.current_char == '=' and self.pos + 1 < len(self.text) and self.text[self.pos + 1] == '>':
-                self.advance()
-                self.advance()
-                return Token(TokenType.ARROW, '=>')
-
-            if self.current_char == '<' and self.pos + 1 < len(self.text) and self.text[self.pos + 1] == '=':
-                self.advance()
-                self.advance()
-                return Token(TokenType.LESS_THAN_OR_EQUAL, '<=')
-
-            if self.current_char == '>':
-                self.advance()
-                if self.current_char == '=':
-                    self.advance()
-                    return Token(TokenType.GREATER_THAN_OR_EQUAL, '>=')
-                return Token(TokenType.GREATER_THAN, '>')
-
-            if self.current_char == '<':
-                self.advance()
-                if self.current_char == '=':
-                    self.advance()
-                    return Token(TokenType.LESS_THAN_OR_EQUAL, '<=')
-                return Token(TokenType.LESS_THAN, '<')
-
-            if self.current_char == '&' and self.peek() == '&':
-                self.advance()
-                self.advance()
-                return Token(TokenType.AND, '&&')
-
-            if self.current_char == '|' and self.peek() == '|':
-                self.advance()
-                self.advance()
-                return Token(TokenType.OR, '||')
-
-            if self.current_char == '!':
-                if self.peek() == '=':
-                    self.advance()
-                    self.advance()
-                    return Token(TokenType.NOT_EQUAL, '!=')
-                self.advance()
-                return Token(TokenType.NOT, '!')
-
-            if self.current_char == '=':
-                if self.peek() == '=':
-                    self.advance()
-                    self.advance()
-                    return Token(TokenType.EQUAL, '==')
-
-            if self.current_char == ',':
-                self.advance()
-                return Token(TokenType.COMMA, ',')
-            raise Exception(f'Invalid character: {self.current_char}')
-
-        return Token(TokenType.EOF, None)
\ No newline at end of file
+        if self.stream is None:
+            self.stream = self.tokens()
+        return next(self.stream, SHARED_TOKENS[Kind.EOF])
@@ -0,0 +1,210 @@
+#Names of the built-in functions that list syntax is parsed into: [a, b, c] calls LIST_FUNCTION with the
+# elements and xs[i] calls INDEX_FUNCTION with xs and i. They are not identifiers, so they cannot be redefined.
+LIST_FUNCTION = '[list]'
+INDEX_FUNCTION = '[index]'
+
+
+#An immutable singly linked list: a cell holding the first element (head) and the rest of the list (tail).
+#Lists are never modified, so a list made with cons shares all the cells of its tail, and cons, head, tail
+# and length take constant time; indexing an element takes time proportional to its position.
+#All operations run in loops, so lists of any length can be built, compared, printed and pickled.
+class List:
+    __slots__ = ('head', 'tail', 'length')
+
+    def __init__(self, head, tail):
+        self.head = head
+        self.tail = tail
+        self.length = tail.length + 1
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        cell = self
+        while cell.length:
+            yield cell.head
+            cell = cell.tail
+
+    #Returns the element at a position, counted from 0.
+    def nth(self, index):
+        if not 0 <= index < self.length:
+            raise Exception(f'Index {index} is out of range for a list of length {self.length}')
+        cell = self
+        for _ in range(index):
+            cell = cell.tail
+        return cell.head
+
+    #Lists are equal when they have equal elements in the same order.
+    def __eq__(self, other):
+        if type(other) is not List:
+            return NotImplemented
+        first, second = self, other
+        if first.length != second.length:
+            return False
+        while first.length:
+            if first is second:
+                return True
+            if first.head != second.head:
+                return False
+            first = first.tail
+            second = second.tail
+        return True
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    #Pickled as a tuple of the elements, so long lists are not pickled cell by cell with recursion.
+    def __reduce__(self):
+        return from_values, (tuple(self),)
+
+    def __str__(self):
+        return '[' + ', '.join(str(value) for value in self) + ']'
+
+
+#The empty list, shared by all lists.
+EMPTY = List.__new__(List)
+EMPTY.head = EMPTY.tail = None
+EMPTY.length = 0
+
+
+#Returns the list of the values of a Python sequence, added to the front of tail.
+def from_values(values, tail=EMPTY):
+    result = tail
+    for value in reversed(values):
+        result = List(value, result)
+    return result
+
+
+#A function implemented in Python that Functastic programs can call by name.
+#arity is the number of arguments (None for any number); function receives the interpreter first, to call
+# the functions it is given through interpreter.apply_function.
+class Builtin:
+    __slots__ = ('name', 'arity', 'function')
+
+    #Engines that keep compiled code on functions tell built-ins apart by their empty code.
+    code = None
+
+    def __init__(self, name, arity, function):
+        self.name = name
+        self.arity = arity
+        self.function = function
+
+    def run(self, interpreter, args):
+        return self.function(interpreter, *args)
+
+    def __str__(self):
+        return f"<builtin {self.name}>"
+
+
+#Counts list cells about to be built against the limits of the interpreter's governor, if it has one.
+def allocate(interpreter, cells):
+    governor = getattr(interpreter, 'governor', None)
+    if governor is not None:
+        governor.allocate(cells)
+
+
+def expect_list(name, value):
+    if type(value) is not List:
+        raise Exception(f'{name} expects a list, got {value}')
+    return value
+
+
+def expect_integer(name, value):
+    if type(value) is not int:
+        raise Exception(f'{name} expects an integer, got {value}')
+    return value
+
+
+def builtin_list(interpreter, *values):
+    allocate(interpreter, len(values))
+    return from_values(values)
+
+
+def builtin_nth(interpreter, values, index):
+    return expect_list('nth', values).nth(expect_integer('nth', index))
+
+
+def builtin_length(interpreter, values):
+    return expect_list('length', values).length
+
+
+def builtin_cons(interpreter, value, values):
+    allocate(interpreter, 1)
+    return List(value, expect_list('cons', values))
+
+
+#Copies the cells of the first list; the second list is shared.
+def builtin_append(interpreter, first, second):
+    allocate(interpreter, expect_list('append', first).length)
+    return from_values(list(first), expect_list('append', second))
+
+
+def builtin_head(interpreter, values):
+    if not expect_list('head', values).length:
+        raise Exception('head of an empty list')
+    return values.head
+
+
+def builtin_tail(interpreter, values):
+    if not expect_list('tail', values).length:
+        raise Exception('tail of an empty list')
+    return values.tail
+
+
+def builtin_map(interpreter, function, values):
+    allocate(interpreter, expect_list('map', values).length)
+    apply_function = interpreter.apply_function
+    return from_values([apply_function(function, [value]) for value in expect_list('map', values)])
+
+
+def builtin_filter(interpreter, function, values):
+    apply_function = interpreter.apply_function
+    kept = [value for value in expect_list('filter', values) if apply_function(function, [value])]
+    allocate(interpreter, len(kept))
+    return from_values(kept)
+
+
+#Combines the elements from the left: reduce(f, initial, [a, b]) is f(f(initial, a), b).
+def builtin_reduce(interpreter, function, initial, values):
+    apply_function = interpreter.apply_function
+    result = initial
+    for value in expect_list('reduce', values):
+        result = apply_function(function, [result, value])
+    return result
+
+
+#The integers from start up to end, end excluded.
+def builtin_range(interpreter, start, end):
+    expect_integer('range', start)
+    expect_integer('range', end)
+    allocate(interpreter, max(0, end - start))
+    return from_values(range(start, end))
+
+
+#The built-in functions by the name they are called with.
+#Functions defined by the program take precedence: a name is only looked up here if it is not defined.
+BUILTINS = {
+    LIST_FUNCTION: Builtin('list', None, builtin_list),
+    INDEX_FUNCTION: Builtin('nth', 2, builtin_nth),
+    'nth': Builtin('nth', 2, builtin_nth),
+    'length': Builtin('length', 1, builtin_length),
+    'cons': Builtin('cons', 2, builtin_cons),
+    'append': Builtin('append', 2, builtin_append),
+    'head': Builtin('head', 1, builtin_head),
+    'tail': Builtin('tail', 1, builtin_tail),
+    'map': Builtin('map', 2, builtin_map),
+    'filter': Builtin('filter', 2, builtin_filter),
+    'reduce': Builtin('reduce', 3, builtin_reduce),
+    'range': Builtin('range', 2, builtin_range),
+}
+
+
+#Returns the built-in function called by a name that is not defined in the global environment,
+# raising the errors of a call to an undefined function or with the wrong number of arguments.
+def find_builtin(name, arg_count):
+    builtin = BUILTINS.get(name)
+    if builtin is None:
+        raise Exception(f"Function '{name}' is not defined")
+    if builtin.arity is not None and builtin.arity != arg_count:
+        raise Exception(f"Expected {builtin.arity} arguments, got {arg_count}")
+    return builtin
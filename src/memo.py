@@ -0,0 +1,100 @@
+from collections import OrderedDict
+
+#Default number of results kept per interpreter.
+DEFAULT_CACHE_SIZE = 10000
+
+#Returned by LRUCache.get when the key is not cached.
+MISSING = object()
+
+
+#A dictionary with a size bound that evicts the least recently used entry.
+class LRUCache:
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        if maxsize < 1:
+            raise Exception('Cache size must be at least 1')
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.entries.get(key, MISSING)
+        if value is not MISSING:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+#Caches the results of calls to user functions.
+#Functastic has no side effects, so a call is determined by the function and its argument values.
+#Only calls whose arguments are all integers or booleans are cached; calls with function arguments
+# (lambdas or named functions) bypass the cache. names limits memoization to some functions (None means all).
+class Memoizer:
+    def __init__(self, names=None, maxsize=DEFAULT_CACHE_SIZE):
+        self.names = set(names) if names is not None else None
+        self.cache = LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    #Builds the cache key of a call, or returns None if the call cannot be cached.
+    #The argument types are part of the key because True == 1 in Python.
+    def key(self, function, args):
+        if function.name is None:
+            return None
+        if self.names is not None and function.name not in self.names:
+            return None
+        key = [function]
+        for arg in args:
+            arg_type = type(arg)
+            if arg_type is not int and arg_type is not bool:
+                return None
+            key.append(arg_type)
+            key.append(arg)
+        return tuple(key)
+
+    #Returns a version of call_function(function, args) that goes through the cache.
+    def wrap(self, call_function):
+        cache = self.cache
+
+        def memoized_call_function(function, args):
+            key = self.key(function, args)
+            if key is None:
+                self.bypassed += 1
+                return call_function(function, args)
+            result = cache.get(key)
+            if result is not MISSING:
+                self.hits += 1
+                return result
+            self.misses += 1
+            result = call_function(function, args)
+            cache.put(key, result)
+            return result
+
+        return memoized_call_function
+
+    #Forgets all results. Called whenever a function is (re)defined, since calls are late bound
+    # and any cached result may depend on the old definition.
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'bypassed': self.bypassed,
+            'evictions': self.cache.evictions,
+            'size': len(self.cache),
+            'maxsize': self.cache.maxsize,
+        }
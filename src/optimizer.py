@@ -0,0 +1,456 @@
+from lexer import Token, TokenType
+from parser import BinOp, Num, FunctionDef, FunctionCall, Identifier, IfThenElse, LetIn, Boolean, Lambda, UnaryOp
+from interpreter import BINARY_OPERATORS, UNARY_OPERATORS
+
+#Operators whose result is always an integer when they succeed (booleans are promoted by Python arithmetic).
+ARITHMETIC_OPERATORS = (TokenType.PLUS, TokenType.MINUS, TokenType.MULTIPLY, TokenType.DIVIDE, TokenType.MODULO)
+
+
+#Counts the nodes of a tree.
+def count_nodes(node):
+    if isinstance(node, BinOp):
+        return 1 + count_nodes(node.left) + count_nodes(node.right)
+    if isinstance(node, UnaryOp):
+        return 1 + count_nodes(node.expr)
+    if isinstance(node, IfThenElse):
+        return 1 + count_nodes(node.condition) + count_nodes(node.then_body) + count_nodes(node.else_body)
+    if isinstance(node, LetIn):
+        return 1 + count_nodes(node.var_value) + count_nodes(node.body)
+    if isinstance(node, (FunctionDef, Lambda)):
+        return 1 + count_nodes(node.body)
+    if isinstance(node, FunctionCall):
+        callee = count_nodes(node.name) if isinstance(node.name, Lambda) else 0
+        return 1 + callee + sum(count_nodes(arg) for arg in node.arguments)
+    return 1
+
+
+#Creates the literal node for a value computed at compile time.
+def literal(value):
+    if isinstance(value, bool):
+        return Boolean(Token(TokenType.BOOLEAN, value))
+    return Num(Token(TokenType.INTEGER, value))
+
+
+def is_literal(node):
+    return isinstance(node, (Num, Boolean))
+
+
+#True if the node always evaluates to an integer (or fails), so wrapping it in unary plus is not needed.
+def is_integer(node):
+    if isinstance(node, Num):
+        return True
+    if isinstance(node, BinOp):
+        return node.op.type in ARITHMETIC_OPERATORS
+    if isinstance(node, UnaryOp):
+        return node.op.type in (TokenType.PLUS, TokenType.MINUS)
+    return False
+
+
+#Returns an expression equivalent to +node.
+#Unary plus keeps the semantics of the removed arithmetic: booleans become integers and functions still fail.
+def as_integer(node):
+    if is_integer(node):
+        return node
+    return UnaryOp(Token(TokenType.PLUS, '+'), node)
+
+
+#Simplifies a tree between parsing and execution.
+#- folds BinOp and UnaryOp nodes whose operands are literals
+#- replaces if-then-else with a literal condition by the branch that is taken
+#- substitutes let variables bound to literals into the body
+#- removes identities: x + 0, 0 + x, x - 0, x * 1, 1 * x, x / 1, true && x, false || x
+#Operations that would fail (division by zero, ...) are left in place so the error still happens at run time,
+# and operands that might fail are never dropped. The input tree is not modified; new nodes are created instead.
+class Optimizer:
+
+    def __init__(self):
+        self.removed = 0
+        self.total_removed = 0
+        self.optimized = {}  # node -> optimized node
+
+    #Returns the optimized tree; removed is set to the number of nodes it saved.
+    def optimize(self, tree):
+        before = count_nodes(tree)
+        try:
+            tree = self.visit(tree)
+        finally:
+            self.optimized.clear()
+        self.removed = before - count_nodes(tree)
+        self.total_removed += self.removed
+        return tree
+
+    #Dispatches to the appropriate optimize_* method based on the node type.
+    #The result only depends on the node, so nodes shared by the parser (see Parser share_nodes) are
+    # optimized once and their result is shared as well.
+    def visit(self, node):
+        result = self.optimized.get(node)
+        if result is None:
+            method = getattr(self, f'optimize_{type(node).__name__}', self.generic_optimize)
+            result = self.optimized[node] = method(node)
+        return result
+
+    #Nodes without sub-expressions are returned unchanged.
+    def generic_optimize(self, node):
+        return node
+
+    def optimize_BinOp(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        op_type = node.op.type
+
+        if is_literal(left) and is_literal(right):
+            try:
+                return literal(BINARY_OPERATORS[op_type](left.value, right.value))
+            except Exception:
+                pass  # keep the operation so that it fails at run time
+        elif is_literal(right):
+            if op_type in (TokenType.PLUS, TokenType.MINUS) and right.value == 0 and type(right.value) is int:
+                return as_integer(left)
+            if op_type in (TokenType.MULTIPLY, TokenType.DIVIDE) and right.value == 1 and type(right.value) is int:
+                return as_integer(left)
+        elif is_literal(left):
+            if op_type == TokenType.PLUS and left.value == 0 and type(left.value) is int:
+                return as_integer(right)
+            if op_type == TokenType.MULTIPLY and left.value == 1 and type(left.value) is int:
+                return as_integer(right)
+            # 'left and right' is right when left is truthy, 'left or right' is right when left is falsy
+            if op_type == TokenType.AND and left.value:
+                return right
+            if op_type == TokenType.OR and not left.value:
+                return right
+
+        if left is node.left and right is node.right:
+            return node
+        return BinOp(left, node.op, right)
+
+    def optimize_UnaryOp(self, node):
+        expr = self.visit(node.expr)
+        if is_literal(expr):
+            return literal(UNARY_OPERATORS[node.op.type](expr.value))
+        # --x is x for integers
+        if node.op.type == TokenType.MINUS and isinstance(expr, UnaryOp) and expr.op.type == TokenType.MINUS:
+            return as_integer(expr.expr)
+        if node.op.type == TokenType.PLUS and is_integer(expr):
+            return expr
+        if expr is node.expr:
+            return node
+        return UnaryOp(node.op, expr)
+
+    #Only the branch that is taken is kept when the condition is a literal.
+    def optimize_IfThenElse(self, node):
+        condition = self.visit(node.condition)
+        if is_literal(condition):
+            return self.visit(node.then_body if condition.value else node.else_body)
+        then_body = self.visit(node.then_body)
+        else_body = self.visit(node.else_body)
+        if condition is node.condition and then_body is node.then_body and else_body is node.else_body:
+            return node
+        return IfThenElse(condition, then_body, else_body)
+
+    #A variable bound to a literal is substituted into the body and the let disappears.
+    def optimize_LetIn(self, node):
+        var_value = self.visit(node.var_value)
+        if is_literal(var_value):
+            return self.visit(substitute(node.body, node.var_name, var_value))
+        body = self.visit(node.body)
+        if var_value is node.var_value and body is node.body:
+            return node
+        return LetIn(node.var_name, var_value, body)
+
+    def optimize_FunctionDef(self, node):
+        body = self.visit(node.body)
+        if body is node.body:
+            return node
+        return FunctionDef(node.name, node.params, body)
+
+    def optimize_Lambda(self, node):
+        body = self.visit(node.body)
+        if body is node.body:
+            return node
+        return Lambda(node.params, body)
+
+    def optimize_FunctionCall(self, node):
+        name = self.visit(node.name) if isinstance(node.name, Lambda) else node.name
+        arguments = [self.visit(arg) for arg in node.arguments]
+        if name is node.name and all(new is old for new, old in zip(arguments, node.arguments)):
+            return node
+        return FunctionCall(name, arguments)
+
+
+#Replaces the free occurrences of the variable name in node by replacement.
+#Stops where the name is rebound by a let, a lambda or a function definition.
+def substitute(node, name, replacement):
+    if isinstance(node, Identifier):
+        return replacement if node.value == name else node
+    if isinstance(node, BinOp):
+        return BinOp(substitute(node.left, name, replacement), node.op, substitute(node.right, name, replacement))
+    if isinstance(node, UnaryOp):
+        return UnaryOp(node.op, substitute(node.expr, name, replacement))
+    if isinstance(node, IfThenElse):
+        return IfThenElse(substitute(node.condition, name, replacement),
+                          substitute(node.then_body, name, replacement),
+                          substitute(node.else_body, name, replacement))
+    if isinstance(node, LetIn):
+        var_value = substitute(node.var_value, name, replacement)
+        body = node.body if node.var_name == name else substitute(node.body, name, replacement)
+        return LetIn(node.var_name, var_value, body)
+    if isinstance(node, FunctionDef):
+        if name in node.params:
+            return node
+        return FunctionDef(node.name, node.params, substitute(node.body, name, replacement))
+    if isinstance(node, Lambda):
+        if name in node.params:
+            return node
+        return Lambda(node.params, substitute(node.body, name, replacement))
+    if isinstance(node, FunctionCall):
+        callee = substitute(node.name, name, replacement) if isinstance(node.name, Lambda) else node.name
+        return FunctionCall(callee, [substitute(arg, name, replacement) for arg in node.arguments])
+    return node
+
+
+#Default maximum size (in nodes) of a function body that is inlined.
+DEFAULT_INLINE_SIZE = 20
+
+
+#Returns the names of the global functions called by name in a tree.
+def called_names(node, names=None):
+    if names is None:
+        names = set()
+    if isinstance(node, FunctionCall):
+        if isinstance(node.name, Lambda):
+            called_names(node.name, names)
+        else:
+            names.add(node.name)
+        for arg in node.arguments:
+            called_names(arg, names)
+    elif isinstance(node, BinOp):
+        called_names(node.left, names)
+        called_names(node.right, names)
+    elif isinstance(node, UnaryOp):
+        called_names(node.expr, names)
+    elif isinstance(node, IfThenElse):
+        called_names(node.condition, names)
+        called_names(node.then_body, names)
+        called_names(node.else_body, names)
+    elif isinstance(node, LetIn):
+        called_names(node.var_value, names)
+        called_names(node.body, names)
+    elif isinstance(node, (FunctionDef, Lambda)):
+        called_names(node.body, names)
+    return names
+
+
+#Returns the identifiers used in a tree that are not bound inside it.
+def free_variables(node, bound=frozenset()):
+    if isinstance(node, Identifier):
+        return set() if node.value in bound else {node.value}
+    if isinstance(node, BinOp):
+        return free_variables(node.left, bound) | free_variables(node.right, bound)
+    if isinstance(node, UnaryOp):
+        return free_variables(node.expr, bound)
+    if isinstance(node, IfThenElse):
+        return free_variables(node.condition, bound) | free_variables(node.then_body, bound) | \
+            free_variables(node.else_body, bound)
+    if isinstance(node, LetIn):
+        return free_variables(node.var_value, bound) | free_variables(node.body, bound | {node.var_name})
+    if isinstance(node, (FunctionDef, Lambda)):
+        return free_variables(node.body, bound | set(node.params))
+    if isinstance(node, FunctionCall):
+        result = free_variables(node.name, bound) if isinstance(node.name, Lambda) else set()
+        for arg in node.arguments:
+            result |= free_variables(arg, bound)
+        return result
+    return set()
+
+
+#Returns a fresh copy of a tree in which the variables in renames are renamed.
+#Copies never share nodes with the original, so the resolver can annotate them for their new position.
+def copy_tree(node, renames):
+    if isinstance(node, Identifier):
+        name = renames.get(node.value, node.value)
+        return Identifier(Token(TokenType.IDENTIFIER, name))
+    if isinstance(node, Num):
+        return Num(node.token)
+    if isinstance(node, Boolean):
+        return Boolean(node.token)
+    if isinstance(node, BinOp):
+        return BinOp(copy_tree(node.left, renames), node.op, copy_tree(node.right, renames))
+    if isinstance(node, UnaryOp):
+        return UnaryOp(node.op, copy_tree(node.expr, renames))
+    if isinstance(node, IfThenElse):
+        return IfThenElse(copy_tree(node.condition, renames), copy_tree(node.then_body, renames),
+                          copy_tree(node.else_body, renames))
+    if isinstance(node, LetIn):
+        inner = {name: new for name, new in renames.items() if name != node.var_name}
+        return LetIn(node.var_name, copy_tree(node.var_value, renames), copy_tree(node.body, inner))
+    if isinstance(node, Lambda):
+        inner = {name: new for name, new in renames.items() if name not in node.params}
+        return Lambda(node.params, copy_tree(node.body, inner))
+    if isinstance(node, FunctionCall):
+        callee = copy_tree(node.name, renames) if isinstance(node.name, Lambda) else node.name
+        return FunctionCall(callee, [copy_tree(arg, renames) for arg in node.arguments])
+    raise Exception(f'Cannot copy {type(node).__name__}')
+
+
+#Replaces calls to small, non-recursive global functions by their bodies.
+#A call f(a, b) of 'function f(x, y) => body' becomes 'let x' => a in let y' => b in body'', where x' and y'
+# are fresh names that cannot clash with user variables, so arguments are still evaluated once and in order.
+#A function is inlined if its body has at most max_size nodes, only uses its parameters, defines no
+# functions and cannot reach itself through calls.
+#Top-level function definitions remember which functions were inlined into them; when one of those is
+# redefined, define_function calls invalidate and the dependent function is defined again from its source.
+#Inlining runs after the interpreter's optimizer, which is applied again to each inlined body so that
+# calls with literal arguments fold down (square(3) becomes 9).
+class Inliner:
+
+    def __init__(self, interpreter, max_size=DEFAULT_INLINE_SIZE):
+        self.interpreter = interpreter
+        self.max_size = max_size
+        self.originals = {}   # name -> (FunctionDef as written, body that was defined)
+        self.dependents = {}  # callee name -> names of the functions it was inlined into
+        self.inlined = 0
+        self.fresh_names = 0
+
+    #Returns the tree with inlinable calls replaced.
+    def inline(self, tree):
+        if isinstance(tree, FunctionDef):
+            self.inlined_names = set()
+            self.defining = tree.name
+            body = self.visit(tree.body)
+            self.defining = None
+            if body is tree.body:
+                return tree
+            new_tree = FunctionDef(tree.name, tree.params, body)
+            self.originals[tree.name] = (tree, body)
+            for name in self.inlined_names:
+                self.dependents.setdefault(name, set()).add(tree.name)
+            return new_tree
+        self.defining = None
+        return self.visit(tree)
+
+    #Called when a function is defined. Functions that have the previous definition inlined are defined again.
+    def invalidate(self, function):
+        original = self.originals.get(function.name)
+        if original is not None and original[1] is not function.body:
+            # redefined from other source, there is nothing to rebuild it from any more
+            del self.originals[function.name]
+        for name in self.dependents.pop(function.name, ()):
+            if name in self.originals:
+                self.interpreter.interpret(self.inline(self.originals[name][0]))
+
+    #Returns the function to inline for a call, or None.
+    def inlinable(self, node):
+        if isinstance(node.name, Lambda) or node.name == self.defining:
+            return None
+        function = self.interpreter.global_env.get(node.name)
+        if function is None or function.name is None or len(function.params) != len(node.arguments):
+            return None
+        body = function.body
+        if count_nodes(body) > self.max_size or self.defines_functions(body):
+            return None
+        if free_variables(body, frozenset(function.params)):
+            return None
+        if self.is_recursive(function.name):
+            return None
+        return function
+
+    def defines_functions(self, node):
+        if isinstance(node, FunctionDef):
+            return True
+        if isinstance(node, BinOp):
+            return self.defines_functions(node.left) or self.defines_functions(node.right)
+        if isinstance(node, UnaryOp):
+            return self.defines_functions(node.expr)
+        if isinstance(node, IfThenElse):
+            return any(self.defines_functions(part) for part in (node.condition, node.then_body, node.else_body))
+        if isinstance(node, LetIn):
+            return self.defines_functions(node.var_value) or self.defines_functions(node.body)
+        if isinstance(node, Lambda):
+            return self.defines_functions(node.body)
+        if isinstance(node, FunctionCall):
+            callee = isinstance(node.name, Lambda) and self.defines_functions(node.name)
+            return callee or any(self.defines_functions(arg) for arg in node.arguments)
+        return False
+
+    #True if the function can call itself, directly or through other global functions.
+    def is_recursive(self, name):
+        global_env = self.interpreter.global_env
+        seen = set()
+        pending = list(called_names(global_env[name].body))
+        while pending:
+            callee = pending.pop()
+            if callee == name:
+                return True
+            if callee in seen or callee not in global_env:
+                continue
+            seen.add(callee)
+            if global_env[callee].body is not None:
+                pending.extend(called_names(global_env[callee].body))
+        return False
+
+    #Dispatches to the appropriate inline_* method based on the node type.
+    def visit(self, node):
+        method = getattr(self, f'inline_{type(node).__name__}', self.generic_inline)
+        return method(node)
+
+    #Leaves nodes without sub-expressions, and nested function definitions, unchanged.
+    #A nested definition can outlive the command, so it could not be rebuilt if an inlined function changed.
+    def generic_inline(self, node):
+        return node
+
+    def inline_FunctionCall(self, node):
+        arguments = [self.visit(arg) for arg in node.arguments]
+        function = self.inlinable(node)
+        if function is None:
+            name = self.visit(node.name) if isinstance(node.name, Lambda) else node.name
+            if name is node.name and all(new is old for new, old in zip(arguments, node.arguments)):
+                return node
+            return FunctionCall(name, arguments)
+
+        self.inlined += 1
+        self.inlined_names.add(function.name)
+        renames = {}
+        for param in function.params:
+            self.fresh_names += 1
+            renames[param] = f'{param}#{self.fresh_names}'
+        result = copy_tree(function.body, renames)
+        for param, arg in reversed(list(zip(function.params, arguments))):
+            result = LetIn(renames[param], arg, result)
+        if self.interpreter.optimizer is not None:
+            # through optimize, which forgets the nodes it optimized once done, like for any other tree
+            result = self.interpreter.optimizer.optimize(result)
+        return result
+
+    def inline_BinOp(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if left is node.left and right is node.right:
+            return node
+        return BinOp(left, node.op, right)
+
+    def inline_UnaryOp(self, node):
+        expr = self.visit(node.expr)
+        if expr is node.expr:
+            return node
+        return UnaryOp(node.op, expr)
+
+    def inline_IfThenElse(self, node):
+        condition = self.visit(node.condition)
+        then_body = self.visit(node.then_body)
+        else_body = self.visit(node.else_body)
+        if condition is node.condition and then_body is node.then_body and else_body is node.else_body:
+            return node
+        return IfThenElse(condition, then_body, else_body)
+
+    def inline_LetIn(self, node):
+        var_value = self.visit(node.var_value)
+        body = self.visit(node.body)
+        if var_value is node.var_value and body is node.body:
+            return node
+        return LetIn(node.var_name, var_value, body)
+
+    def inline_Lambda(self, node):
+        body = self.visit(node.body)
+        if body is node.body:
+            return node
+        return Lambda(node.params, body)
@@ -0,0 +1,229 @@
+from parser import AST, BinOp, UnaryOp, FunctionCall, FunctionDef, IfThenElse, LetIn, Lambda
+from interpreter import Interpreter, BINARY_OPERATORS
+from incremental import global_references
+import multiprocessing
+import os
+import pickle
+import time
+
+#Default minimum time in seconds a sub-expression must take to be worth running in another process.
+DEFAULT_THRESHOLD = 0.01
+
+#Maximum number of sub-expressions whose analysis and measured cost are remembered; both are
+# forgotten when there are more, so a long session does not keep every tree alive.
+MAX_REMEMBERED = 100000
+
+
+#State of a worker process: a serial interpreter and the version of the global environment it holds.
+worker_interpreter = None
+worker_version = None
+
+
+#Evaluates a pickled (node, frame) pair in a worker and returns its value, the error it raised and the
+# time it took. The global environment is only unpickled when it changed since the previous task.
+def run_task(version, globals_data, task_data):
+    global worker_interpreter, worker_version
+    if worker_interpreter is None:
+        worker_interpreter = Interpreter()
+    if version != worker_version:
+        worker_interpreter.global_env = pickle.loads(globals_data)
+        worker_version = version
+    node, env = pickle.loads(task_data)
+    start = time.perf_counter()
+    try:
+        return worker_interpreter.visit(node, env), None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+
+#Returns whether a sub-expression may run in another process and is worth it: it must call a function
+# (otherwise it is cheap) and must not define one (a definition changes the global environment here).
+def is_candidate(node):
+    calls = False
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        if node_type is FunctionDef:
+            return False
+        elif node_type is FunctionCall:
+            calls = True
+            if isinstance(node.name, AST):
+                stack.append(node.name)
+            stack.extend(node.arguments)
+        elif node_type is BinOp:
+            stack.append(node.left)
+            stack.append(node.right)
+        elif node_type is UnaryOp:
+            stack.append(node.expr)
+        elif node_type is IfThenElse:
+            stack.append(node.condition)
+            stack.append(node.then_body)
+            stack.append(node.else_body)
+        elif node_type is LetIn:
+            stack.append(node.var_value)
+            stack.append(node.body)
+        elif node_type is Lambda:
+            stack.append(node.body)
+    return calls
+
+
+#Tree-walking interpreter that evaluates independent sub-expressions in parallel.
+#The language has no side effects, so the operands of a binary operator and the arguments of a call can be
+# evaluated in any order. When at least two of them call functions and are expensive, they are sent to a
+# pool of worker processes, each running a serial Interpreter.
+#Whether a sub-expression is expensive is learned from profiling: the time each one took (in a worker or
+# here) is recorded, and those that took less than threshold seconds are evaluated here next time.
+#Sub-expressions never measured are assumed to be expensive only if they can reach a recursive function
+# (see can_recurse); others are evaluated here and measured, so small expressions never start the pool.
+#Values are used in the order of the sub-expressions and the first error is raised, so results and errors
+# are the same as with the serial Interpreter.
+#With resource limits on, everything is evaluated here, since the governor cannot count the work of the workers.
+class ParallelInterpreter(Interpreter):
+
+    def __init__(self, workers=None, threshold=DEFAULT_THRESHOLD):
+        super().__init__()
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self.pool = None
+        self.candidates = {}  # node -> is_candidate(node)
+        self.costs = {}  # node -> seconds its last evaluation took, or the estimate before the first one
+        self.recursive = {}  # global function name -> can_recurse(name), until the next definition
+        self.nested = 0  # > 0 while a sub-expression is evaluated here; nested sub-expressions stay serial
+        self.globals_key = None
+        self.globals_data = None
+        self.version = 0
+
+    #Starts the worker pool on first use; returns False when parallel evaluation is not possible.
+    def start_pool(self):
+        if self.pool is None:
+            if self.workers < 2:
+                return False
+            try:
+                self.pool = multiprocessing.Pool(self.workers)
+            except Exception:  # e.g. in a daemonic process, which may not have children
+                self.workers = 1
+                return False
+        return True
+
+    #Stops the worker pool, including any work still running in it.
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    #Returns the version number and the pickled global environment sent with each task.
+    #They change whenever a name is bound to a different value, which is found by comparing the values by identity.
+    def globals_payload(self):
+        key = list(self.global_env.items())
+        if key != self.globals_key:
+            self.globals_data = pickle.dumps(self.global_env)
+            self.globals_key = key
+            self.version += 1
+        return self.version, self.globals_data
+
+    #The functions that can recurse change with every definition.
+    def define_function(self, function):
+        super().define_function(function)
+        self.recursive.clear()
+
+    #Returns the global functions a call of the function name can reach through its body.
+    def callees(self, name):
+        found = set()
+        pending = [name]
+        while pending:
+            function = self.global_env.get(pending.pop())
+            if function is None or function.body is None:
+                continue
+            for callee in global_references(function.body):
+                if callee not in found:
+                    found.add(callee)
+                    pending.append(callee)
+        return found
+
+    #Returns whether a call of the global function name can recurse: whether it reaches a function that
+    # reaches itself. The number of calls of a function that cannot recurse is bounded by the size of the
+    # program, so it is cheap unless it runs a long loop in a built-in function.
+    def can_recurse(self, name):
+        recursive = self.recursive.get(name)
+        if recursive is None:
+            recursive = self.recursive[name] = any(
+                callee in self.callees(callee) for callee in self.callees(name) | {name})
+        return recursive
+
+    #Returns the measured cost of a sub-expression or, the first time, an estimate: expensive (threshold)
+    # if it can reach a recursive function, otherwise free.
+    def cost(self, node):
+        cost = self.costs.get(node)
+        if cost is None:
+            expensive = any(self.can_recurse(name) for name in global_references(node) if name in self.global_env)
+            cost = self.costs[node] = self.threshold if expensive else 0.0
+        return cost
+
+    def is_candidate(self, node):
+        candidate = self.candidates.get(node)
+        if candidate is None:
+            if len(self.candidates) >= MAX_REMEMBERED:
+                self.candidates.clear()
+                self.costs.clear()
+            candidate = self.candidates[node] = is_candidate(node)
+        return candidate
+
+    #Evaluates a sub-expression here; candidates are timed, and the sub-expressions they contain are
+    # evaluated serially.
+    def visit_here(self, node, env):
+        if not self.is_candidate(node):
+            return self.visit(node, env)
+        self.nested += 1
+        start = time.perf_counter()
+        try:
+            return self.visit(node, env)
+        finally:
+            self.costs[node] = time.perf_counter() - start
+            self.nested -= 1
+
+    #Evaluates independent sub-expressions and returns their values in order.
+    #Sub-expressions whose tree cannot be pickled (for example, one too deep) are evaluated here.
+    #When a sub-expression fails, the work started for the ones after it is stopped by restarting the pool,
+    # since the serial interpreter would not have evaluated them.
+    def visit_all(self, nodes, env):
+        if self.nested or self.governor is not None:
+            return [self.visit(node, env) for node in nodes]
+        threshold = self.threshold
+        expensive = [index for index, node in enumerate(nodes)
+                     if self.is_candidate(node) and self.cost(node) >= threshold]
+        if len(expensive) < 2 or not self.start_pool():
+            return [self.visit_here(node, env) for node in nodes]
+
+        version, globals_data = self.globals_payload()
+        tasks = {}
+        for index in expensive:
+            try:
+                task_data = pickle.dumps((nodes[index], env))
+            except Exception:
+                continue
+            tasks[index] = self.pool.apply_async(run_task, (version, globals_data, task_data))
+
+        values = []
+        try:
+            for index, node in enumerate(nodes):
+                task = tasks.get(index)
+                if task is None:
+                    values.append(self.visit_here(node, env))
+                    continue
+                value, error, elapsed = task.get()
+                self.costs[node] = elapsed
+                if error is not None:
+                    raise error
+                values.append(value)
+        except BaseException:
+            if not all(task.ready() for task in tasks.values()):
+                self.close()
+            raise
+        return values
+
+    def visit_BinOp(self, node, env):
+        if self.nested or self.governor is not None:
+            return super().visit_BinOp(node, env)
+        left, right = self.visit_all([node.left, node.right], env)
+        return BINARY_OPERATORS[node.op.type](left, right)
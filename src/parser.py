@@ -1,63 +1,101 @@
-from lexer import TokenType, Token
+from lexer import TokenType, Token, Kind, KINDS, TOKEN_TYPES, BOOLEAN_TOKENS
+from lists import LIST_FUNCTION, INDEX_FUNCTION
 
 #Base class for all AST nodes.
+#Nodes use __slots__ to keep large trees small; the annotation fields filled in by the resolver are slots too.
 class AST:
-    pass
+    __slots__ = ()
 
 
 #Represents binary operations (e.g., addition, multiplication).
 class BinOp(AST):
+    __slots__ = ('left', 'op', 'right', 'type')
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
+        self.type = None  # type of the operands ('int' or 'bool'), filled in by the type checker
 
 #Represents numeric literals.
+#Only the value is stored; the token is rebuilt on request.
 class Num(AST):
+    __slots__ = ('value',)
+
     def __init__(self, token):
-        self.token = token
         self.value = token.value
 
+    @property
+    def token(self):
+        return Token(TokenType.INTEGER, self.value)
+
 #Represents unary operations (e.g., negation).
 class UnaryOp(AST):
+    __slots__ = ('op', 'expr', 'type')
+
     def __init__(self, op, expr):
         self.op = op
         self.expr = expr
+        self.type = None  # type of the operand, filled in by the type checker
 
 #Represents function definitions.
 class FunctionDef(AST):
+    __slots__ = ('name', 'params', 'body', 'nlocals')
+
     def __init__(self, name, params, body):
         self.name = name
         self.params = params
         self.body = body
+        self.nlocals = None  # frame size, filled in by the resolver
 
 #Represents boolean literals.
 class Boolean(AST):
+    __slots__ = ('value',)
+
     def __init__(self, token):
-        self.token = token
         self.value = token.value
 
+    @property
+    def token(self):
+        return BOOLEAN_TOKENS[self.value]
+
 
 #Represents function calls.
 class FunctionCall(AST):
+    __slots__ = ('name', 'arguments', 'tail')
+
     def __init__(self, name, arguments):
         self.name = name
         self.arguments = arguments
+        self.tail = False  # set by the resolver for calls in tail position
 
 #Represents lambda expressions.
 class Lambda(AST):
+    __slots__ = ('params', 'body', 'nlocals')
+
     def __init__(self, params, body):
         self.params = params
         self.body = body
+        self.nlocals = None  # frame size, filled in by the resolver
 
 #Represents variable names or identifiers.
 class Identifier(AST):
+    __slots__ = ('value', 'depth', 'slot')
+
     def __init__(self, token):
-        self.token = token
         self.value = token.value
+        # lexical address (frames up, slot), filled in by the resolver; depth None means global
+        self.depth = None
+        self.slot = None
+
+    @property
+    def token(self):
+        return Token(TokenType.IDENTIFIER, self.value)
 
 #Represents if-then-else constructs.
 class IfThenElse(AST):
+    __slots__ = ('condition', 'then_body', 'else_body')
+
     def __init__(self, condition, then_body, else_body):
         self.condition = condition
         self.then_body = then_body
@@ -65,222 +103,287 @@ class IfThenElse(AST):
 
 #Represents let-in expressions.
 class LetIn(AST):
+    __slots__ = ('var_name', 'var_value', 'body', 'slot')
+
     def __init__(self, var_name, var_value, body):
         self.var_name = var_name
         self.var_value = var_value
         self.body = body
-
+        self.slot = None  # filled in by the resolver
+
+#Binding powers of the binary operators: the higher the power, the tighter the operator binds its operands.
+#All binary operators are left associative.
+BINDING_POWERS = {
+    TokenType.OR: 1,
+    TokenType.AND: 2,
+    TokenType.EQUAL: 3,
+    TokenType.NOT_EQUAL: 3,
+    TokenType.LESS_THAN: 3,
+    TokenType.GREATER_THAN: 3,
+    TokenType.LESS_THAN_OR_EQUAL: 3,
+    TokenType.GREATER_THAN_OR_EQUAL: 3,
+    TokenType.PLUS: 4,
+    TokenType.MINUS: 4,
+    TokenType.MULTIPLY: 5,
+    TokenType.DIVIDE: 5,
+    TokenType.MODULO: 5,
+}
+
+#The binding power of every kind code; 0 for tokens that are not binary operators, which ends an expression.
+KIND_POWERS = [BINDING_POWERS.get(token_type, 0) for token_type in TOKEN_TYPES]
+
+#Prefix operators, which bind tighter than any binary operator.
+UNARY_KINDS = frozenset(KINDS[token_type] for token_type in (TokenType.PLUS, TokenType.MINUS, TokenType.NOT))
+
+
+#A precedence climbing (Pratt) parser.
+#Binary operators are handled by a single loop in expr driven by BINDING_POWERS, so parsing an operand
+# takes two calls (expr and factor) whatever its precedence, and a chain of operators does not nest calls.
+#The parser works on the token arrays of Lexer.tokenize and only makes Token objects for the AST.
+#With share_nodes, structurally equal literals, variables and operator expressions are parsed into one
+# shared node (hash-consing), so repeated sub-expressions such as n - 1 are stored once.
 class Parser:
     #Initializes the parser with a lexer object.
-    def __init__(self, lexer):
+    #The whole input is tokenized up front, and the parser walks the token arrays by index.
+    def __init__(self, lexer, share_nodes=False):
         self.lexer = lexer
-        self.current_token = self.lexer.get_next_token()
-
-    #Raises an exception for invalid syntax
+        self.tokens = lexer.tokenize()
+        self.kinds = self.tokens.kinds
+        self.values = self.tokens.values
+        self.index = 0
+        self.last = len(self.kinds) - 1
+        self.shared = {} if share_nodes else None  # key -> shared node
+        self.canonical = set()  # the shared nodes
+        self.scope = 0
+        self.scope_count = 0
+
+    #The token at the current position.
+    @property
+    def current_token(self):
+        return self.tokens.token(self.index)
+
+    #Raises an exception for invalid syntax at the current token
     def error(self):
-        raise Exception('Invalid syntax')
+        raise Exception(f'Invalid syntax at {self.tokens.location(self.index)}')
 
-    #Consumes the current token if it matches the expected type.
-    def eat(self, token_type):
-        if self.current_token.type == token_type:
-            self.current_token = self.lexer.get_next_token()
+    #With node sharing on, returns the shared node equal to node, or makes node the shared one.
+    #Operators are only shared when their operands are. Variables are only shared within one scope,
+    # because the resolver stores the lexical address of a variable, which depends on the enclosing bindings.
+    def share(self, node):
+        if self.shared is None:
+            return node
+        node_type = type(node)
+        if node_type is Identifier:
+            key = (Identifier, self.scope, node.value)
+        elif node_type is BinOp:
+            if node.left not in self.canonical or node.right not in self.canonical:
+                return node
+            key = (BinOp, node.op, node.left, node.right)
+        elif node_type is UnaryOp:
+            if node.expr not in self.canonical:
+                return node
+            key = (UnaryOp, node.op, node.expr)
         else:
+            # the type of the value is part of the key because True == 1 in Python
+            key = (node_type, type(node.value), node.value)
+        existing = self.shared.get(key)
+        if existing is not None:
+            return existing
+        self.shared[key] = node
+        self.canonical.add(node)
+        return node
+
+    #Parses the body of a function, lambda or let, which binds new names: a new scope for node sharing.
+    def scope_body(self):
+        if self.shared is None:
+            return self.expr()
+        outer = self.scope
+        self.scope_count += 1
+        self.scope = self.scope_count
+        body = self.expr()
+        self.scope = outer
+        return body
+
+    #Moves to the next token; the parser stays on the final EOF token.
+    def advance(self):
+        if self.index < self.last:
+            self.index += 1
+
+    #Consumes the current token if it has the expected kind code (see lexer.Kind).
+    def eat(self, kind):
+        if self.kinds[self.index] != kind:
             self.error()
+        if self.index < self.last:
+            self.index += 1
+
+    #Consumes an identifier and returns its name.
+    def name(self):
+        name = self.values[self.index]
+        self.eat(Kind.IDENTIFIER)
+        return name
 
     #Parses the most basic elements of the language
     def factor(self):
-        token = self.current_token
-        if token.type == TokenType.INTEGER:
-            self.eat(TokenType.INTEGER)
-            return Num(token)
-        elif token.type == TokenType.BOOLEAN:
-            self.eat(TokenType.BOOLEAN)
-            return Boolean(token)
-        elif token.type == TokenType.LPAREN:
-            self.eat(TokenType.LPAREN)
-            if self.current_token.type == TokenType.LAMBDA:
+        kind = self.kinds[self.index]
+        if kind == Kind.INTEGER:
+            token = self.current_token
+            self.advance()
+            return self.share(Num(token))
+        elif kind == Kind.IDENTIFIER:
+            return self.subscripts(self.function_call_or_variable())
+        elif kind == Kind.LPAREN:
+            self.advance()
+            if self.kinds[self.index] == Kind.LAMBDA:
                 node = self.lambda_expression()
-                self.eat(TokenType.RPAREN)
-                if self.current_token.type == TokenType.LPAREN:
-                    return self.function_call(node)
+                self.eat(Kind.RPAREN)
+                if self.kinds[self.index] == Kind.LPAREN:
+                    return self.subscripts(self.function_call(node))
                 return node
             node = self.expr()
-            self.eat(TokenType.RPAREN)
-            return node
-        elif token.type == TokenType.PLUS:
-            self.eat(TokenType.PLUS)
-            return UnaryOp(token, self.factor())
-        elif token.type == TokenType.MINUS:
-            self.eat(TokenType.MINUS)
-            return UnaryOp(token, self.factor())
-        elif token.type == TokenType.NOT:
-            self.eat(TokenType.NOT)
-            return UnaryOp(token, self.factor())
-        elif token.type == TokenType.FUNCTION:
-            return self.function_definition()
-        elif token.type == TokenType.LAMBDA:
-            return self.lambda_expression()
-        elif token.type == TokenType.IDENTIFIER:
-            return self.function_call_or_variable()
-        elif token.type == TokenType.IF:
+            self.eat(Kind.RPAREN)
+            return self.subscripts(node)
+        elif kind == Kind.LBRACKET:
+            return self.subscripts(self.list_literal())
+        elif kind in UNARY_KINDS:
+            return self.unary_expr()
+        elif kind == Kind.BOOLEAN:
+            token = self.current_token
+            self.advance()
+            return self.share(Boolean(token))
+        elif kind == Kind.IF:
             return self.if_statement()
-        elif token.type == TokenType.LET:
+        elif kind == Kind.LET:
             return self.let_in_statement()
+        elif kind == Kind.LAMBDA:
+            return self.lambda_expression()
+        elif kind == Kind.FUNCTION:
+            return self.function_definition()
         else:
             self.error()
 
-    #Parses multiplication, division, and modulo operations.
-    def term(self):
+    #Parses prefix operators applied to a factor.
+    #A run of prefix operators (- - !x) is collected in a loop instead of by recursion.
+    def unary_expr(self):
+        operators = []
+        while self.kinds[self.index] in UNARY_KINDS:
+            operators.append(self.current_token)
+            self.advance()
         node = self.factor()
-
-        while self.current_token.type in (TokenType.MULTIPLY, TokenType.DIVIDE,TokenType.MODULO):
-            token = self.current_token
-            if token.type == TokenType.MULTIPLY:
-                self.eat(TokenType.MULTIPLY)
-            elif token.type == TokenType.DIVIDE:
-                self.eat(TokenType.DIVIDE)
-            elif token.type == TokenType.MODULO:
-                self.eat(TokenType.MODULO)
-
-            node = BinOp(left=node, op=token, right=self.factor())
-
-        return node
-
-    #Parses addition and subtraction operations.
-    def arithmetic_expr(self):
-        node = self.term()
-
-        while self.current_token.type in (TokenType.PLUS, TokenType.MINUS):
-            token = self.current_token
-            if token.type == TokenType.PLUS:
-                self.eat(TokenType.PLUS)
-            elif token.type == TokenType.MINUS:
-                self.eat(TokenType.MINUS)
-
-            node = BinOp(left=node, op=token, right=self.term())
-
-        return node
-
-    #Parses comparison operations
-    def comparison_expr(self):
-        node = self.arithmetic_expr()
-
-        while self.current_token.type in (TokenType.EQUAL, TokenType.NOT_EQUAL,
-                                          TokenType.LESS_THAN, TokenType.GREATER_THAN,
-                                          TokenType.LESS_THAN_OR_EQUAL, TokenType.GREATER_THAN_OR_EQUAL):
-            token = self.current_token
-            self.eat(self.current_token.type)
-            node = BinOp(left=node, op=token, right=self.arithmetic_expr())
-
+        for op in reversed(operators):
+            node = self.share(UnaryOp(op, node))
         return node
 
-    #Parses logical AND operations.
-    def and_expr(self):
-        node = self.comparison_expr()
-
-        while self.current_token.type == TokenType.AND:
-            token = self.current_token
-            self.eat(TokenType.AND)
-            node = BinOp(left=node, op=token, right=self.comparison_expr())
-
-        return node
-
-    #Parses logical OR operations.
-    def or_expr(self):
-        node = self.and_expr()
-
-        while self.current_token.type == TokenType.OR:
-            token = self.current_token
-            self.eat(TokenType.OR)
-            node = BinOp(left=node, op=token, right=self.and_expr())
-
+    #Parses an expression whose binary operators bind at least as tightly as min_power.
+    #Operators are consumed in a loop; the right operand of each is parsed with a minimum power one higher
+    # than its own, so operators of the same power associate to the left.
+    def expr(self, min_power=1):
+        kinds = self.kinds
+        node = self.factor()
+        power = KIND_POWERS[kinds[self.index]]
+        while power >= min_power:
+            op = self.current_token
+            self.advance()
+            node = self.share(BinOp(left=node, op=op, right=self.expr(power + 1)))
+            power = KIND_POWERS[kinds[self.index]]
         return node
 
-    #The entry point for parsing expressions, starts with the lowest precedence operations (OR).
-    def expr(self):
-        return self.or_expr()
-
     #Parses function definitions.
     def function_definition(self):
-        self.eat(TokenType.FUNCTION)
-        name = self.current_token.value
-        self.eat(TokenType.IDENTIFIER)
-        self.eat(TokenType.LPAREN)
+        self.eat(Kind.FUNCTION)
+        name = self.name()
+        self.eat(Kind.LPAREN)
         params = []
-        if self.current_token.type == TokenType.IDENTIFIER:
-            params.append(self.current_token.value)
-            self.eat(TokenType.IDENTIFIER)
-            while self.current_token.type == TokenType.COMMA:
-                self.eat(TokenType.COMMA)
-                params.append(self.current_token.value)
-                self.eat(TokenType.IDENTIFIER)
-        self.eat(TokenType.RPAREN)
-        self.eat(TokenType.ARROW)
-        body = self.expr()
+        if self.kinds[self.index] == Kind.IDENTIFIER:
+            params.append(self.name())
+            while self.kinds[self.index] == Kind.COMMA:
+                self.advance()
+                params.append(self.name())
+        self.eat(Kind.RPAREN)
+        self.eat(Kind.ARROW)
+        body = self.scope_body()
         return FunctionDef(name, params, body)
 
     #Parses lambda expressions.
     def lambda_expression(self):
-        self.eat(TokenType.LAMBDA)
-        param = self.current_token.value
-        self.eat(TokenType.IDENTIFIER)
-        self.eat(TokenType.ARROW)
-        body = self.expr()
+        self.eat(Kind.LAMBDA)
+        param = self.name()
+        self.eat(Kind.ARROW)
+        body = self.scope_body()
         lambda_node = Lambda([param], body)
 
         # Check if the lambda is immediately called
-        if self.current_token.type == TokenType.LPAREN:
-            self.eat(TokenType.LPAREN)
+        if self.kinds[self.index] == Kind.LPAREN:
+            self.advance()
             argument = self.expr()
-            self.eat(TokenType.RPAREN)
+            self.eat(Kind.RPAREN)
             return FunctionCall(lambda_node, [argument])
 
         return lambda_node
 
     #Parses function calls.
     def function_call(self, callable_expr):
-        self.eat(TokenType.LPAREN)
+        self.eat(Kind.LPAREN)
         arguments = []
-        if self.current_token.type != TokenType.RPAREN:
+        if self.kinds[self.index] != Kind.RPAREN:
             arguments.append(self.expr())
-            while self.current_token.type == TokenType.COMMA:
-                self.eat(TokenType.COMMA)
+            while self.kinds[self.index] == Kind.COMMA:
+                self.advance()
                 arguments.append(self.expr())
-        self.eat(TokenType.RPAREN)
+        self.eat(Kind.RPAREN)
         return FunctionCall(callable_expr, arguments)
 
+    #Parses list literals: [a, b, c] is a call of the built-in list function (see lists.py).
+    def list_literal(self):
+        self.eat(Kind.LBRACKET)
+        elements = []
+        if self.kinds[self.index] != Kind.RBRACKET:
+            elements.append(self.expr())
+            while self.kinds[self.index] == Kind.COMMA:
+                self.advance()
+                elements.append(self.expr())
+        self.eat(Kind.RBRACKET)
+        return FunctionCall(LIST_FUNCTION, elements)
+
+    #Parses the indexing that follows a variable, call, list or parenthesized expression, as in xs[i][j].
+    #Indexing is a call of the built-in nth function.
+    def subscripts(self, node):
+        while self.kinds[self.index] == Kind.LBRACKET:
+            self.advance()
+            index = self.expr()
+            self.eat(Kind.RBRACKET)
+            node = FunctionCall(INDEX_FUNCTION, [node, index])
+        return node
+
     #Determines whether an identifier is a function call or a variable.
     def function_call_or_variable(self):
         token = self.current_token
-        name = token.value
-        self.eat(TokenType.IDENTIFIER)
-        if self.current_token.type == TokenType.LPAREN:
-            return self.function_call(name)
-        return Identifier(token)
+        self.advance()
+        if self.kinds[self.index] == Kind.LPAREN:
+            return self.function_call(token.value)
+        return self.share(Identifier(token))
 
     #Parses if -then - else statements.
     def if_statement(self):
-        self.eat(TokenType.IF)
+        self.eat(Kind.IF)
         condition = self.expr()
-        self.eat(TokenType.THEN)
+        self.eat(Kind.THEN)
         then_body = self.expr()
-        self.eat(TokenType.ELSE)
+        self.eat(Kind.ELSE)
         else_body = self.expr()
         return IfThenElse(condition, then_body, else_body)
 
     #Parses let-in expressions.
     def let_in_statement(self):
-        self.eat(TokenType.LET)
-        var_name = self.current_token.value
-        self.eat(TokenType.IDENTIFIER)
-        self.eat(TokenType.ARROW)
+        self.eat(Kind.LET)
+        var_name = self.name()
+        self.eat(Kind.ARROW)
         var_value = self.expr()
-        self.eat(TokenType.IN)
-        body = self.expr()
+        self.eat(Kind.IN)
+        body = self.scope_body()
         return LetIn(var_name, var_value, body)
 
     #The main parsing method, starts the parsing process.
     def parse(self):
-        if self.current_token.type == TokenType.FUNCTION:
+        if self.kinds[self.index] == Kind.FUNCTION:
             return self.function_definition()
-        return self.expr()
\ No newline at end of file
+        return self.expr()
@@ -0,0 +1,115 @@
+import time
+
+
+#What the profiler recorded for one function (all definitions of a name) or one lambda.
+#inclusive is the time spent in the function including the functions it called, counted once for recursive
+# calls; exclusive leaves out the time of the calls it made. frames and slots count the environment frames
+# created for the calls and their total number of slots.
+class FunctionProfile:
+    __slots__ = ('name', 'calls', 'inclusive', 'exclusive', 'depth', 'max_depth', 'frames', 'slots')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        self.depth = 0  # calls of this function in progress
+        self.max_depth = 0
+        self.frames = 0
+        self.slots = 0
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'inclusive': self.inclusive,
+            'exclusive': self.exclusive,
+            'max_depth': self.max_depth,
+            'frames': self.frames,
+            'slots': self.slots,
+        }
+
+
+#Records calls to user functions and lambdas and counts the evaluated AST nodes by type.
+#While profiling, the interpreter runs every call through run and evaluates nodes through wrap_visit.
+#Both are installed as instance attributes (see Interpreter.enable_profiling), so when profiling is off
+# nothing is measured and nothing is slower.
+#Tail calls count as calls, but they do not increase the recursion depth.
+class Profiler:
+    def __init__(self):
+        self.functions = {}  # function name, or body of a lambda -> FunctionProfile
+        self.node_counts = {}  # AST node type name -> evaluations
+        self.active = []  # [time spent in calls made] of each call in progress
+        self.lambda_count = 0
+
+    #Returns the profile of a function; lambdas are told apart by their body and numbered in order of appearance.
+    def profile(self, function):
+        key = function.name if function.name is not None else function.body
+        profile = self.functions.get(key)
+        if profile is None:
+            if function.name is not None:
+                name = function.name
+            else:
+                self.lambda_count += 1
+                name = f"<lambda {', '.join(function.params)} #{self.lambda_count}>"
+            profile = self.functions[key] = FunctionProfile(name)
+        return profile
+
+    #Runs one call of a function body, like one iteration of Interpreter.call_function, and records it.
+    def run(self, interpreter, function, args):
+        profile = self.profile(function)
+        profile.calls += 1
+        frame = function.new_frame(args)
+        profile.frames += 1
+        profile.slots += len(frame.slots)
+        profile.depth += 1
+        if profile.depth > profile.max_depth:
+            profile.max_depth = profile.depth
+        calls_made = [0.0]
+        self.active.append(calls_made)
+        start = time.perf_counter()
+        try:
+            return interpreter.visit(function.body, frame)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.active.pop()
+            profile.exclusive += elapsed - calls_made[0]
+            profile.depth -= 1
+            if profile.depth == 0:
+                profile.inclusive += elapsed
+            if self.active:
+                self.active[-1][0] += elapsed
+
+    #Returns a version of visit(node, env) that counts the nodes it evaluates.
+    def wrap_visit(self, visit):
+        counts = self.node_counts
+
+        def counting_visit(node, env):
+            name = type(node).__name__
+            counts[name] = counts.get(name, 0) + 1
+            return visit(node, env)
+
+        return counting_visit
+
+    #Forgets everything recorded so far.
+    def reset(self):
+        self.functions.clear()
+        self.node_counts.clear()
+        self.lambda_count = 0
+
+    def stats(self):
+        return {
+            'functions': {profile.name: profile.stats() for profile in self.functions.values()},
+            'nodes': dict(self.node_counts),
+        }
+
+    #Returns a printable report: the functions by inclusive time, then the node counts.
+    def report(self):
+        lines = [f"{'function':<24} {'calls':>9} {'inclusive':>10} {'exclusive':>10} {'max depth':>9} {'frames':>9} {'slots':>9}"]
+        for profile in sorted(self.functions.values(), key=lambda profile: profile.inclusive, reverse=True):
+            lines.append(f"{profile.name:<24} {profile.calls:>9} {profile.inclusive:>9.4f}s {profile.exclusive:>9.4f}s "
+                         f"{profile.max_depth:>9} {profile.frames:>9} {profile.slots:>9}")
+        if self.node_counts:
+            lines.append('')
+            lines.append('nodes evaluated: ' + ', '.join(
+                f'{name}: {count}' for name, count in sorted(self.node_counts.items(), key=lambda item: -item[1])))
+        return '\n'.join(lines)
@@ -0,0 +1,177 @@
+from lexer import Lexer
+from parser import Parser
+from memo import LRUCache, MISSING
+import hashlib
+import hmac
+import os
+import pickle
+
+#Bump when the format of cache files changes.
+CACHE_VERSION = 2
+
+#Cache files are named after the path of the program, with this suffix (see cache_path).
+CACHE_SUFFIX = '.fcache'
+
+#Size in bytes of the secret key that signs the files of the cache directory, and of a signature.
+KEY_SIZE = 32
+SIGNATURE_SIZE = hashlib.sha256().digest_size
+
+#Default number of parsed commands kept in memory.
+DEFAULT_CACHE_ENTRIES = 1024
+
+#The modules that determine what a parsed (and optimized) tree looks like.
+#Their source is part of the cache version, so cache files are ignored after the interpreter changes.
+IMPLEMENTATION_MODULES = ('lexer.py', 'parser.py', 'optimizer.py', 'program_cache.py')
+
+
+#Returns a digest of the source of the given modules (by default, the implementation modules).
+def implementation_digest(modules=IMPLEMENTATION_MODULES):
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in modules:
+        with open(os.path.join(directory, module), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+MAGIC = f'functastic-cache-{CACHE_VERSION}-{implementation_digest()}'
+
+
+#Size of the blocks in which files are read.
+READ_SIZE = 1 << 16
+
+
+def source_digest(source):
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+#Returns the digest of a program file, read in blocks so the file is never held in memory.
+#Like source_digest, it depends only on the text of the program (line endings are not translated).
+def file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+#Returns the directory of the cache files of the current user, creating it if needed: $FUNCTASTIC_CACHE_DIR,
+# or functastic in $XDG_CACHE_HOME (by default ~/.cache).
+#Only the user may write to it, since its files are unpickled; a directory others can write to is refused.
+def cache_directory():
+    directory = os.environ.get('FUNCTASTIC_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'functastic')
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid'):
+        status = os.stat(directory)
+        if status.st_uid != os.getuid() or status.st_mode & 0o022:
+            raise Exception(f'The cache directory {directory} can be written by other users')
+    return directory
+
+
+#Returns the path of the file with the given suffix that holds data about a program file: the files of all
+# programs are kept in the cache directory, named after a digest of the absolute path of the program.
+def cache_path(filename, suffix):
+    return os.path.join(cache_directory(), source_digest(os.path.abspath(filename)) + suffix)
+
+
+#Returns the secret key of the cache directory, creating it on first use.
+def secret_key():
+    path = os.path.join(cache_directory(), 'key')
+    try:
+        file = open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb')
+    except FileExistsError:
+        with open(path, 'rb') as file:
+            key = file.read()
+        if len(key) != KEY_SIZE:
+            raise Exception(f'The cache key {path} is damaged')
+        return key
+    key = os.urandom(KEY_SIZE)
+    with file:
+        file.write(key)
+    return key
+
+
+#Writes data to a cache file, pickled and preceded by an HMAC of the pickle made with the secret key.
+def write_signed(path, data):
+    payload = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    signature = hmac.new(secret_key(), payload, hashlib.sha256).digest()
+    with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as file:
+        file.write(signature)
+        file.write(payload)
+
+
+#Returns the data of a cache file written by write_signed.
+#The signature is checked before anything is unpickled, so a file that was not written with the secret key
+# of the user (which could run any code when unpickled) raises an exception instead.
+def read_signed(path):
+    with open(path, 'rb') as file:
+        signature = file.read(SIGNATURE_SIZE)
+        payload = file.read()
+    if not hmac.compare_digest(signature, hmac.new(secret_key(), payload, hashlib.sha256).digest()):
+        raise Exception(f'The cache file {path} is not signed with the cache key')
+    return pickle.loads(payload)
+
+
+#Caches the trees of parsed commands so the same text is lexed and parsed only once.
+#Trees are kept in memory (for the REPL and repeated commands) and can be saved to and loaded from a
+# cache file of a program (see cache_path), so running the same program again skips lexing and parsing entirely.
+#Optimized trees are cached separately from plain ones. Parse errors are not cached.
+#With share_nodes, equal sub-expressions of a command are stored once (see Parser), which makes
+# the cached trees smaller.
+class ProgramCache:
+
+    def __init__(self, maxsize=DEFAULT_CACHE_ENTRIES, share_nodes=False):
+        self.trees = LRUCache(maxsize)
+        self.share_nodes = share_nodes
+        self.hits = 0
+        self.misses = 0
+
+    #Returns the tree of a command, parsing (and optimizing) it only if it is not cached.
+    def parse(self, text, optimizer=None):
+        key = (text, optimizer is not None)
+        tree = self.trees.get(key)
+        if tree is not MISSING:
+            self.hits += 1
+            return tree
+        self.misses += 1
+        tree = Parser(Lexer(text), self.share_nodes).parse()
+        if optimizer is not None:
+            tree = optimizer.optimize(tree)
+        self.trees.put(key, tree)
+        return tree
+
+    #Loads the cache file of a program into memory; digest is the file_digest of the program.
+    #Returns False if there is no usable cache file: it is missing, unreadable, not signed with the cache key,
+    # written by another version of the interpreter, or the program changed since it was written.
+    def load(self, filename, digest):
+        try:
+            data = read_signed(cache_path(filename, CACHE_SUFFIX))
+        except Exception:
+            return False
+        if not isinstance(data, dict) or data.get('magic') != MAGIC or data.get('source') != digest:
+            return False
+        for key, tree in data['trees']:
+            self.trees.put(key, tree)
+        return True
+
+    #Writes the cached trees to the cache file of a program; digest is the file_digest of the program.
+    #The cache is expected to hold the commands of that program only, as in program mode.
+    #Failures (read-only directory, trees too deep to pickle, ...) are ignored: the cache is only an optimization.
+    def save(self, filename, digest):
+        trees = list(self.trees.entries.items())
+        data = {'magic': MAGIC, 'source': digest, 'trees': trees}
+        try:
+            path = cache_path(filename, CACHE_SUFFIX)
+        except Exception:
+            return
+        try:
+            write_signed(path, data)
+        except Exception:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.trees)}
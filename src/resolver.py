@@ -0,0 +1,126 @@
+from parser import Lambda, IfThenElse, LetIn, FunctionCall
+
+
+#The names visible inside one function body (or top-level command) and the slots they live in.
+class Scope:
+    def __init__(self, params, parent):
+        self.parent = parent
+        self.bindings = {param: slot for slot, param in enumerate(params)}
+        self.nlocals = len(params)
+
+    def new_slot(self):
+        self.nlocals += 1
+        return self.nlocals - 1
+
+
+#Assigns every variable a lexical address before the tree is executed.
+#Each function call (and each top-level command) runs in a fixed-size frame linked to the frame the
+# function was defined in. Parameters and let variables get a slot in the frame of the enclosing function,
+# so an Identifier is annotated with (depth, slot): how many frames up to go and which slot to read.
+#Names that are not bound by any enclosing function are global (depth None).
+#It also marks the calls in tail position of each function body, which the engines run without
+# growing the Python stack.
+class Resolver:
+
+    #Resolves a top-level tree and returns the number of slots its frame needs.
+    def resolve(self, tree):
+        self.scope = Scope([], None)
+        self.visit(tree)
+        return self.scope.nlocals
+
+    #Dispatches to the appropriate resolve_* method based on the node type.
+    def visit(self, node):
+        method = getattr(self, f'resolve_{type(node).__name__}', self.generic_resolve)
+        return method(node)
+
+    #Raises an exception for unsupported node types.
+    def generic_resolve(self, node):
+        raise Exception(f'No resolve_{type(node).__name__} method')
+
+    #Resolves a function body in a new scope and returns the size of its frame.
+    def resolve_function(self, params, body):
+        outer = self.scope
+        self.scope = Scope(params, outer)
+        try:
+            self.visit(body)
+            self.mark_tail_calls(body)
+            return self.scope.nlocals
+        finally:
+            self.scope = outer
+
+    #Marks the calls whose value is the value of the whole function body:
+    # the branches of an if, the body of a let, or the body itself.
+    def mark_tail_calls(self, node):
+        while True:
+            if isinstance(node, IfThenElse):
+                self.mark_tail_calls(node.then_body)
+                node = node.else_body
+            elif isinstance(node, LetIn):
+                node = node.body
+            else:
+                if isinstance(node, FunctionCall):
+                    node.tail = True
+                return
+
+    #Literals do not reference any variables.
+    def resolve_Num(self, node):
+        pass
+
+    def resolve_Boolean(self, node):
+        pass
+
+    #Operators and conditionals only resolve their sub-expressions.
+    def resolve_BinOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def resolve_UnaryOp(self, node):
+        self.visit(node.expr)
+
+    #Looks for the innermost scope that binds the name.
+    def resolve_Identifier(self, node):
+        scope = self.scope
+        depth = 0
+        while scope is not None:
+            if node.value in scope.bindings:
+                node.depth = depth
+                node.slot = scope.bindings[node.value]
+                return
+            scope = scope.parent
+            depth += 1
+        node.depth = None
+        node.slot = None
+
+    def resolve_IfThenElse(self, node):
+        self.visit(node.condition)
+        self.visit(node.then_body)
+        self.visit(node.else_body)
+
+    #The variable gets a fresh slot; the previous binding of the name is restored after the body.
+    def resolve_LetIn(self, node):
+        self.visit(node.var_value)
+        node.slot = self.scope.new_slot()
+        bindings = self.scope.bindings
+        previous = bindings.get(node.var_name)
+        bindings[node.var_name] = node.slot
+        self.visit(node.body)
+        if previous is None:
+            del bindings[node.var_name]
+        else:
+            bindings[node.var_name] = previous
+
+    #Function bodies get their own scope; the frame size is stored on the node.
+    def resolve_FunctionDef(self, node):
+        node.nlocals = self.resolve_function(node.params, node.body)
+
+    def resolve_Lambda(self, node):
+        node.nlocals = self.resolve_function(node.params, node.body)
+
+    #Functions called by name are always looked up in the global environment, so only the arguments
+    # (and an immediately called lambda) are resolved.
+    def resolve_FunctionCall(self, node):
+        node.tail = False
+        if isinstance(node.name, Lambda):
+            self.visit(node.name)
+        for arg in node.arguments:
+            self.visit(arg)
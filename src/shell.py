@@ -1,10 +1,37 @@
-from lexer import Lexer, TokenType
+from lexer import Lexer
 from parser import Parser, BinOp, Num, FunctionDef, FunctionCall, Identifier, IfThenElse, LetIn, Boolean, Lambda, \
     UnaryOp
 from interpreter import Interpreter
+from closure_compiler import ClosureInterpreter
+from vm import VirtualMachine
+from stack_interpreter import StackInterpreter
+from flat import FlatInterpreter
+from parallel import ParallelInterpreter
+from lazy import LazyInterpreter
+from memo import DEFAULT_CACHE_SIZE
+from optimizer import Optimizer, Inliner
+from program_cache import ProgramCache, file_digest
+from incremental import IncrementalRunner
+from typechecker import TypeChecker
+import argparse
+import io
+import mmap
 import sys
 
 
+#The execution engines that can be selected with --engine or the 'engine' REPL command.
+#All of them share the Interpreter interface (global_env and interpret(tree)).
+ENGINES = {
+    'tree': Interpreter,
+    'closure': ClosureInterpreter,
+    'vm': VirtualMachine,
+    'stack': StackInterpreter,
+    'flat': FlatInterpreter,
+    'parallel': ParallelInterpreter,
+    'lazy': LazyInterpreter,
+}
+
+
 #This function recursively prints the Abstract Syntax Tree (AST).
 def print_ast(node, level=0):
     indent = '  ' * level
@@ -70,19 +97,31 @@ def print_ast(node, level=0):
 
 #This function tokenizes the input text and prints each token.
 def print_tokens(text):
-    lexer = Lexer(text)
-    while True:
-        token = lexer.get_next_token()
+    for token in Lexer(text).tokens():
         print(token)
-        if token.type == TokenType.EOF:
-            break
 
 
 #This is the core function that processes user input.
-#It tokenizes the input, parses it into an AST, and interprets the result.
-#If debug is True, it prints the tokens and AST before interpreting.
-def execute_command(interpreter, text, debug=False):
+#It tokenizes the input, parses it into an AST, optimizes it and inlines function calls if the interpreter
+# has an optimizer and an inliner, and interprets the result.
+#If a ProgramCache is given, text that was seen before is not lexed, parsed or optimized again.
+#If debug is True, it prints the tokens and AST before interpreting (debug mode does not use the cache).
+def execute_command(interpreter, text, debug=False, cache=None):
     try:
+        result = run_command(interpreter, text, debug, cache)
+        print(f"Result: {result}")
+        return result
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return None
+
+
+#Runs one command through the whole pipeline of execute_command and returns its result.
+#Errors are raised to the caller.
+def run_command(interpreter, text, debug=False, cache=None):
+    if cache is not None and not debug:
+        tree = cache.parse(text, interpreter.optimizer)
+    else:
         if debug:
             print("Tokens:")
             print_tokens(text)
@@ -95,57 +134,286 @@ def execute_command(interpreter, text, debug=False):
             print("\nAbstract Syntax Tree:")
             print_ast(tree)
 
-        result = interpreter.interpret(tree)
-        print(f"Result: {result}")
-        return result
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        return None
+        if interpreter.optimizer is not None:
+            tree = interpreter.optimizer.optimize(tree)
+            if debug:
+                print(f"\nOptimized Abstract Syntax Tree ({interpreter.optimizer.removed} nodes removed):")
+                print_ast(tree)
+
+    if interpreter.inliner is not None:
+        inlined = interpreter.inliner.inlined
+        tree = interpreter.inliner.inline(tree)
+        if debug and interpreter.inliner.inlined > inlined:
+            print(f"\nInlined Abstract Syntax Tree ({interpreter.inliner.inlined - inlined} calls inlined):")
+            print_ast(tree)
+
+    if interpreter.typechecker is not None:
+        type_text = interpreter.typechecker.check(tree)
+        if debug:
+            print(f"\nType: {type_text}")
+
+    return interpreter.interpret(tree)
+
+
+#Stops the worker processes the interpreter started, if any (see ParallelInterpreter.close).
+def close_interpreter(interpreter):
+    close = getattr(interpreter, 'close', None)
+    if close is not None:
+        close()
+
+
+#Handles the 'memo' REPL command: 'memo on [name,...]', 'memo off', or 'memo' to show the statistics.
+def memo_command(interpreter, words):
+    if not hasattr(interpreter, 'enable_memoization'):
+        print("Error: Memoization is not supported by this engine")
+    elif words[1:2] == ['on']:
+        names = words[2].split(',') if len(words) > 2 else None
+        interpreter.enable_memoization(names)
+        print(f"Memoizing {', '.join(names) if names else 'all functions'}")
+    elif words[1:2] == ['off']:
+        interpreter.disable_memoization()
+        print("Memoization off")
+    elif interpreter.memo_stats() is None:
+        print("Memoization is off")
+    else:
+        print(', '.join(f"{key}: {value}" for key, value in interpreter.memo_stats().items()))
+
+
+#Handles the 'profile' REPL command: 'profile on', 'profile off', 'profile reset', or 'profile' to show
+# what was recorded since profiling was turned on.
+def profile_command(interpreter, words):
+    if not hasattr(interpreter, 'enable_profiling'):
+        print("Error: Profiling is not supported by this engine")
+    elif words[1:] == ['on']:
+        try:
+            interpreter.enable_profiling()
+            print("Profiling on")
+        except Exception as e:
+            print(f"Error: {str(e)}")
+    elif words[1:] == ['off']:
+        interpreter.disable_profiling()
+        print("Profiling off")
+    elif interpreter.profiler is None:
+        print("Profiling is off")
+    elif words[1:] == ['reset']:
+        interpreter.profiler.reset()
+        print("Profile cleared")
+    else:
+        print(interpreter.profiler.report())
 
 
 #This function implements an interactive Read-Eval-Print Loop (REPL).
-def interactive_mode(interpreter):
+#Switching engines with 'engine <name>' starts over with an empty global environment.
+def interactive_mode(interpreter, cache=None):
     while True:
         try:
             text = input('Functastic> ')
             if text.lower() == 'exit':
                 break
-            if text.lower() == 'debug':
+            words = text.split()
+            if len(words) == 2 and words[0] == 'engine':
+                name = words[1]
+                if name in ENGINES:
+                    optimizer = interpreter.optimizer
+                    inline = interpreter.inliner is not None
+                    typecheck = interpreter.typechecker is not None
+                    governor = interpreter.governor
+                    close_interpreter(interpreter)
+                    interpreter = ENGINES[name]()
+                    interpreter.optimizer = optimizer
+                    if inline:
+                        interpreter.inliner = Inliner(interpreter)
+                    if typecheck:
+                        interpreter.typechecker = TypeChecker()
+                    if governor is not None:
+                        interpreter.enable_limits(**governor.limits())
+                    print(f"Using the '{name}' engine")
+                else:
+                    print(f"Error: Unknown engine '{name}', choose one of: {', '.join(ENGINES)}")
+            elif words and words[0] == 'memo' and len(words) <= 3:
+                memo_command(interpreter, words)
+            elif words and words[0] == 'profile' and len(words) <= 2:
+                profile_command(interpreter, words)
+            elif text.lower() == 'debug':
                 debug_text = input('debug> ')
                 execute_command(interpreter, debug_text, debug=True)
             else:
-                execute_command(interpreter, text)
+                execute_command(interpreter, text, cache=cache)
             print()
         except EOFError:
             break
+    close_interpreter(interpreter)
+
+
+#Size of the chunks in which programs that cannot be mapped into memory are read.
+CHUNK_SIZE = 1 << 16
+
+
+#Yields the commands (separated by semicolons) of a program read from a text file object, one at a time,
+# as soon as each is complete. Empty commands are skipped.
+#A semicolon cannot appear inside a token, so the text is cut at every semicolon without lexing it, and a
+# command may span any number of chunks. Only the current command is held in memory.
+def iter_commands(file, chunk_size=CHUNK_SIZE):
+    pending = []
+    for chunk in iter(lambda: file.read(chunk_size), ''):
+        parts = chunk.split(';')
+        if len(parts) == 1:
+            pending.append(chunk)
+            continue
+        pending.append(parts[0])
+        for command in [''.join(pending)] + parts[1:-1]:
+            command = command.strip()
+            if command:
+                yield command
+        pending = [parts[-1]]
+    command = ''.join(pending).strip()
+    if command:
+        yield command
+
+
+#Yields the commands of a program file ('-' for standard input) one at a time, like iter_commands.
+#Regular files are mapped into memory and each command is decoded straight from the mapping.
+def read_commands(filename):
+    if filename == '-':
+        yield from iter_commands(sys.stdin)
+        return
+    with open(filename, 'rb') as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):  # empty files and pipes cannot be mapped
+            data = None
+        if data is None:
+            yield from iter_commands(io.TextIOWrapper(file, encoding='utf-8'))
+            return
+        with data:
+            start = 0
+            size = len(data)
+            while start <= size:
+                end = data.find(b';', start)
+                if end < 0:
+                    end = size
+                command = data[start:end].decode('utf-8').strip()
+                if command:
+                    yield command
+                start = end + 1
+
+
+#Loads the cache file of a program and returns the digest of the program, which is needed to save the cache.
+#Returns None if there is no cache or the program is read from standard input.
+def load_program_cache(cache, filename):
+    if cache is None or filename == '-':
+        return None
+    digest = file_digest(filename)
+    cache.load(filename, digest)
+    return digest
 
 
 #This function reads a program from a file and executes it.
-#It splits the program into commands (separated by semicolons) and executes each command.
-def program_mode(interpreter, filename):
-    with open(filename, 'r') as file:
-        program = file.read()
-
-    commands = program.split(';')
-    for command in commands:
-        command = command.strip()  #method used to remove leading and trailing whitespace from a string.
-        if command:
+#Commands (separated by semicolons) are read and executed one at a time (see read_commands), so the first
+# results appear right away and the program is never held in memory as a whole.
+#If a ProgramCache is given, the parsed commands are loaded from (and saved to) the cache file of the program
+# (see program_cache.cache_path).
+def program_mode(interpreter, filename, cache=None):
+    digest = load_program_cache(cache, filename)
+    misses = cache.misses if cache is not None else 0
+    try:
+        for command in read_commands(filename):
+            print(f"Executing: {command}")
+            execute_command(interpreter, command, cache=cache)
+            print()
+    finally:
+        close_interpreter(interpreter)
+
+    # save only if something had to be parsed, so unchanged programs do not rewrite their cache file
+    if digest is not None and cache.misses > misses:
+        cache.save(filename, digest)
+
+
+#This function runs a program like program_mode, but reuses the results of the commands that did not change
+# since the last run, which are kept in a result file of the program (see incremental.IncrementalRunner).
+def incremental_mode(interpreter, filename, cache=None):
+    digest = load_program_cache(cache, filename)
+    misses = cache.misses if cache is not None else 0
+    runner = IncrementalRunner(interpreter, cache)
+    runner.load(filename)
+    try:
+        for command in read_commands(filename):
             print(f"Executing: {command}")
-            execute_command(interpreter, command)
+            ok, text = runner.run(command, run_command)
+            print(f"Result: {text}" if ok else f"Error: {text}")
             print()
+    finally:
+        close_interpreter(interpreter)
+    print(f"{runner.evaluated} commands evaluated, {runner.reused} results reused")
+
+    runner.save(filename)
+    if digest is not None and cache.misses > misses:
+        cache.save(filename, digest)
+
+
+#Adds the options that select and configure the execution engine (also used by batch.py).
+def add_engine_arguments(arg_parser):
+    arg_parser.add_argument('--engine', choices=ENGINES, default='tree', help='execution engine')
+    arg_parser.add_argument('--optimize', action='store_true', help='fold constants and simplify each command before running it')
+    arg_parser.add_argument('--inline', action='store_true', help='inline calls to small non-recursive functions')
+    arg_parser.add_argument('--memoize', action='store_true', help='cache the results of all user functions')
+    arg_parser.add_argument('--memoize-only', metavar='NAMES', help='cache the results of a comma-separated list of functions')
+    arg_parser.add_argument('--memo-size', type=int, default=DEFAULT_CACHE_SIZE, help='maximum number of cached results')
+    arg_parser.add_argument('--typecheck', action='store_true', help='infer the types of each command and report type errors before running it')
+    arg_parser.add_argument('--fuel', type=int, metavar='STEPS', help='stop a command after this many evaluation steps')
+    arg_parser.add_argument('--time-limit', type=float, metavar='SECONDS', help='stop a command after this many seconds')
+    arg_parser.add_argument('--max-depth', type=int, help='maximum number of nested function calls')
+    arg_parser.add_argument('--max-cells', type=int, help='maximum number of list cells a command can build')
+
+
+#Creates the interpreter described by the options of add_engine_arguments.
+def make_interpreter(args):
+    interpreter = ENGINES[args.engine]()
+    if args.optimize:
+        interpreter.optimizer = Optimizer()
+    if args.inline:
+        interpreter.inliner = Inliner(interpreter)
+    if args.typecheck:
+        interpreter.typechecker = TypeChecker()
+    if args.memoize or args.memoize_only:
+        if not hasattr(interpreter, 'enable_memoization'):
+            raise Exception(f"the '{args.engine}' engine does not support memoization")
+        interpreter.enable_memoization(args.memoize_only.split(',') if args.memoize_only else None, args.memo_size)
+    if any(limit is not None for limit in (args.fuel, args.time_limit, args.max_depth, args.max_cells)):
+        interpreter.enable_limits(args.fuel, args.time_limit, args.max_depth, args.max_cells)
+    return interpreter
 
 
 #This is the entry point of the script.
 def main():
-    interpreter = Interpreter()
+    arg_parser = argparse.ArgumentParser(description='Functastic interpreter')
+    arg_parser.add_argument('filename', nargs='?', help="program file to run ('-' for standard input, omit for interactive mode)")
+    add_engine_arguments(arg_parser)
+    arg_parser.add_argument('--no-cache', action='store_true', help='parse every command again instead of using the program cache')
+    arg_parser.add_argument('--incremental', action='store_true', help='only run the commands of the program that changed since the last run')
+    arg_parser.add_argument('--share-nodes', action='store_true', help='store equal sub-expressions of cached trees once')
+    args = arg_parser.parse_args()
 
-    if len(sys.argv) > 1:
+    try:
+        interpreter = make_interpreter(args)
+    except Exception as e:
+        arg_parser.error(str(e))
+    if args.incremental and args.filename in (None, '-'):
+        arg_parser.error("--incremental needs a program file")
+    if args.no_cache and args.share_nodes:
+        arg_parser.error("--share-nodes applies to the program cache and cannot be used with --no-cache")
+    cache = None if args.no_cache else ProgramCache(share_nodes=args.share_nodes)
+
+    if args.filename:
         # Program mode
-        program_mode(interpreter, sys.argv[1])
+        if args.incremental:
+            incremental_mode(interpreter, args.filename, cache)
+        else:
+            program_mode(interpreter, args.filename, cache)
     else:
         # Interactive mode
         print("Interactive mode. Type 'exit' to quit. Type 'debug' to enter debug mode.")
-        interactive_mode(interpreter)
+        interactive_mode(interpreter, cache)
 
 
 if __name__ == '__main__':
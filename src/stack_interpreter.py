@@ -0,0 +1,175 @@
+from parser import BinOp, Num, FunctionDef, FunctionCall, Identifier, IfThenElse, LetIn, Boolean, Lambda, UnaryOp
+from interpreter import Interpreter, Frame, BINARY_OPERATORS, UNARY_OPERATORS
+from memo import MISSING
+from lists import Builtin, find_builtin
+
+#Kinds of entries on the work stack.
+EVAL = 0       #evaluate node in env and push its value
+BINARY = 1     #pop two values and apply the operator of the BinOp node
+UNARY = 2      #pop one value and apply the operator of the UnaryOp node
+BRANCH = 3     #pop the condition and evaluate the matching branch of the IfThenElse node
+BIND = 4       #pop the let value into its slot and evaluate the LetIn body
+CALL = 5       #pop the arguments and evaluate the function body in a new frame
+MEMO = 6       #store the value on top of the value stack in the memoization cache under key
+LEAVE = 7      #leave a call, for the depth counted by the governor
+
+#Default maximum number of pending entries on the work stack (each one is a small tuple).
+DEFAULT_STACK_LIMIT = 5_000_000
+
+
+#Interpreter that evaluates the AST with an explicit work stack instead of Python recursion.
+#Every pending step lives in a list on the heap, so the recursion depth of a Functastic program is
+# bounded by stack_limit (memory) rather than by sys.getrecursionlimit().
+#Calls in tail position leave nothing pending, so they run in constant space without special handling.
+class StackInterpreter(Interpreter):
+
+    def __init__(self, stack_limit=DEFAULT_STACK_LIMIT):
+        super().__init__()
+        self.stack_limit = stack_limit
+
+    #Evaluates a node and returns its value.
+    def visit(self, node, env):
+        return self.evaluate(node, env)
+
+    #Runs a function body through the work stack.
+    #Calls made inside the loop do not come through here; they are memoized by the CALL and MEMO entries.
+    def call_function(self, function, args):
+        return self.evaluate(function.body, function.new_frame(args))
+
+    #Calls made inside the loop are counted by the CALL entries; the governor only needs to count the calls
+    # made by built-in functions, which come through call_function.
+    def install_governor(self):
+        self.call_function = self.governed_call_function
+
+    def governed_call_function(self, function, args):
+        governor = self.governor
+        governor.enter()
+        try:
+            governor.step()
+            return self.evaluate(function.body, function.new_frame(args))
+        finally:
+            governor.leave()
+
+    #The evaluation loop: pops work entries until none are left, leaving the result on the value stack.
+    def evaluate(self, node, env):
+        global_env = self.global_env
+        stack_limit = self.stack_limit
+        governor = self.governor
+        work = [(EVAL, node, env)]
+        push = work.append
+        values = []
+        push_value = values.append
+        pop_value = values.pop
+
+        while work:
+            kind, node, env = work.pop()
+
+            if kind == EVAL:
+                node_type = type(node)
+                if node_type is Identifier:
+                    depth = node.depth
+                    if depth is None:
+                        if node.value not in global_env:
+                            raise Exception(f"Variable '{node.value}' is not defined")
+                        push_value(global_env[node.value])
+                    else:
+                        while depth:
+                            env = env.parent
+                            depth -= 1
+                        push_value(env.slots[node.slot])
+                elif node_type is Num or node_type is Boolean:
+                    push_value(node.value)
+                elif node_type is BinOp:
+                    push((BINARY, node, env))
+                    push((EVAL, node.right, env))
+                    push((EVAL, node.left, env))
+                elif node_type is FunctionCall:
+                    if isinstance(node.name, Lambda):
+                        function = self.visit_Lambda(node.name, env)
+                    else:
+                        function = global_env.get(node.name)
+                        if function is None:
+                            function = find_builtin(node.name, len(node.arguments))
+                        elif len(function.params) != len(node.arguments):
+                            raise Exception(f"Expected {len(function.params)} arguments, got {len(node.arguments)}")
+                    if len(work) > stack_limit:
+                        raise Exception(f'Stack limit of {stack_limit} entries exceeded')
+                    # the CALL entry carries the function in place of the environment
+                    push((CALL, node, function))
+                    for arg in reversed(node.arguments):
+                        push((EVAL, arg, env))
+                elif node_type is IfThenElse:
+                    push((BRANCH, node, env))
+                    push((EVAL, node.condition, env))
+                elif node_type is LetIn:
+                    push((BIND, node, env))
+                    push((EVAL, node.var_value, env))
+                elif node_type is UnaryOp:
+                    push((UNARY, node, env))
+                    push((EVAL, node.expr, env))
+                elif node_type is Lambda:
+                    push_value(self.visit_Lambda(node, env))
+                elif node_type is FunctionDef:
+                    push_value(self.visit_FunctionDef(node, env))
+                else:
+                    self.generic_visit(node, env)
+
+            elif kind == BINARY:
+                right = pop_value()
+                values[-1] = BINARY_OPERATORS[node.op.type](values[-1], right)
+            elif kind == BRANCH:
+                push((EVAL, node.then_body if pop_value() else node.else_body, env))
+            elif kind == CALL:
+                function = env
+                arg_count = len(node.arguments)
+                if arg_count:
+                    args = values[-arg_count:]
+                    del values[-arg_count:]
+                else:
+                    args = []
+                if type(function) is Builtin:
+                    push_value(function.run(self, args))
+                    continue
+                # lambdas ignore extra arguments, like in the tree-walker
+                if arg_count != len(function.params):
+                    if arg_count < len(function.params):
+                        raise Exception(f"Expected {len(function.params)} arguments, got {arg_count}")
+                    del args[len(function.params):]
+                if governor is not None:
+                    governor.step()
+                    # a call in tail position finds the LEAVE entry of its caller on top: it does not nest
+                    if not work or work[-1][0] != LEAVE:
+                        governor.enter()
+                        push((LEAVE, None, None))
+                if self.memoizer is not None:
+                    key = self.memoizer.key(function, args)
+                    if key is None:
+                        self.memoizer.bypassed += 1
+                    else:
+                        result = self.memoizer.cache.get(key)
+                        if result is not MISSING:
+                            self.memoizer.hits += 1
+                            push_value(result)
+                            continue
+                        self.memoizer.misses += 1
+                        push((MEMO, key, None))
+                push((EVAL, function.body, function.new_frame(args)))
+            elif kind == BIND:
+                env.slots[node.slot] = pop_value()
+                push((EVAL, node.body, env))
+            elif kind == UNARY:
+                values[-1] = UNARY_OPERATORS[node.op.type](values[-1])
+            elif kind == MEMO:
+                # node holds the cache key here
+                self.memoizer.cache.put(node, values[-1])
+            elif kind == LEAVE:
+                governor.leave()
+
+        return values[0]
+
+    #The main entry point for interpretation, within the limits of the governor if there is one.
+    def interpret(self, tree):
+        nlocals = self.resolver.resolve(tree)
+        if self.governor is not None:
+            return self.governor.run(self.evaluate, tree, Frame([None] * nlocals, None))
+        return self.evaluate(tree, Frame([None] * nlocals, None))
@@ -0,0 +1,506 @@
+from lexer import TokenType
+from parser import Lambda
+from lists import LIST_FUNCTION, INDEX_FUNCTION
+
+#Operators on integers giving an integer, and comparisons of integers giving a boolean.
+ARITHMETIC_OPERATORS = (TokenType.PLUS, TokenType.MINUS, TokenType.MULTIPLY, TokenType.DIVIDE, TokenType.MODULO)
+COMPARISON_OPERATORS = (TokenType.LESS_THAN, TokenType.GREATER_THAN, TokenType.LESS_THAN_OR_EQUAL,
+                        TokenType.GREATER_THAN_OR_EQUAL)
+EQUALITY_OPERATORS = (TokenType.EQUAL, TokenType.NOT_EQUAL)
+LOGICAL_OPERATORS = (TokenType.AND, TokenType.OR)
+
+
+#A type variable: an unknown type, or the type it was found to be (instance).
+class TypeVariable:
+    __slots__ = ('instance',)
+
+    def __init__(self):
+        self.instance = None
+
+
+#A type built from other types: int and bool have none, a list has its element type and a function has
+# the types of its parameters followed by the type of its result.
+#'definition' is the type of a function definition, whose value is the message it prints.
+class TypeOperator:
+    __slots__ = ('name', 'types')
+
+    def __init__(self, name, types=()):
+        self.name = name
+        self.types = types
+
+
+INT = TypeOperator('int')
+BOOL = TypeOperator('bool')
+DEFINITION = TypeOperator('definition')
+
+
+def list_type(element):
+    return TypeOperator('list', (element,))
+
+
+def function_type(params, result):
+    return TypeOperator('function', tuple(params) + (result,))
+
+
+#The type a variable or global name stands for. The type variables in generic are replaced by fresh ones
+# each time the name is used, so a function such as lambda x => x can be used with any type.
+#A pending scheme is the type of a function that is called before it is defined: the definition must
+# have that type.
+class Scheme:
+    __slots__ = ('generic', 'type', 'pending')
+
+    def __init__(self, generic, type, pending=False):
+        self.generic = generic
+        self.type = type
+        self.pending = pending
+
+
+#Returns the type a type variable stands for, following the chain of instances.
+def prune(t):
+    while type(t) is TypeVariable and t.instance is not None:
+        t = t.instance
+    return t
+
+
+#Returns whether the type variable v appears in t.
+def occurs_in(v, t):
+    pending = [t]
+    while pending:
+        t = prune(pending.pop())
+        if t is v:
+            return True
+        if type(t) is TypeOperator:
+            pending.extend(t.types)
+    return False
+
+
+#Returns the type variables in t that are not yet known.
+def type_variables(t, found=None):
+    found = [] if found is None else found
+    pending = [t]
+    while pending:
+        t = prune(pending.pop())
+        if type(t) is TypeVariable:
+            if t not in found:
+                found.append(t)
+        else:
+            pending.extend(reversed(t.types))
+    return found
+
+
+#Writes a type the way it is shown in error messages: int, bool, [int], (int, bool) -> int, with unknown
+# types named a, b, c... in order of appearance.
+def show_types(*types):
+    names = {}
+    for t in types:
+        for v in type_variables(t):
+            if v not in names:
+                names[v] = chr(ord('a') + len(names) % 26) + (str(len(names) // 26) if len(names) >= 26 else '')
+
+    def show(t):
+        t = prune(t)
+        if type(t) is TypeVariable:
+            return names[t]
+        if t.name == 'list':
+            return f'[{show(t.types[0])}]'
+        if t.name == 'function':
+            return f"({', '.join(show(param) for param in t.types[:-1])}) -> {show(t.types[-1])}"
+        return t.name
+
+    return [show(t) for t in types]
+
+
+#Returns whether two types are the same, unknown parts included.
+def same_type(a, b):
+    pending = [(a, b)]
+    while pending:
+        a, b = pending.pop()
+        a = prune(a)
+        b = prune(b)
+        if a is b:
+            continue
+        if type(a) is TypeVariable or type(b) is TypeVariable or a.name != b.name or len(a.types) != len(b.types):
+            return False
+        pending.extend(zip(a.types, b.types))
+    return True
+
+
+#Returns whether a type is an instance of a scheme: the generic type variables of the scheme can be
+# replaced so that it becomes the type. The other unknown parts of both must be the same.
+def is_instance(t, scheme):
+    replacements = {}
+    pending = [(scheme.type, t)]
+    while pending:
+        general, specific = pending.pop()
+        general = prune(general)
+        specific = prune(specific)
+        if type(general) is TypeVariable and general in scheme.generic:
+            replacement = replacements.setdefault(general, specific)
+            if not same_type(replacement, specific):
+                return False
+        elif general is specific:
+            continue
+        elif type(general) is TypeVariable or type(specific) is TypeVariable:
+            return False
+        elif general.name != specific.name or len(general.types) != len(specific.types):
+            return False
+        else:
+            pending.extend(zip(general.types, specific.types))
+    return True
+
+
+#Raised when two types cannot be made equal; the caller describes where it happened.
+class Mismatch(Exception):
+    pass
+
+
+#The types of the built-in functions (see lists.BUILTINS); a, b stand for any type.
+def builtin_schemes():
+    def generic(make):
+        a, b = TypeVariable(), TypeVariable()
+        return Scheme([a, b], make(a, b))
+
+    return {
+        INDEX_FUNCTION: generic(lambda a, b: function_type([list_type(a), INT], a)),
+        'nth': generic(lambda a, b: function_type([list_type(a), INT], a)),
+        'length': generic(lambda a, b: function_type([list_type(a)], INT)),
+        'cons': generic(lambda a, b: function_type([a, list_type(a)], list_type(a))),
+        'append': generic(lambda a, b: function_type([list_type(a), list_type(a)], list_type(a))),
+        'head': generic(lambda a, b: function_type([list_type(a)], a)),
+        'tail': generic(lambda a, b: function_type([list_type(a)], list_type(a))),
+        'map': generic(lambda a, b: function_type([function_type([a], b), list_type(a)], list_type(b))),
+        'filter': generic(lambda a, b: function_type([function_type([a], BOOL), list_type(a)], list_type(a))),
+        'reduce': generic(lambda a, b: function_type([function_type([b, a], b), b, list_type(a)], b)),
+        'range': generic(lambda a, b: function_type([INT, INT], list_type(INT))),
+    }
+
+
+#Hindley-Milner type inference for Functastic commands.
+#Every expression has one type: int, bool, a list of one element type, or a function from its parameter
+# types to its result type. Unlike the interpreter, which follows Python, the checker does not mix them:
+# arithmetic and comparisons take integers, && || ! and conditions take booleans, and == compares values
+# of the same type. Functions and let variables are generic (let-polymorphism), so they can be used at
+# different types.
+#The types of the global functions are kept from command to command. A function may call functions that
+# are defined later: their type is inferred from the calls and the definition must agree with it. A function
+# that is defined again can change its type: the definitions using it are checked again, and those that no
+# longer type-check cannot be used until they are defined again.
+#check raises an exception describing the first type error, and leaves everything as it was before the command.
+#Checked trees are annotated for the engines: BinOp and UnaryOp nodes get the type of their operands
+# ('int' or 'bool', None when it can differ between calls).
+class TypeChecker:
+
+    def __init__(self):
+        self.globals = builtin_schemes()  # global name -> Scheme
+        self.trail = []  # the type variables given an instance by the command, so a failed command can be undone
+        self.locals = {}  # name -> Scheme of the variables in scope
+        self.annotations = []
+        self.depth = 0  # function definitions being checked, around the current node
+        self.definitions = {}  # global function name -> (FunctionDef, names of the globals its body uses)
+        self.broken = {}  # global function name -> the type error of a definition that no longer type-checks
+        self.used = None  # the global names used by the definition being checked
+
+    #Checks a command and returns its type as text; raises an exception if it has a type error.
+    def check(self, tree):
+        saved = dict(self.globals), dict(self.definitions), dict(self.broken)
+        self.trail = []
+        self.locals = {}
+        self.annotations = []
+        self.depth = 0
+        self.used = None
+        try:
+            result = self.visit(tree)
+        except BaseException:
+            for variable in self.trail:
+                variable.instance = None
+            self.globals, self.definitions, self.broken = saved
+            raise
+        finally:
+            self.locals = {}
+            self.trail = []
+        for node, operand in self.annotations:
+            operand = prune(operand)
+            node.type = operand.name if operand is INT or operand is BOOL else None
+        self.annotations = []
+        return show_types(result)[0]
+
+    #Makes two types equal by giving their unknown parts an instance.
+    def unify(self, a, b):
+        pending = [(a, b)]
+        while pending:
+            a, b = pending.pop()
+            a = prune(a)
+            b = prune(b)
+            if a is b:
+                continue
+            if type(a) is TypeVariable:
+                if occurs_in(a, b):
+                    raise Mismatch()
+                a.instance = b
+                self.trail.append(a)
+            elif type(b) is TypeVariable:
+                pending.append((b, a))
+            elif a.name != b.name or len(a.types) != len(b.types):
+                raise Mismatch()
+            else:
+                pending.extend(zip(a.types, b.types))
+
+    #Unifies the type found for something with the type it must have, or raises a type error.
+    def expect(self, actual, expected, what):
+        try:
+            self.unify(actual, expected)
+        except Mismatch:
+            expected_text, actual_text = show_types(expected, actual)
+            raise Exception(f'Type error: {what} must be {expected_text}, got {actual_text}')
+
+    #Returns a type for one use of a scheme, with fresh type variables for the generic ones.
+    def instantiate(self, scheme):
+        if not scheme.generic:
+            return scheme.type
+        copies = {}
+        for variable in scheme.generic:
+            copies[variable] = TypeVariable()
+
+        def copy(t):
+            t = prune(t)
+            if type(t) is TypeVariable:
+                return copies.get(t, t)
+            if not t.types:
+                return t
+            return TypeOperator(t.name, tuple(copy(part) for part in t.types))
+
+        return copy(scheme.type)
+
+    #Returns the scheme of a type whose unknown parts do not depend on any variable in scope or
+    # on a function that is not defined yet, which makes them generic.
+    def generalize(self, t):
+        fixed = []
+        for scheme in list(self.locals.values()) + list(self.globals.values()):
+            if scheme.pending or not scheme.generic:
+                type_variables(scheme.type, fixed)
+            else:
+                for variable in type_variables(scheme.type):
+                    if variable not in scheme.generic and variable not in fixed:
+                        fixed.append(variable)
+        return Scheme([v for v in type_variables(t) if v not in fixed], t)
+
+    #Binds a local name while a body is checked and restores the previous binding after it.
+    def bind(self, name, scheme, body):
+        previous = self.locals.get(name)
+        self.locals[name] = scheme
+        try:
+            return self.visit(body)
+        finally:
+            if previous is None:
+                del self.locals[name]
+            else:
+                self.locals[name] = previous
+
+    #Returns the type of a global name; names that are not defined get a pending type inside function bodies.
+    #Definitions may use a broken function with its last type (see recheck_dependents).
+    def global_type(self, name, message):
+        if name in self.broken and not self.depth:
+            raise Exception(self.broken[name])
+        if self.used is not None:
+            self.used.add(name)
+        scheme = self.globals.get(name)
+        if scheme is None or (scheme.pending and not self.depth):
+            if not self.depth:
+                raise Exception(message)
+            scheme = self.globals[name] = Scheme([], TypeVariable(), pending=True)
+        return self.instantiate(scheme)
+
+    #Dispatches to the appropriate check_* method based on the node type; returns the type of the node.
+    def visit(self, node):
+        method = getattr(self, f'check_{type(node).__name__}', self.generic_check)
+        return method(node)
+
+    #Raises an exception for unsupported node types.
+    def generic_check(self, node):
+        raise Exception(f'No check_{type(node).__name__} method')
+
+    def check_Num(self, node):
+        return INT
+
+    def check_Boolean(self, node):
+        return BOOL
+
+    def check_Identifier(self, node):
+        scheme = self.locals.get(node.value)
+        if scheme is not None:
+            return self.instantiate(scheme)
+        return self.global_type(node.value, f"Variable '{node.value}' is not defined")
+
+    def check_BinOp(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        op = node.op.type
+        symbol = node.op.value
+        if op in EQUALITY_OPERATORS:
+            try:
+                self.unify(left, right)
+            except Mismatch:
+                left_text, right_text = show_types(left, right)
+                raise Exception(f'Type error: {symbol} compares values of the same type, got {left_text} and {right_text}')
+            self.annotations.append((node, left))
+            return BOOL
+        operand = BOOL if op in LOGICAL_OPERATORS else INT
+        self.expect(left, operand, f'the left operand of {symbol}')
+        self.expect(right, operand, f'the right operand of {symbol}')
+        self.annotations.append((node, operand))
+        return INT if op in ARITHMETIC_OPERATORS else BOOL
+
+    def check_UnaryOp(self, node):
+        operand = BOOL if node.op.type == TokenType.NOT else INT
+        self.expect(self.visit(node.expr), operand, f'the operand of {node.op.value}')
+        self.annotations.append((node, operand))
+        return operand
+
+    def check_IfThenElse(self, node):
+        self.expect(self.visit(node.condition), BOOL, 'the condition of if')
+        then_type = self.visit(node.then_body)
+        else_type = self.visit(node.else_body)
+        try:
+            self.unify(then_type, else_type)
+        except Mismatch:
+            then_text, else_text = show_types(then_type, else_type)
+            raise Exception(f'Type error: the branches of if must have the same type, got {then_text} and {else_text}')
+        return then_type
+
+    #The bound value is generic in the body.
+    def check_LetIn(self, node):
+        value = self.visit(node.var_value)
+        return self.bind(node.var_name, self.generalize(value), node.body)
+
+    #Parameters have one type within the body of a function.
+    def check_function(self, params, body):
+        param_types = [TypeVariable() for _ in params]
+        saved = dict(self.locals)
+        for param, param_type in zip(params, param_types):
+            self.locals[param] = Scheme([], param_type)
+        try:
+            return function_type(param_types, self.visit(body))
+        finally:
+            self.locals = saved
+
+    def check_Lambda(self, node):
+        return self.check_function(node.params, node.body)
+
+    #Recursive calls use the type being inferred. The type found then becomes generic, except for what
+    # depends on functions that are not defined yet.
+    #A function defined again can change its type; the definitions using it are then checked again.
+    def check_FunctionDef(self, node):
+        previous = self.globals.get(node.name)
+        scheme = self.infer_definition(node)
+        if previous is not None and previous.pending:
+            self.expect(self.instantiate(scheme), previous.type, f"function '{node.name}'")
+        self.globals[node.name] = scheme
+        if previous is not None and not previous.pending and not is_instance(previous.type, scheme):
+            self.recheck_dependents(node.name)
+        self.check_uses(node.name)
+        return DEFINITION
+
+    #Returns the scheme of a function definition, and records the global names its body uses.
+    def infer_definition(self, node):
+        previous = self.globals.get(node.name)
+        self.globals[node.name] = Scheme([], TypeVariable())
+        self.broken.pop(node.name, None)
+        outer_used = self.used
+        self.used = set()
+        self.depth += 1
+        try:
+            inferred = self.check_function(node.params, node.body)
+            self.unify(self.globals[node.name].type, inferred)
+        except Mismatch:
+            raise Exception(f"Type error: function '{node.name}' has an infinite type")
+        finally:
+            self.depth -= 1
+            used = self.used
+            self.used = outer_used
+            if outer_used is not None:
+                outer_used |= used
+            if previous is None:
+                del self.globals[node.name]
+            else:
+                self.globals[node.name] = previous
+        used.discard(node.name)
+        self.definitions[node.name] = (node, used)
+        return self.generalize(inferred)
+
+    #Checks again the definitions that use a function whose type changed, and those using them in turn.
+    #A definition that no longer type-checks is broken: using it is a type error until it is defined again, or
+    # until what it uses changes so that it type-checks again.
+    def recheck_dependents(self, redefined):
+        changed = [redefined]
+        done = set()
+        while changed:
+            name = changed.pop(0)
+            done.add(name)
+            for dependent, (node, used) in list(self.definitions.items()):
+                if name in used and dependent not in done:
+                    if self.recheck(dependent, node, redefined):
+                        changed.append(dependent)
+
+    #A definition using a broken function is broken too; returns whether it is.
+    def check_uses(self, name):
+        broken = sorted(self.definitions[name][1] & self.broken.keys())
+        if broken:
+            self.broken[name] = f"Type error: function '{name}' uses '{broken[0]}', which no longer type-checks"
+        return bool(broken)
+
+    #Infers the type of a definition again, outside of the scope of the current node; returns whether it
+    # changed, or whether the definition was or became broken.
+    def recheck(self, name, node, cause):
+        previous = self.globals[name]
+        was_broken = name in self.broken
+        trail, annotations = len(self.trail), len(self.annotations)
+        scope = self.locals, self.used, self.depth
+        self.locals, self.used, self.depth = {}, None, 0
+        try:
+            scheme = self.infer_definition(node)
+        except Exception as error:
+            for variable in self.trail[trail:]:
+                variable.instance = None
+            del self.trail[trail:]
+            del self.annotations[annotations:]
+            reason = str(error).removeprefix('Type error: ')
+            self.broken[name] = f"Type error: function '{name}' no longer type-checks since '{cause}' was redefined: {reason}"
+            return True
+        finally:
+            self.locals, self.used, self.depth = scope
+        self.globals[name] = scheme
+        if self.check_uses(name):
+            return True
+        return was_broken or not (is_instance(previous.type, scheme) and is_instance(scheme.type, previous))
+
+    #The arguments must have the types of the parameters; lambdas ignore extra arguments.
+    def check_FunctionCall(self, node):
+        arguments = [self.visit(argument) for argument in node.arguments]
+        if isinstance(node.name, Lambda):
+            function = self.visit(node.name)
+            if len(arguments) < len(node.name.params):
+                raise Exception(f"Expected {len(node.name.params)} arguments, got {len(arguments)}")
+            arguments = arguments[:len(node.name.params)]
+            name = 'the lambda'
+        elif node.name == LIST_FUNCTION:
+            element = TypeVariable()
+            for index, argument in enumerate(arguments):
+                self.expect(argument, element, f'element {index + 1} of the list')
+            return list_type(element)
+        else:
+            function = self.global_type(node.name, f"Function '{node.name}' is not defined")
+            name = 'nth' if node.name == INDEX_FUNCTION else node.name
+            if type(prune(function)) is TypeVariable:
+                # a function that is not defined yet: the call tells its type
+                self.unify(function, function_type([TypeVariable() for _ in arguments], TypeVariable()))
+            if prune(function).name != 'function':
+                raise Exception(f"Type error: '{node.name}' is not a function")
+            params = prune(function).types[:-1]
+            if len(params) != len(arguments):
+                raise Exception(f"Expected {len(params)} arguments, got {len(arguments)}")
+        for index, (argument, param) in enumerate(zip(arguments, prune(function).types)):
+            self.expect(argument, param, f'argument {index + 1} of {name}')
+        return prune(function).types[-1]
+
+
+BUILTIN_NAMES = frozenset(builtin_schemes())
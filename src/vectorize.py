@@ -0,0 +1,284 @@
+from lexer import TokenType, Token, BOOLEAN_TOKENS
+from parser import Num, Boolean, FunctionCall, Lambda
+from interpreter import Function
+
+#NumPy is only needed by this module, so the interpreter runs without it.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Integers are computed in int64 columns; rows whose values leave this range are run one by one instead.
+INT_MIN = -2 ** 63
+INT_MAX = 2 ** 63 - 1
+
+
+#NumPy versions of the comparison operators, keyed by token type.
+COMPARISONS = {} if np is None else {
+    TokenType.EQUAL: np.equal,
+    TokenType.NOT_EQUAL: np.not_equal,
+    TokenType.LESS_THAN: np.less,
+    TokenType.GREATER_THAN: np.greater,
+    TokenType.LESS_THAN_OR_EQUAL: np.less_equal,
+    TokenType.GREATER_THAN_OR_EQUAL: np.greater_equal,
+}
+
+
+#The local variables of one vectorized call: like Frame, but each slot holds a column (a pair of value and
+# is-boolean arrays) instead of a single value. parent is a ColumnFrame, or the Frame a function was defined in.
+class ColumnFrame:
+    __slots__ = ('slots', 'parent')
+
+    def __init__(self, slots, parent):
+        self.slots = slots
+        self.parent = parent
+
+
+#Raised while evaluating a node that cannot be vectorized; the rows that reach it are run one by one.
+class Unsupported(Exception):
+    pass
+
+
+#Evaluates a function of global_env over whole arrays of arguments at once.
+#The body is evaluated column-wise: every value is a column holding one value per row (an int64 array with
+# a mask of the rows whose value is a boolean, since booleans and integers mix like in Python).
+#Operators become array operations, an if evaluates each branch on the rows that take it and a let keeps
+# its column in a frame. Calls of other global functions and of lambdas written in place are evaluated
+# column-wise too, in a frame of columns.
+#Rows that cannot be computed this way are marked failed and run one by one with the interpreter
+# afterwards: integer overflow, division by zero and other errors, and rows that reach constructs that are
+# not vectorized (recursive calls, global variables, lambda values, definitions). The results, and the
+# first error in row order, are therefore the same as calling the function row by row.
+class Vectorizer:
+
+    def __init__(self, interpreter):
+        if np is None:
+            raise Exception('NumPy is required for vectorized evaluation')
+        self.interpreter = interpreter
+        self.calls = []  # names of the global functions being evaluated, to find recursion
+        self.vectorized_rows = 0
+        self.fallback_rows = 0
+
+    #Calls the global function name on every row of the argument arrays and returns the array of results:
+    # int64 if all results are integers, bool if all are booleans, object otherwise.
+    #rows is the number of rows, only needed for functions without parameters.
+    def evaluate(self, name, *arrays, rows=None):
+        function = self.interpreter.global_env.get(name)
+        if function is None:
+            raise Exception(f"Function '{name}' is not defined")
+        if len(function.params) != len(arrays):
+            raise Exception(f"Expected {len(function.params)} arguments, got {len(arrays)}")
+        columns = [self.column(array) for array in arrays]
+        if columns:
+            rows = len(columns[0][0])
+            if any(len(values) != rows for values, bools in columns):
+                raise Exception('All argument arrays must have the same length')
+        elif rows is None:
+            raise Exception('The number of rows is needed for a function without parameters')
+
+        self.calls = [name]
+        try:
+            with np.errstate(all='ignore'):
+                values, bools, failed = self.call(function, columns, rows)
+        except (Unsupported, RecursionError):
+            values, bools, failed = self.unsupported(rows)
+        finally:
+            self.calls = []
+
+        fallback = np.flatnonzero(failed)
+        self.fallback_rows += len(fallback)
+        self.vectorized_rows += rows - len(fallback)
+        if not len(fallback):
+            if bools.all() and rows:
+                return values.astype(bool)
+            if not bools.any():
+                return values
+        return self.combine(name, arrays, values, bools, fallback)
+
+    #Converts an argument array to a column.
+    def column(self, array):
+        array = np.asarray(array)
+        if array.ndim != 1:
+            raise Exception('Argument arrays must be one-dimensional')
+        if array.dtype.kind == 'b':
+            return array.astype(np.int64), np.ones(len(array), dtype=bool)
+        if array.dtype.kind == 'u' and len(array) and array.max() > INT_MAX:
+            raise Exception('Argument values must fit in 64-bit integers')
+        if array.dtype.kind not in 'iu':
+            raise Exception('Argument arrays must hold integers or booleans')
+        return array.astype(np.int64), np.zeros(len(array), dtype=bool)
+
+    #Builds the results of all rows: the vectorized ones from the columns, the failed ones by calling the
+    # function one row at a time.
+    def combine(self, name, arrays, values, bools, fallback):
+        results = np.empty(len(values), dtype=object)
+        results[:] = [bool(value) if is_bool else value for value, is_bool in zip(values.tolist(), bools.tolist())]
+        for row in fallback.tolist():
+            results[row] = self.run_row(name, [array[row] for array in arrays])
+        if all(type(result) is bool for result in results):
+            return results.astype(bool)
+        if all(type(result) is int and INT_MIN <= result <= INT_MAX for result in results):
+            return results.astype(np.int64)
+        return results
+
+    #Calls the function on one row with the interpreter, as a call with literal arguments.
+    def run_row(self, name, args):
+        arguments = []
+        for arg in args:
+            if isinstance(arg, (bool, np.bool_)):
+                arguments.append(Boolean(BOOLEAN_TOKENS[bool(arg)]))
+            else:
+                arguments.append(Num(Token(TokenType.INTEGER, int(arg))))
+        return self.interpreter.interpret(FunctionCall(name, arguments))
+
+    #Returns a column of rows that all fail.
+    def unsupported(self, rows):
+        return np.zeros(rows, dtype=np.int64), np.zeros(rows, dtype=bool), np.ones(rows, dtype=bool)
+
+    #Evaluates the body of a function (or lambda) in a new frame of columns.
+    def call(self, function, columns, rows):
+        if function.body is None:
+            raise Unsupported()
+        slots = [(values, bools) for values, bools in columns] + [None] * (function.nlocals - len(columns))
+        return self.visit(function.body, ColumnFrame(slots, function.env), rows)
+
+    #Dispatches to the appropriate visit_* method based on the node type.
+    #Every method returns (values, bools, failed) for the rows of the frame.
+    def visit(self, node, env, rows):
+        method = getattr(self, f'visit_{type(node).__name__}', self.generic_visit)
+        return method(node, env, rows)
+
+    def generic_visit(self, node, env, rows):
+        return self.unsupported(rows)
+
+    def visit_Num(self, node, env, rows):
+        if not INT_MIN <= node.value <= INT_MAX:
+            return self.unsupported(rows)
+        return np.full(rows, node.value, dtype=np.int64), np.zeros(rows, dtype=bool), np.zeros(rows, dtype=bool)
+
+    def visit_Boolean(self, node, env, rows):
+        return np.full(rows, int(node.value), dtype=np.int64), np.ones(rows, dtype=bool), np.zeros(rows, dtype=bool)
+
+    #Variables of the frames of columns are columns; variables of the frame a function was defined in hold
+    # one value for all rows. Global variables are not vectorized.
+    def visit_Identifier(self, node, env, rows):
+        depth = node.depth
+        if depth is None:
+            return self.unsupported(rows)
+        while depth:
+            env = env.parent
+            depth -= 1
+        value = env.slots[node.slot]
+        if type(env) is ColumnFrame:
+            return value[0], value[1], np.zeros(rows, dtype=bool)
+        if type(value) is bool:
+            return self.visit_Boolean(Boolean(BOOLEAN_TOKENS[value]), env, rows)
+        if type(value) is int:
+            return self.visit_Num(Num(Token(TokenType.INTEGER, value)), env, rows)
+        return self.unsupported(rows)
+
+    def visit_BinOp(self, node, env, rows):
+        left, left_bools, left_failed = self.visit(node.left, env, rows)
+        right, right_bools, right_failed = self.visit(node.right, env, rows)
+        failed = left_failed | right_failed
+        op = node.op.type
+        if op == TokenType.AND or op == TokenType.OR:
+            # like Python's and/or: the result is one of the operands, chosen by the truth of the left one
+            take_right = (left != 0) if op == TokenType.AND else (left == 0)
+            return np.where(take_right, right, left), np.where(take_right, right_bools, left_bools), failed
+        comparison = COMPARISONS.get(op)
+        if comparison is not None:
+            return comparison(left, right).astype(np.int64), np.ones(rows, dtype=bool), failed
+        method = getattr(self, f'binary_{op.name}', None)
+        if method is None:
+            return self.unsupported(rows)
+        values, overflow = method(left, right)
+        return values, np.zeros(rows, dtype=bool), failed | overflow
+
+    def binary_PLUS(self, left, right):
+        values = left + right
+        return values, ((left ^ values) & (right ^ values)) < 0
+
+    def binary_MINUS(self, left, right):
+        values = left - right
+        return values, ((left ^ right) & (left ^ values)) < 0
+
+    #The product overflowed if dividing it by one factor does not give back the other.
+    def binary_MULTIPLY(self, left, right):
+        values = left * right
+        divisor = np.where(left == 0, 1, left)
+        overflow = (left != 0) & (values // divisor != right)
+        overflow |= ((left == -1) & (right == INT_MIN)) | ((right == -1) & (left == INT_MIN))
+        return values, overflow
+
+    #NumPy's floor division and remainder round towards negative infinity, like Python's // and %.
+    #Rows dividing by zero fail (the interpreter reports the error).
+    def binary_DIVIDE(self, left, right):
+        overflow = (right == 0) | ((left == INT_MIN) & (right == -1))
+        return left // np.where(overflow, 1, right), overflow
+
+    def binary_MODULO(self, left, right):
+        zero = right == 0
+        return left % np.where(zero | (right == -1), 1, right), zero
+
+    def visit_UnaryOp(self, node, env, rows):
+        values, bools, failed = self.visit(node.expr, env, rows)
+        op = node.op.type
+        if op == TokenType.NOT:
+            return (values == 0).astype(np.int64), np.ones(rows, dtype=bool), failed
+        if op == TokenType.MINUS:
+            return -values, np.zeros(rows, dtype=bool), failed | (values == INT_MIN)
+        return values, np.zeros(rows, dtype=bool), failed
+
+    #Evaluates each branch only on the rows that take it, then puts the results back in row order.
+    def visit_IfThenElse(self, node, env, rows):
+        condition, bools, failed = self.visit(node.condition, env, rows)
+        taken = condition != 0
+        values = np.zeros(rows, dtype=np.int64)
+        bools = np.zeros(rows, dtype=bool)
+        for branch, mask in ((node.then_body, taken & ~failed), (node.else_body, ~taken & ~failed)):
+            if mask.all():
+                return self.visit(branch, env, rows)
+            if mask.any():
+                branch_values, branch_bools, branch_failed = self.visit(branch, self.restrict(env, mask), int(mask.sum()))
+                values[mask] = branch_values
+                bools[mask] = branch_bools
+                failed[mask] = branch_failed
+        return values, bools, failed
+
+    #Returns a copy of the frames of columns keeping only the rows of a mask.
+    def restrict(self, env, mask):
+        if type(env) is not ColumnFrame:
+            return env
+        slots = [None if slot is None else (slot[0][mask], slot[1][mask]) for slot in env.slots]
+        return ColumnFrame(slots, self.restrict(env.parent, mask))
+
+    def visit_LetIn(self, node, env, rows):
+        values, bools, failed = self.visit(node.var_value, env, rows)
+        env.slots[node.slot] = (values, bools)
+        body_values, body_bools, body_failed = self.visit(node.body, env, rows)
+        return body_values, body_bools, failed | body_failed
+
+    #Arguments are all evaluated, as by the interpreter, before checking the call.
+    #Recursive calls are not vectorized: their rows run one by one.
+    def visit_FunctionCall(self, node, env, rows):
+        arguments = [self.visit(argument, env, rows) for argument in node.arguments]
+        if isinstance(node.name, Lambda):
+            # lambdas ignore extra arguments
+            if len(node.arguments) < len(node.name.params):
+                return self.unsupported(rows)
+            function = Function(None, node.name.params, node.name.body, env, node.name.nlocals)
+            arguments = arguments[:len(node.name.params)]
+        else:
+            function = self.interpreter.global_env.get(node.name)
+            if function is None or len(function.params) != len(arguments) or node.name in self.calls:
+                return self.unsupported(rows)
+        failed = np.zeros(rows, dtype=bool)
+        for values, bools, argument_failed in arguments:
+            failed |= argument_failed
+        self.calls.append(node.name)
+        try:
+            values, bools, call_failed = self.call(function, [(values, bools) for values, bools, _ in arguments], rows)
+        finally:
+            self.calls.pop()
+        return values, bools, failed | call_failed
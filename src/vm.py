@@ -0,0 +1,191 @@
+from bytecode import Compiler, BINARY_FUNCTIONS, UNARY_FUNCTIONS, PACK_BITS, PACK_MASK, \
+    LOAD_CONST, LOAD_LOCAL, LOAD_DEREF, LOAD_GLOBAL, LOAD_FUNCTION, STORE_LOCAL, BINARY_OP, UNARY_OP, \
+    JUMP, JUMP_IF_FALSE, CALL, RETURN, MAKE_CLOSURE, MAKE_FUNCTION, BINARY_OP_CONST, TAIL_CALL
+from interpreter import Function, Frame, call_arguments
+from lists import find_builtin
+from governor import Governor
+
+#Default maximum number of calls in progress on the call stack of one run.
+DEFAULT_CALL_LIMIT = 1_000_000
+
+
+#A stack-based virtual machine that runs the code objects produced by bytecode.Compiler.
+#Calls do not recurse in Python: the VM keeps its own call stack, so one loop runs the whole program.
+#That stack lives on the heap, so its size is bounded by call_limit instead of sys.getrecursionlimit().
+#Tail calls replace the current entry of that call stack, so tail-recursive functions run in constant space.
+#It has the same interface as Interpreter and can be used in its place.
+class VirtualMachine:
+
+    #Initializes the virtual machine with an empty global environment.
+    def __init__(self, call_limit=DEFAULT_CALL_LIMIT):
+        self.global_env = {}
+        self.compiler = Compiler()
+        self.call_limit = call_limit
+        self.optimizer = None  # optional optimizer.Optimizer applied to each tree before it runs
+        self.inliner = None  # optional optimizer.Inliner applied after the optimizer
+        self.typechecker = None  # optional typechecker.TypeChecker run on each tree before it runs
+        self.governor = None  # optional governor.Governor limiting the resources of each command
+
+    #Limits the resources of each command like Interpreter.enable_limits; a step is a call or a tail call.
+    def enable_limits(self, fuel=None, time_limit=None, depth=None, cells=None):
+        self.governor = Governor(fuel, time_limit, depth, cells)
+
+    def disable_limits(self):
+        self.governor = None
+
+    #Returns the resources used by the last command (see Governor.usage), or None if limits are off.
+    def limit_stats(self):
+        return self.governor.usage() if self.governor is not None else None
+
+    #Stores a function in the global environment and rebuilds the functions that inlined its old definition.
+    def define_function(self, function):
+        self.global_env[function.name] = function
+        if self.inliner is not None:
+            self.inliner.invalidate(function)
+
+    #The main entry point for interpretation: compiles the tree and runs it, within the limits of the
+    # governor if there is one.
+    def interpret(self, tree):
+        if self.governor is not None:
+            return self.governor.run(self.run, self.compiler.compile(tree))
+        return self.run(self.compiler.compile(tree))
+
+    #Calls a function value given to a built-in function, such as the function passed to map.
+    def apply_function(self, function, args):
+        args = call_arguments(function, args)
+        callee = function.code
+        if callee.nlocals > len(args):
+            args = args + [None] * (callee.nlocals - len(args))
+        governor = self.governor
+        if governor is None:
+            return self.run(callee, Frame(args, function.env))
+        governor.enter()
+        try:
+            governor.step()
+            return self.run(callee, Frame(args, function.env))
+        finally:
+            governor.leave()
+
+    #Runs a code object and returns the value it leaves on the stack: a top-level command in a fresh frame,
+    # or a function body in the frame given.
+    def run(self, code_object, frame=None):
+        global_env = self.global_env
+        governor = self.governor
+        call_limit = self.call_limit
+        binary_functions = BINARY_FUNCTIONS
+        unary_functions = UNARY_FUNCTIONS
+
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        calls = []
+        if frame is None:
+            frame = Frame([None] * code_object.nlocals, None)
+        slots = frame.slots
+        code = code_object.code
+        consts = code_object.consts
+        names = code_object.names
+        ip = 0
+
+        while True:
+            op = code[ip]
+            arg = code[ip + 1]
+            ip += 2
+
+            if op == LOAD_LOCAL:
+                push(slots[arg])
+            elif op == LOAD_CONST:
+                push(consts[arg])
+            elif op == BINARY_OP_CONST:
+                stack[-1] = binary_functions[arg >> PACK_BITS](stack[-1], consts[arg & PACK_MASK])
+            elif op == BINARY_OP:
+                right = pop()
+                stack[-1] = binary_functions[arg](stack[-1], right)
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    ip = arg
+            elif op == JUMP:
+                ip = arg
+            elif op == LOAD_FUNCTION:
+                name = names[arg >> PACK_BITS]
+                function = global_env.get(name)
+                arg_count = arg & PACK_MASK
+                if function is None:
+                    function = find_builtin(name, arg_count)
+                elif len(function.params) != arg_count:
+                    raise Exception(f"Expected {len(function.params)} arguments, got {arg_count}")
+                push(function)
+            elif op == CALL or op == TAIL_CALL:
+                if arg:
+                    args = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    args = []
+                function = pop()
+                callee = function.code
+                if callee is None:
+                    # built-in functions have no code and run right away
+                    if governor is None:
+                        push(function.run(self, args))
+                    else:
+                        # the calls the built-in makes nest below the calls in progress here
+                        governor.depth += len(calls)
+                        try:
+                            push(function.run(self, args))
+                        finally:
+                            governor.depth -= len(calls)
+                    continue
+                # Lambdas ignore extra arguments, like in the tree-walker
+                if arg != len(callee.params):
+                    if arg < len(callee.params):
+                        raise Exception(f"Expected {len(callee.params)} arguments, got {arg}")
+                    del args[len(callee.params):]
+                if callee.nlocals > len(args):
+                    args.extend([None] * (callee.nlocals - len(args)))
+                if governor is not None:
+                    governor.step()
+                    if op == CALL:
+                        # the calls in progress in this run are kept by calls, not by the governor
+                        governor.reach(governor.depth + len(calls) + 1)
+                if op == CALL:
+                    if len(calls) >= call_limit:
+                        raise Exception(f'Call stack limit of {call_limit} calls exceeded')
+                    calls.append((code, consts, names, ip, frame))
+                frame = Frame(args, function.env)
+                slots = args
+                code = callee.code
+                consts = callee.consts
+                names = callee.names
+                ip = 0
+            elif op == RETURN:
+                if not calls:
+                    return pop()
+                code, consts, names, ip, frame = calls.pop()
+                slots = frame.slots
+            elif op == STORE_LOCAL:
+                slots[arg] = pop()
+            elif op == LOAD_DEREF:
+                target = frame
+                for _ in range(arg >> PACK_BITS):
+                    target = target.parent
+                push(target.slots[arg & PACK_MASK])
+            elif op == LOAD_GLOBAL:
+                name = names[arg]
+                if name not in global_env:
+                    raise Exception(f"Variable '{name}' is not defined")
+                push(global_env[name])
+            elif op == UNARY_OP:
+                stack[-1] = unary_functions[arg](stack[-1])
+            elif op == MAKE_CLOSURE:
+                callee = consts[arg]
+                function = Function(None, callee.params, callee.body, frame, callee.nlocals)
+                function.code = callee
+                push(function)
+            elif op == MAKE_FUNCTION:
+                callee = consts[arg]
+                function = Function(callee.name, callee.params, callee.body, frame, callee.nlocals)
+                function.code = callee
+                self.define_function(function)
+                push(f"Function '{callee.name}' defined")
+            else:
+                raise Exception(f'Unknown opcode {op}')